@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import re
 
 from app.models.agent_types import ProcessedInput, IntentResult
@@ -110,6 +110,97 @@ def _match_score(text: str, phrases: List[str]) -> int:
     return score
 
 
+class PhraseMatcher:
+    """
+    Keyword table compiled into a word trie.
+
+    A phrase matches when its words appear consecutively in the lower-cased
+    text split on spaces, the rule of _match_score (" phrase " in " text ").
+    One pass over the message finds the phrases of every intent, so the cost
+    follows the message length and the longest phrase, not the table size.
+    """
+
+    def __init__(self, table: Dict[str, List[str]]):
+        self.intents = list(table)
+        self.max_words = 1
+        # word -> child node; the None key holds (phrase, [(intent, weight), ...])
+        self._root: Dict = {}
+        for intent, phrases in table.items():
+            for phrase in phrases:
+                words = phrase.split(" ")
+                node = self._root
+                for word in words:
+                    node = node.setdefault(word, {})
+                node.setdefault(None, (phrase, []))[1].append((intent, 2 if len(phrase.split()) > 1 else 1))
+                self.max_words = max(self.max_words, len(words))
+        self._zero_scores = dict.fromkeys(self.intents, 0)
+
+    def matches(self, text: str) -> Dict[str, List[Tuple[str, int]]]:
+        """Phrases found in the text -> (intent, weight) of each table entry"""
+        words = text.lower().split(" ")
+        found = {}
+        for start in range(len(words)):
+            node = self._root
+            for word in words[start:start + self.max_words]:
+                node = node.get(word)
+                if node is None:
+                    break
+                if None in node:
+                    phrase, hits = node[None]
+                    found[phrase] = hits
+        return found
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """_match_score of every intent (table order, zero when nothing matched)"""
+        scores = self._zero_scores.copy()
+        for hits in self.matches(text).values():
+            for intent, weight in hits:
+                scores[intent] += weight
+        return scores
+
+
+# Compiled once at import; rebuild the matcher after changing a table
+VI_MATCHER = PhraseMatcher(VI_KEYWORDS)
+EN_MATCHER = PhraseMatcher(EN_KEYWORDS)
+
+_PRICE_VALUE = r"(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)"
+_PRICE_RANGE = re.compile(rf"từ\s+{_PRICE_VALUE}\s+(đến|tới|-)\s+{_PRICE_VALUE}")
+_PRICE_OVER = re.compile(rf"(trên|lớn hơn|cao hơn|>)\s+{_PRICE_VALUE}")
+_PRICE_UNDER = re.compile(rf"(dưới|nhỏ hơn|thấp hơn|<)\s+{_PRICE_VALUE}")
+_PRICE_CLAUSE = re.compile("|".join(p.pattern for p in (_PRICE_RANGE, _PRICE_UNDER, _PRICE_OVER)), re.IGNORECASE)
+
+# Context references ("cái này", "sản phẩm đầu tiên", "nó") in classification...
+_CONTEXT_REFERENCE = re.compile(
+    r"\b(cái|sản phẩm|sp)\s+(này|kia|đó|ấy|vừa|trước)|\b(đầu tiên|thứ nhất|thứ hai|thứ ba|cuối cùng)|\bnó\b"
+)
+# ...and in query extraction, where a bare "chi tiết" also needs the context
+_QUERY_CONTEXT_REFERENCE = re.compile(
+    r"\b(cái|sản phẩm|sp)\s+(này|kia|đó|ấy|vừa|trước)|\b(đầu tiên|thứ nhất|thứ hai|cuối cùng)|\bnó\b"
+    r"|\bchi tiết\b.*(?!\w+)"  # "chi tiết" without specific product name
+)
+_RECOMMEND_BOOST = re.compile("gợi ý cho|đề xuất cho|recommend me|gợi ý vài|gợi ý một|nên mua gì")
+_COMPOUND = re.compile(r"\b(và|rồi|sau đó)\b")
+
+# Common Vietnamese/English query anchors removed from product queries
+QUERY_STOP_PHRASES = [
+    "tìm", "tìm kiếm", "có không", "còn không", "có bán", "muốn mua",
+    "search", "find", "looking for", "do you have", "want to buy",
+    "sản phẩm", "product", "mua", "đặt", "kiếm", "cho tôi", "cho anh", "cho em", "cho mình",
+    "tương tự", "similar",
+    "tôi", "anh", "em", "bạn", "mình", "cái", "chiếc", "là", "của",
+    "giá", "bao nhiêu", "price", "cost", "how much", "tiền",
+    "thông tin", "xem", "về", "info", "about", "có",
+    # Staff keywords
+    "check kho", "tồn kho", "kiểm kho", "số lượng tồn",
+    "check stock", "inventory", "stock level",
+    "tìm khách", "check info khách", "thông tin khách", "khách hàng", "khách",
+    "lookup customer", "find customer", "user info",
+    "nhân viên", "quản lý", "staff", "manager"
+]
+# Whole words only ("anh" is not removed from "xanh"); earlier phrases win
+_QUERY_STOP = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(p) for p in QUERY_STOP_PHRASES) + r")(?!\w)")
+
+
 def _parse_price_value(val_str: str) -> int:
     val_str = val_str.lower().replace(",", "").replace(".", "")
     multiplier = 1
@@ -132,7 +223,7 @@ def _parse_price_value(val_str: str) -> int:
 def _extract_price_condition(text: str) -> dict | None:
     text = text.lower()
     # Range: từ X đến Y
-    range_match = re.search(r"từ\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)\s+(đến|tới|-)\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)", text)
+    range_match = _PRICE_RANGE.search(text)
     if range_match:
         min_val = _parse_price_value(range_match.group(1))
         max_val = _parse_price_value(range_match.group(3))
@@ -143,12 +234,12 @@ def _extract_price_condition(text: str) -> dict | None:
     max_val = None
 
     # Over: trên X, lớn hơn X, cao hơn X, > X
-    over_match = re.search(r"(trên|lớn hơn|cao hơn|>)\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)", text)
+    over_match = _PRICE_OVER.search(text)
     if over_match:
         min_val = _parse_price_value(over_match.group(2))
 
     # Under: dưới X, nhỏ hơn X, thấp hơn X, < X
-    under_match = re.search(r"(dưới|nhỏ hơn|thấp hơn|<)\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)", text)
+    under_match = _PRICE_UNDER.search(text)
     if under_match:
         max_val = _parse_price_value(under_match.group(2))
         
@@ -166,52 +257,20 @@ def _extract_product_query(cleaned_text: str) -> str:
     s = cleaned_text
     
     # Check if this is a context reference (not a search query)
-    context_patterns = [
-        r"\b(cái|sản phẩm|sp)\s+(này|kia|đó|ấy|vừa|trước)",
-        r"\b(đầu tiên|thứ nhất|thứ hai|cuối cùng)",
-        r"\bnó\b",
-        r"\bchi tiết\b.*(?!\w+)",  # "chi tiết" without specific product name
-    ]
-    for pattern in context_patterns:
-        if re.search(pattern, s.lower()):
-            return ""  # Return empty to signal this needs context
+    if _QUERY_CONTEXT_REFERENCE.search(s.lower()):
+        return ""  # Return empty to signal this needs context
     
     s = re.sub(r"[?,.]", " ", s) # Remove punctuation
     
     # Clean up compound sentences (e.g. "tìm X và thêm vào giỏ")
     # Stop at "và", "rồi", "sau đó" if followed by action verbs
-    compound_split = re.split(r'\b(và|rồi|sau đó)\b', s.lower())
+    compound_split = _COMPOUND.split(s.lower())
     if len(compound_split) > 1:
         s = compound_split[0] # Take the first part as the query
 
-    # Remove price conditions from query
-    price_patterns = [
-        r"từ\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)\s+(đến|tới|-)\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)",
-        r"(dưới|nhỏ hơn|thấp hơn|<)\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)",
-        r"(trên|lớn hơn|cao hơn|>)\s+(\d+[.,\d]*\s*(?:k|tr|triệu|nghìn|m)?)"
-    ]
-    for p in price_patterns:
-        s = re.sub(p, " ", s, flags=re.IGNORECASE)
-
-    # remove common Vietnamese/English query anchors
-    remove = [
-        "tìm", "tìm kiếm", "có không", "còn không", "có bán", "muốn mua",
-        "search", "find", "looking for", "do you have", "want to buy",
-        "sản phẩm", "product", "mua", "đặt", "kiếm", "cho tôi", "cho anh", "cho em", "cho mình",
-        "tương tự", "similar",
-        "tôi", "anh", "em", "bạn", "mình", "cái", "chiếc", "là", "của",
-        "giá", "bao nhiêu", "price", "cost", "how much", "tiền",
-        "thông tin", "xem", "về", "info", "about", "có",
-        # Staff keywords
-        "check kho", "tồn kho", "kiểm kho", "số lượng tồn",
-        "check stock", "inventory", "stock level",
-        "tìm khách", "check info khách", "thông tin khách", "khách hàng", "khách",
-        "lookup customer", "find customer", "user info",
-        "nhân viên", "quản lý", "staff", "manager"
-    ]
-    low = s.lower()
-    for r in remove:
-        low = low.replace(r, " ")
+    # Remove price conditions and query anchors from query
+    low = _PRICE_CLAUSE.sub(" ", s).lower()
+    low = _QUERY_STOP.sub(" ", low)
     low = re.sub(r"\s+", " ", low).strip()
     return low
 
@@ -222,40 +281,30 @@ class IntentClassifier:
         text = processed.cleaned_text
         lang = processed.language or "vi"
 
-        # Choose keyword table
-        table = VI_KEYWORDS if lang == "vi" else EN_KEYWORDS
+        low = text.lower()
 
-        # Compute scores
-        scores: Dict[str, int] = {}
-        for key, phrases in table.items():
-            scores[key] = _match_score(text, phrases)
+        # Compute scores (one pass of the compiled keyword table)
+        matcher = VI_MATCHER if lang == "vi" else EN_MATCHER
+        scores: Dict[str, int] = matcher.scores(text)
         
         # Boost PRODUCT.RECOMMEND score if recommend phrases are detected
         # This prevents "gợi ý sản phẩm" from being classified as product_inquiry
-        recommend_boost_phrases = ["gợi ý cho", "đề xuất cho", "recommend me", "gợi ý vài", "gợi ý một", "nên mua gì"]
-        if any(phrase in text.lower() for phrase in recommend_boost_phrases):
+        if _RECOMMEND_BOOST.search(low):
             if "PRODUCT.RECOMMEND" in scores:
                 scores["PRODUCT.RECOMMEND"] += 5  # Strong boost to override PRODUCT.SEARCH
         
         # Boost PRODUCT.DETAIL for context reference patterns (e.g., "sản phẩm đầu tiên", "cái này")
-        context_patterns = [
-            r'\b(cái|sản phẩm|sp)\s+(này|kia|đó|ấy|vừa|trước)',
-            r'\b(đầu tiên|thứ nhất|thứ hai|thứ ba|cuối cùng)',
-            r'\bnó\b',
-        ]
-        for pattern in context_patterns:
-            if re.search(pattern, text.lower()):
-                if "PRODUCT.DETAIL" in scores:
-                    scores["PRODUCT.DETAIL"] += 10  # Very strong boost to override PRODUCT.SEARCH
-                break
+        if _CONTEXT_REFERENCE.search(low):
+            if "PRODUCT.DETAIL" in scores:
+                scores["PRODUCT.DETAIL"] += 10  # Very strong boost to override PRODUCT.SEARCH
 
         # Boost PRODUCT.SEARCH if "tìm" is explicitly used at start
-        if text.lower().strip().startswith("tìm") or "tìm cho" in text.lower():
+        if low.strip().startswith("tìm") or "tìm cho" in low:
              if "PRODUCT.SEARCH" in scores:
                  scores["PRODUCT.SEARCH"] += 3
 
         # Boost CART.ADD if "thêm" or "mua" is present, to differentiate from CART.VIEW
-        if "thêm" in text.lower() or "mua" in text.lower():
+        if "thêm" in low or "mua" in low:
             if "CART.ADD" in scores:
                 scores["CART.ADD"] += 2
 
@@ -105,6 +105,7 @@ class Orchestrator:
             if intent.entities.get("product_query"):
                 return ActionPlan(
                     tools=["product.search", "cart.add"], 
+                    depends_on={"cart.add": ["product.search"]},  # adds the variant found by the search
                     next_step="confirm_add_to_cart"
                 ), None
 
@@ -6,7 +6,6 @@ import asyncpg
 from datetime import datetime
 import time
 import re
-import httpx
 
 # Import config and models
 from app.config import (
@@ -43,6 +42,9 @@ from app.models import (
 from app.services.context_manager import ContextManager, ContextState, ContextNode
 from app.services.queue_service import queue_service
 from app.services.medusa_client import MedusaClient
+from app.services.http_client import http_clients
+from app.services.catalog_cache import catalog_cache
+from app.services.product_index import product_index
 from app.logging_config import setup_logging, get_agent_logger, log_agent_execution
 
 # Setup logging
@@ -95,22 +97,29 @@ async def get_db_pool():
 @app.on_event("startup")
 async def startup():
     await get_db_pool()
+    http_clients.get(MEDUSA_URL)
+    product_index.start(MedusaClient())
 
 
 @app.on_event("shutdown")
 async def shutdown():
     global db_pool
+    await product_index.stop()
     if db_pool:
         await db_pool.close()
     await queue_service.close()
+    await http_clients.close()
+    await catalog_cache.close()
 
 
 # --- Helper Functions ---
 async def search_products(query: str, limit: int = 5) -> List[MedusaProduct]:
-    """Search products from Medusa API through MedusaClient"""
+    """Search products in the local index, or the Medusa API until it is synced"""
     client = MedusaClient()
     try:
-        raw_products = await client.search_products(query, limit=limit)
+        raw_products = product_index.search(query, limit)
+        if raw_products is None:
+            raw_products = await client.search_products(query, limit=limit)
         if not isinstance(raw_products, list):
             return []
         # Convert to MedusaProduct so product_to_info can read attributes
@@ -151,19 +160,19 @@ def extract_search_keywords(message: str) -> Optional[str]:
 
 async def get_order_status(order_id: str, email: str) -> dict:
     """Get order status from Medusa API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{MEDUSA_URL}/store/orders",
-                params={"display_id": order_id, "email": email}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                orders = data.get("orders", [])
-                if orders:
-                    return orders[0]
-        except Exception as e:
-            print(f"Error fetching order: {e}")
+    client = http_clients.get(MEDUSA_URL)
+    try:
+        response = await client.get(
+            "/store/orders",
+            params={"display_id": order_id, "email": email}
+        )
+        if response.status_code == 200:
+            data = response.json()
+            orders = data.get("orders", [])
+            if orders:
+                return orders[0]
+    except Exception as e:
+        print(f"Error fetching order: {e}")
     return {}
 
 
@@ -707,6 +716,25 @@ async def get_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/admin/cache/stats")
+async def get_cache_stats():
+    """Medusa catalog cache entries and hit ratios per namespace"""
+    return catalog_cache.stats()
+
+
+@app.get("/admin/search-index/stats")
+async def get_search_index_stats():
+    """Local product search index size and sync state"""
+    return product_index.stats()
+
+
+@app.post("/admin/cache/clear")
+async def clear_cache(namespace: Optional[str] = None):
+    """Drop cached catalog entries of this process (one namespace or all)"""
+    catalog_cache.invalidate(namespace)
+    return {"status": "cleared", "namespace": namespace}
+
+
 @app.patch("/admin/sessions/{session_id}/status")
 async def update_session_status(session_id: str, status: str):
     """Update session status (active, closed, archived)"""
@@ -28,6 +28,8 @@ class IntentResult(BaseModel):
 
 class ActionPlan(BaseModel):
     tools: List[str] = Field(default_factory=list)
+    # tool -> planned tools whose output it needs; tools without one run concurrently
+    depends_on: Dict[str, List[str]] = Field(default_factory=dict)
     required_data: List[str] = Field(default_factory=list)
     next_step: Optional[str] = None
     escalate: bool = False
@@ -38,3 +40,4 @@ class ToolResults(BaseModel):
     data: Any = None
     errors: List[str] = Field(default_factory=list)
     timings_ms: Dict[str, int] = Field(default_factory=dict)
+    by_tool: Dict[str, "ToolResults"] = Field(default_factory=dict)  # per-tool results of a plan
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.config import (
+    REDIS_URL,
+    CATALOG_CACHE_MAX_ENTRIES,
+    CATALOG_CACHE_REDIS,
+    CATALOG_CACHE_REDIS_TIMEOUT,
+    CATALOG_CACHE_REDIS_RETRY,
+)
+from app.logging_config import get_agent_logger
+
+logger = get_agent_logger("catalog_cache")
+
+REDIS_PREFIX = "chatbot:catalog:"
+
+
+class CacheBypass(Exception):
+    """Raised by a loader to return `result` without caching it (e.g. Medusa errors)"""
+
+    def __init__(self, result: Any):
+        super().__init__("uncacheable result")
+        self.result = result
+
+
+def normalize_query(query: Optional[str]) -> str:
+    """Cache key form of a search query: NFC, lower case, collapsed whitespace"""
+    return " ".join(unicodedata.normalize("NFC", query or "").lower().split())
+
+
+class CatalogCache:
+    """
+    Read-through cache for Medusa catalog calls.
+
+    Two tiers: an in-process TTL LRU, and optionally Redis (CATALOG_CACHE_REDIS)
+    so chatbot replicas share entries. Misses are loaded once: concurrent
+    requests for the same key wait for the load in flight, which runs as its
+    own task so a cancelled caller does not cancel it for the others. Empty
+    results (unknown product, search without hits) are cached with a short
+    negative TTL. Entries with a stale window are served after their TTL
+    while one background load refreshes them.
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = CATALOG_CACHE_MAX_ENTRIES, use_redis: bool = CATALOG_CACHE_REDIS):
+        self.max_entries = max_entries
+        # key -> (value, fresh_until, expires_at)
+        self._local: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._redis = redis.from_url(REDIS_URL, socket_timeout=CATALOG_CACHE_REDIS_TIMEOUT,
+                                     socket_connect_timeout=CATALOG_CACHE_REDIS_TIMEOUT) if use_redis else None
+        self._redis_down_until = 0.0
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def get_or_load(self, namespace: str, key: str, loader: Callable[[], Awaitable[Any]],
+                          ttl: float, negative_ttl: float = 0, stale_ttl: float = 0) -> Any:
+        """Cached value of namespace/key, calling `loader` on a miss"""
+        full_key = f"{namespace}:{key}"
+        stats = self._stats[namespace]
+        now = time.monotonic()
+
+        entry = self._local.get(full_key)
+        if entry is not None:
+            value, fresh_until, expires_at = entry
+            if now < expires_at:
+                self._local.move_to_end(full_key)
+                stats["hits"] += 1
+                if now >= fresh_until and full_key not in self._inflight:
+                    # Background reload; the stale value stays until it expires
+                    stats["refreshes"] += 1
+                    self._start_load(full_key, loader, ttl, negative_ttl, stale_ttl, refresh=True)
+                return value
+            del self._local[full_key]
+
+        inflight = self._inflight.get(full_key)
+        if inflight is not None:
+            stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        found, value = await self._redis_get(full_key, stale_ttl)
+        if found:
+            stats["hits"] += 1
+            stats["redis_hits"] += 1
+            return value
+
+        stats["misses"] += 1
+        return await asyncio.shield(self._start_load(full_key, loader, ttl, negative_ttl, stale_ttl))
+
+    def _start_load(self, full_key: str, loader, ttl: float, negative_ttl: float, stale_ttl: float,
+                    refresh: bool = False) -> asyncio.Task:
+        task = asyncio.ensure_future(self._load(full_key, loader, ttl, negative_ttl, stale_ttl))
+        self._inflight[full_key] = task
+        task.add_done_callback(lambda t: self._finish(full_key, t, refresh))
+        return task
+
+    def _finish(self, full_key: str, task: asyncio.Task, refresh: bool):
+        if self._inflight.get(full_key) is task:
+            del self._inflight[full_key]
+        # Waiters re-raise the error; retrieving it keeps the loop from logging it as never retrieved
+        error = None if task.cancelled() else task.exception()
+        if error is not None and refresh:
+            logger.warning(f"Catalog cache refresh of {full_key} failed: {error}")
+
+    async def _load(self, full_key: str, loader, ttl: float, negative_ttl: float, stale_ttl: float) -> Any:
+        try:
+            value = await loader()
+        except CacheBypass as e:
+            return e.result
+        entry_ttl = ttl if value else negative_ttl
+        if entry_ttl > 0:
+            if not value:
+                self._stats[full_key.split(":", 1)[0]]["negative"] += 1
+            self._put(full_key, value, entry_ttl, stale_ttl if value else 0)
+            await self._redis_set(full_key, value, entry_ttl, stale_ttl if value else 0)
+        return value
+
+    def _put(self, full_key: str, value: Any, ttl: float, stale_ttl: float):
+        now = time.monotonic()
+        self._local[full_key] = (value, now + ttl, now + ttl + stale_ttl)
+        self._local.move_to_end(full_key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def _redis_get(self, full_key: str, stale_ttl: float) -> Tuple[bool, Any]:
+        if not self._redis_available():
+            return False, None
+        try:
+            raw = await self._redis.get(REDIS_PREFIX + full_key)
+        except Exception as e:
+            self._redis_failed(e)
+            return False, None
+        if raw is None:
+            return False, None
+        payload = json.loads(raw)
+        # Copy into the local tier for the rest of the remaining freshness
+        remaining = payload["fresh_until"] - time.time()
+        if remaining <= 0:
+            return False, None
+        self._put(full_key, payload["value"], remaining, stale_ttl)
+        return True, payload["value"]
+
+    async def _redis_set(self, full_key: str, value: Any, ttl: float, stale_ttl: float):
+        if not self._redis_available():
+            return
+        payload = json.dumps({"value": value, "fresh_until": time.time() + ttl})
+        try:
+            await self._redis.set(REDIS_PREFIX + full_key, payload, px=int((ttl + stale_ttl) * 1000))
+        except Exception as e:
+            self._redis_failed(e)
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, error: Exception):
+        self._redis_down_until = time.monotonic() + CATALOG_CACHE_REDIS_RETRY
+        logger.warning(f"Catalog cache Redis unavailable, local only for {CATALOG_CACHE_REDIS_RETRY}s: {error}")
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """Drop local entries (of one namespace, or all)"""
+        if namespace is None:
+            self._local.clear()
+            return
+        for full_key in [k for k in self._local if k.startswith(f"{namespace}:")]:
+            del self._local[full_key]
+
+    def stats(self) -> dict:
+        namespaces = {}
+        for namespace, counts in self._stats.items():
+            lookups = counts["hits"] + counts["misses"] + counts["coalesced"]
+            namespaces[namespace] = {
+                **counts,
+                "hit_ratio": round((counts["hits"] + counts["coalesced"]) / lookups, 3) if lookups else None,
+            }
+        return {
+            "entries": len(self._local),
+            "max_entries": self.max_entries,
+            "redis": self._redis is not None,
+            "redis_available": self._redis_available(),
+            "namespaces": namespaces,
+        }
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+
+
+# Global instance
+catalog_cache = CatalogCache()
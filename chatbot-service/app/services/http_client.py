@@ -0,0 +1,87 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app.config import (
+    MEDUSA_HTTP2,
+    MEDUSA_MAX_CONNECTIONS,
+    MEDUSA_MAX_KEEPALIVE,
+    MEDUSA_KEEPALIVE_EXPIRY,
+    MEDUSA_CONNECT_TIMEOUT,
+    MEDUSA_TIMEOUT,
+    MEDUSA_ENDPOINT_TIMEOUTS,
+)
+from app.logging_config import get_agent_logger
+
+logger = get_agent_logger("http_client")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpClientManager:
+    """
+    Process-wide owner of one long-lived httpx.AsyncClient per base URL.
+
+    Connections are kept alive and reused across requests (and across the
+    MedusaClient instances every tool creates), so a call only pays TCP/TLS
+    setup when the pool has no idle connection. A client is bound to the
+    event loop it was created on; a different running loop (scripts, tests
+    calling asyncio.run repeatedly) gets a fresh client.
+    """
+
+    def __init__(self, http2: bool = MEDUSA_HTTP2):
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.warning("MEDUSA_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+
+    def get(self, base_url: str) -> httpx.AsyncClient:
+        """Shared client for base_url (created on first use)"""
+        base_url = base_url.rstrip('/')
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(base_url)
+        if entry is None or entry[0].is_closed or entry[1] is not loop:
+            entry = (self._create(base_url), loop)
+            self._clients[base_url] = entry
+        return entry[0]
+
+    def _create(self, base_url: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=MEDUSA_MAX_CONNECTIONS,
+                max_keepalive_connections=MEDUSA_MAX_KEEPALIVE,
+                keepalive_expiry=MEDUSA_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(MEDUSA_TIMEOUT, connect=MEDUSA_CONNECT_TIMEOUT),
+        )
+
+    async def close(self):
+        """Close every client (FastAPI shutdown)"""
+        clients, self._clients = self._clients, {}
+        loop = asyncio.get_running_loop()
+        for client, client_loop in clients.values():
+            if client_loop is loop:
+                await client.aclose()
+
+
+def endpoint_timeout(path: str) -> httpx.Timeout:
+    """Timeout for a request path: longest prefix in MEDUSA_ENDPOINT_TIMEOUTS, else MEDUSA_TIMEOUT"""
+    read: Optional[float] = None
+    matched = -1
+    for prefix, seconds in MEDUSA_ENDPOINT_TIMEOUTS.items():
+        if path.startswith(prefix) and len(prefix) > matched:
+            read, matched = seconds, len(prefix)
+    return httpx.Timeout(read if read is not None else MEDUSA_TIMEOUT, connect=MEDUSA_CONNECT_TIMEOUT)
+
+
+# Global instance
+http_clients = HttpClientManager()
@@ -1,10 +1,27 @@
 import httpx
-from typing import Optional, Dict, Any, List
-from app.config import MEDUSA_BACKEND_URL, MEDUSA_PUBLISHABLE_KEY, MEDUSA_ADMIN_TOKEN
+from typing import Optional, Dict, Any, List, Tuple
+from app.config import (
+    MEDUSA_BACKEND_URL, MEDUSA_PUBLISHABLE_KEY, MEDUSA_ADMIN_TOKEN,
+    CATALOG_PRODUCT_TTL, CATALOG_SEARCH_TTL, CATALOG_REGION_TTL, CATALOG_REGION_STALE, CATALOG_NEGATIVE_TTL,
+)
+from app.services.http_client import http_clients, endpoint_timeout
+from app.services.catalog_cache import catalog_cache, normalize_query, CacheBypass
+
+# Catalog cache namespace -> (ttl, stale window served while refreshing)
+CATALOG_TTLS = {
+    "product": (CATALOG_PRODUCT_TTL, 0),
+    "search": (CATALOG_SEARCH_TTL, 0),
+    "regions": (CATALOG_REGION_TTL, CATALOG_REGION_STALE),
+    "collections": (CATALOG_REGION_TTL, CATALOG_REGION_STALE),
+}
 
 class MedusaClient:
     """
     Client for interacting with the Medusa Store API.
+    Requests go through the process-wide pooled client of the base URL,
+    so instances are cheap and connections are reused between them.
+    Catalog reads (products, searches, regions, collections) are served from
+    the catalog cache; returned catalog data must not be modified.
     """
     def __init__(self, base_url: str = MEDUSA_BACKEND_URL, api_key: Optional[str] = MEDUSA_PUBLISHABLE_KEY, admin_token: str = MEDUSA_ADMIN_TOKEN):
         self.base_url = base_url.rstrip('/')
@@ -15,65 +32,87 @@ class MedusaClient:
             self.headers["x-publishable-api-key"] = api_key
         self.admin_token = admin_token
 
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return http_clients.get(self.base_url)
+
     async def _get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Internal method to perform GET requests to Store API.
         """
-        url = f"{self.base_url}{endpoint}"
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url, headers=self.headers, params=params, timeout=10.0)
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP error occurred: {e}")
-                return {"error": str(e), "status_code": e.response.status_code}
-            except httpx.RequestError as e:
-                print(f"Request error occurred: {e}")
-                return {"error": str(e)}
+        try:
+            response = await self.http.get(endpoint, headers=self.headers, params=params,
+                                           timeout=endpoint_timeout(endpoint))
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            print(f"HTTP error occurred: {e}")
+            return {"error": str(e), "status_code": e.response.status_code}
+        except httpx.RequestError as e:
+            print(f"Request error occurred: {e}")
+            return {"error": str(e)}
 
     async def _get_admin(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Internal method to perform GET requests to Admin API.
         """
-        url = f"{self.base_url}/admin{endpoint}"
+        path = f"/admin{endpoint}"
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.admin_token}"
         }
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url, headers=headers, params=params, timeout=10.0)
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"Admin HTTP error: {e}")
-                return {"error": str(e), "status_code": e.response.status_code}
-            except httpx.RequestError as e:
-                print(f"Admin Request error: {e}")
-                return {"error": str(e)}
+        try:
+            response = await self.http.get(path, headers=headers, params=params,
+                                           timeout=endpoint_timeout(path))
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            print(f"Admin HTTP error: {e}")
+            return {"error": str(e), "status_code": e.response.status_code}
+        except httpx.RequestError as e:
+            print(f"Admin Request error: {e}")
+            return {"error": str(e)}
 
     async def _post(self, endpoint: str, json_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Internal method to perform POST requests.
         """
-        url = f"{self.base_url}{endpoint}"
-        async with httpx.AsyncClient() as client:
+        try:
+            response = await self.http.post(endpoint, headers=self.headers, json=json_data,
+                                            timeout=endpoint_timeout(endpoint))
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            print(f"HTTP error occurred: {e}")
             try:
-                response = await client.post(url, headers=self.headers, json=json_data, timeout=10.0)
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP error occurred: {e}")
-                try:
-                    err_json = e.response.json()
-                    msg = err_json.get("message", str(e))
-                except:
-                    msg = e.response.text or str(e)
-                return {"error": msg, "status_code": e.response.status_code}
-            except httpx.RequestError as e:
-                print(f"Request error occurred: {e}")
-                return {"error": str(e)}
+                err_json = e.response.json()
+                msg = err_json.get("message", str(e))
+            except:
+                msg = e.response.text or str(e)
+            return {"error": msg, "status_code": e.response.status_code}
+        except httpx.RequestError as e:
+            print(f"Request error occurred: {e}")
+            return {"error": str(e)}
+
+    async def _get_catalog(self, namespace: str, key: str, endpoint: str,
+                           params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        GET through the catalog cache. Medusa errors are returned uncached,
+        except 404 which is returned as an empty response (negative entry).
+        """
+        async def load():
+            data = await self._get(endpoint, params)
+            if "error" in data:
+                if data.get("status_code") == 404:
+                    return {}
+                raise CacheBypass(data)
+            return data
+
+        ttl, stale = CATALOG_TTLS[namespace]
+        return await catalog_cache.get_or_load(
+            namespace, f"{self.base_url}:{key}", load,
+            ttl=ttl, negative_ttl=CATALOG_NEGATIVE_TTL, stale_ttl=stale
+        )
 
     async def search_products(self, query: str, limit: int = 5, region_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -92,11 +131,29 @@ class MedusaClient:
         # Medusa Store API usually returns prices if a region_id or currency_code is provided in context?
         # But we got 400 Bad Request when passing currency_code.
         
-        data = await self._get(endpoint, params)
+        data = await self._get_catalog("search", f"{region_id}:{limit}:{normalize_query(query)}", endpoint, params)
         if "products" in data:
             return data["products"]
         return []
 
+    async def list_products(self, limit: int = 100, offset: int = 0,
+                            region_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        One page of the catalog with tags, categories and collection (uncached,
+        used by the product index sync). Returns (products, total count).
+        """
+        params = {
+            "limit": limit,
+            "offset": offset,
+            "fields": "*variants.calculated_price,*tags,*categories,*collection",
+        }
+        if region_id:
+            params["region_id"] = region_id
+        data = await self._get("/store/products", params)
+        if "error" in data:
+            raise RuntimeError(f"Medusa product list failed: {data['error']}")
+        return data.get("products", []), data.get("count", 0)
+
     async def get_product(self, product_id: str, region_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Get a single product by ID.
@@ -105,7 +162,7 @@ class MedusaClient:
         params = {}
         if region_id:
             params["region_id"] = region_id
-        data = await self._get(endpoint, params)
+        data = await self._get_catalog("product", f"{region_id}:{product_id}", endpoint, params)
         return data.get("product")
 
     async def get_collections(self, limit: int = 10) -> List[Dict[str, Any]]:
@@ -114,7 +171,7 @@ class MedusaClient:
         """
         endpoint = "/store/collections"
         params = {"limit": limit}
-        data = await self._get(endpoint, params)
+        data = await self._get_catalog("collections", str(limit), endpoint, params)
         return data.get("collections", [])
 
     async def get_regions(self) -> List[Dict[str, Any]]:
@@ -122,9 +179,16 @@ class MedusaClient:
         Get regions.
         """
         endpoint = "/store/regions"
-        data = await self._get(endpoint)
+        data = await self._get_catalog("regions", "all", endpoint)
         return data.get("regions", [])
 
+    async def get_default_region_id(self) -> Optional[str]:
+        """
+        First region (prices are returned for it); cached with the regions.
+        """
+        regions = await self.get_regions()
+        return regions[0]['id'] if regions else None
+
     async def get_order(self, order_id: str) -> Dict[str, Any]:
         """
         Get an order by ID using Admin API to ensure we get details.
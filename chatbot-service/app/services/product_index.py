@@ -0,0 +1,305 @@
+import asyncio
+import heapq
+import math
+import re
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import PRODUCT_INDEX_ENABLED, PRODUCT_INDEX_SYNC_SECONDS, PRODUCT_INDEX_PAGE_SIZE
+from app.logging_config import get_agent_logger
+
+logger = get_agent_logger("product_index")
+
+# Field weights of the BM25 term frequencies
+TITLE_WEIGHT = 3.0
+LABEL_WEIGHT = 2.0  # tags, categories, collection
+DESCRIPTION_WEIGHT = 1.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Folded (no diacritics) filler words ignored in queries
+# ("den" is not one: it is both "đến" and "đen")
+STOP_WORDS = {
+    "tim", "kiem", "mua", "dat", "co", "khong", "cho", "minh", "xem", "muon", "can", "giup",
+    "san", "pham", "sp", "gia", "duoi", "tren", "nao", "hang", "nhe", "voi", "va", "loai",
+    "the", "a", "an", "for", "with", "find", "search", "show", "you", "have", "want",
+    "buy", "under", "over", "below", "above", "price", "product", "products",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_PRICE_WORD = re.compile(r"^\d+(k|tr|m|d|vnd)?$")
+
+
+def fold(text: Optional[str]) -> str:
+    """Lower case without Vietnamese diacritics ("Ba lô Đen" -> "ba lo den")"""
+    text = (text or "").lower().replace("đ", "d")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Folded tokens. Adjacent short syllables are also emitted joined, so
+    "ba lô" and "balo" match each other.
+    """
+    tokens = _TOKEN.findall(fold(text))
+    joined = [a + b for a, b in zip(tokens, tokens[1:]) if len(a) <= 3 and len(b) <= 3]
+    return tokens + joined
+
+
+def min_price(product: Dict[str, Any]) -> Optional[float]:
+    """Lowest variant price (calculated price first, then the prices array)"""
+    prices = []
+    for v in product.get("variants") or []:
+        if v.get("calculated_price"):
+            amount = v["calculated_price"].get("calculated_amount")
+            if amount is not None:
+                prices.append(amount)
+        elif v.get("prices"):
+            for price_obj in v["prices"]:
+                amount = price_obj.get("amount")
+                if amount is not None:
+                    prices.append(amount)
+    return min(prices) if prices else None
+
+
+def price_bounds(price_condition: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float, bool, bool]]:
+    """(low, high, low inclusive, high inclusive) of an IntentClassifier price condition"""
+    if not price_condition:
+        return None
+    op = price_condition.get("operator")
+    if op == "lt":
+        return (-math.inf, price_condition["value"], True, False)
+    if op == "gt":
+        return (price_condition["value"], math.inf, False, True)
+    if op == "range":
+        return (price_condition["min"], price_condition["max"], True, True)
+    return None
+
+
+def in_bounds(price: Optional[float], bounds: Tuple[float, float, bool, bool]) -> bool:
+    if price is None:
+        return False
+    low, high, low_inclusive, high_inclusive = bounds
+    return ((price > low or (low_inclusive and price == low)) and
+            (price < high or (high_inclusive and price == high)))
+
+
+class ProductIndex:
+    """
+    Immutable in-memory search index over raw Medusa store products.
+
+    Titles, descriptions, tags, categories and the collection are folded
+    (diacritics removed) and tokenized into an inverted index whose postings
+    hold precomputed BM25 contributions, so a query is a sum over the
+    postings of its terms. Postings are sorted by weight so the top results
+    are usually found without reading whole lists. Minimum prices are kept
+    in a sorted column for range filters; a narrow price range is scored
+    directly through the forward index instead.
+    """
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        self.products = products
+        self.prices: List[Optional[float]] = [min_price(p) for p in products]
+        priced = sorted((price, doc) for doc, price in enumerate(self.prices) if price is not None)
+        self.sorted_prices = [price for price, _ in priced]
+        self.sorted_docs = [doc for _, doc in priced]
+        self.built_at = time.time()
+
+        term_freqs: List[Dict[str, float]] = []
+        for product in products:
+            tf: Dict[str, float] = defaultdict(float)
+            labels = [t.get("value") for t in product.get("tags") or [] if isinstance(t, dict)]
+            labels += [c.get("name") for c in product.get("categories") or [] if isinstance(c, dict)]
+            if isinstance(product.get("collection"), dict):
+                labels.append(product["collection"].get("title"))
+            for text, weight in ((product.get("title"), TITLE_WEIGHT), (product.get("subtitle"), TITLE_WEIGHT),
+                                 (" ".join(filter(None, labels)), LABEL_WEIGHT),
+                                 (product.get("description"), DESCRIPTION_WEIGHT)):
+                for token in tokenize(text):
+                    tf[token] += weight
+            term_freqs.append(tf)
+
+        lengths = [sum(tf.values()) for tf in term_freqs]
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 1.0
+        doc_freq: Dict[str, int] = defaultdict(int)
+        for tf in term_freqs:
+            for term in tf:
+                doc_freq[term] += 1
+
+        n = len(products)
+        idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+        self.doc_weights: List[Dict[str, float]] = []
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for doc, tf in enumerate(term_freqs):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / avg_length)
+            weights = {term: idf[term] * freq * (BM25_K1 + 1) / (freq + norm) for term, freq in tf.items()}
+            self.doc_weights.append(weights)
+            for term, weight in weights.items():
+                postings[term].append((doc, weight))
+        for entries in postings.values():
+            entries.sort(key=lambda entry: (-entry[1], entry[0]))
+        self.postings = dict(postings)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def query_terms(self, query: str) -> List[str]:
+        terms = []
+        for token in tokenize(query):
+            if token in STOP_WORDS or _PRICE_WORD.match(token) or token in terms:
+                continue
+            terms.append(token)
+        return terms
+
+    def search(self, query: str, limit: int = 5,
+               price_condition: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Raw products ranked by BM25, restricted to the price condition"""
+        bounds = price_bounds(price_condition)
+        allowed = self._price_range(bounds) if bounds else None
+        terms = [t for t in self.query_terms(query) if t in self.postings]
+
+        if not terms:
+            if query and self.query_terms(query):
+                return []  # only unknown words
+            # Browsing: cheapest first within the price range, else catalog order
+            if allowed:
+                return [self.products[doc] for doc in self.sorted_docs[allowed[0]:min(allowed[1], allowed[0] + limit)]]
+            return self.products[:limit]
+
+        if allowed and (allowed[1] - allowed[0]) ** 2 < limit * len(self.products):
+            # Selective price filter: score only the documents in the range
+            scores = {}
+            for doc in self.sorted_docs[allowed[0]:allowed[1]]:
+                weights = self.doc_weights[doc]
+                score = sum(weights.get(t, 0.0) for t in terms)
+                if score:
+                    scores[doc] = score
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+            return [self.products[doc] for doc, _ in best]
+        return self._top_k(terms, limit, bounds)
+
+    def _top_k(self, terms: List[str], limit: int,
+               bounds: Optional[Tuple[float, float, bool, bool]]) -> List[Dict[str, Any]]:
+        """
+        Threshold algorithm: walk the postings (sorted by weight) in parallel,
+        score each new document through the forward index, and stop once the
+        k-th best score reaches the sum of the weights at the current depth,
+        which bounds every document not seen yet.
+        """
+        lists = [self.postings[t] for t in terms]
+        heap: List[Tuple[float, int]] = []  # (score, -doc)
+        seen = set()
+        for depth in range(max(len(postings) for postings in lists)):
+            threshold = 0.0
+            for postings in lists:
+                if depth >= len(postings):
+                    continue
+                doc, weight = postings[depth]
+                threshold += weight
+                if doc in seen:
+                    continue
+                seen.add(doc)
+                if bounds and not in_bounds(self.prices[doc], bounds):
+                    continue
+                weights = self.doc_weights[doc]
+                item = (sum(weights.get(t, 0.0) for t in terms), -doc)
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            if len(heap) >= limit and heap[0][0] >= threshold:
+                break
+        return [self.products[-doc] for _, doc in sorted(heap, reverse=True)]
+
+    def _price_range(self, bounds: Tuple[float, float, bool, bool]) -> Tuple[int, int]:
+        """Slice of the sorted price column inside the bounds"""
+        low, high, low_inclusive, high_inclusive = bounds
+        start = (bisect_left if low_inclusive else bisect_right)(self.sorted_prices, low)
+        stop = (bisect_right if high_inclusive else bisect_left)(self.sorted_prices, high)
+        return start, max(start, stop)
+
+
+class ProductIndexSync:
+    """
+    Owner of the current ProductIndex, rebuilt from the Medusa catalog every
+    PRODUCT_INDEX_SYNC_SECONDS. The new index is built off the event loop and
+    swapped in whole; searches return None until the first sync succeeded
+    (callers then fall back to the Medusa search).
+    """
+
+    def __init__(self):
+        self.index: Optional[ProductIndex] = None
+        self.last_sync_ms: float = 0.0
+        self.sync_count = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.index is not None
+
+    def search(self, query: str, limit: int = 5,
+               price_condition: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        if self.index is None:
+            return None
+        return self.index.search(query, limit, price_condition)
+
+    async def sync(self, client):
+        """Fetch every published product (with prices of the default region) and rebuild"""
+        start = time.perf_counter()
+        region_id = await client.get_default_region_id()
+        products: List[Dict[str, Any]] = []
+        while True:
+            page, count = await client.list_products(PRODUCT_INDEX_PAGE_SIZE, len(products), region_id=region_id)
+            products.extend(page)
+            if not page or len(products) >= count:
+                break
+        self.index = await asyncio.to_thread(ProductIndex, products)
+        self.last_sync_ms = round((time.perf_counter() - start) * 1000, 2)
+        self.sync_count += 1
+        self.last_error = None
+        logger.info(f"Product index synced - products={len(products)} terms={len(self.index.postings)} "
+                    f"time={self.last_sync_ms}ms")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PRODUCT_INDEX_ENABLED,
+            "ready": self.ready,
+            "products": len(self.index) if self.index else 0,
+            "terms": len(self.index.postings) if self.index else 0,
+            "priced": len(self.index.sorted_prices) if self.index else 0,
+            "built_at": self.index.built_at if self.index else None,
+            "last_sync_ms": self.last_sync_ms,
+            "sync_count": self.sync_count,
+            "last_error": self.last_error,
+        }
+
+    def start(self, client):
+        """Start the background sync loop (first sync immediately)"""
+        if PRODUCT_INDEX_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._sync_loop(client))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sync_loop(self, client):
+        while True:
+            try:
+                await self.sync(client)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Product index sync failed: {e}")
+            await asyncio.sleep(PRODUCT_INDEX_SYNC_SECONDS)
+
+
+# Global instance
+product_index = ProductIndexSync()
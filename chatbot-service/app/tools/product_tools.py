@@ -4,62 +4,16 @@ import time
 from app.tools.base import BaseTool
 from app.models.agent_types import ToolResults
 from app.models import product_to_info, MedusaProduct
-
-# Cache region_id to avoid repeated API calls
-_cached_region_id = None
+from app.services.product_index import product_index, min_price, price_bounds, in_bounds
 
 class ProductSearchTool(BaseTool):
     async def run(self, query: str, limit: int = 5, price_condition: Dict[str, Any] = None) -> ToolResults:
         start_time = time.time()
         try:
-            # Get or use cached region to ensure prices are returned
-            global _cached_region_id
-            if _cached_region_id is None:
-                regions = await self.client.get_regions()
-                _cached_region_id = regions[0]['id'] if regions else None
-            
-            # If filtering by price, fetch more candidates
-            fetch_limit = limit * 5 if price_condition else limit
-            
-            products_raw = await self.client.search_products(query, fetch_limit, region_id=_cached_region_id)
-            
-            filtered_products = []
-            for p in products_raw:
-                if price_condition:
-                    # Check price
-                    # Get lowest price from variants
-                    variants = p.get("variants", [])
-                    prices = []
-                    for v in variants:
-                        # Check calculated_price first
-                        if "calculated_price" in v:
-                            amount = v["calculated_price"].get("calculated_amount")
-                            if amount is not None:
-                                prices.append(amount)
-                        # Fallback to prices array
-                        elif "prices" in v:
-                            for price_obj in v["prices"]:
-                                amount = price_obj.get("amount")
-                                if amount is not None:
-                                    prices.append(amount)
-                    
-                    if not prices:
-                        continue # Skip if no price found
-                        
-                    min_price = min(prices)
-                    
-                    op = price_condition.get("operator")
-                    if op == "lt":
-                        if min_price < price_condition["value"]:
-                            filtered_products.append(p)
-                    elif op == "gt":
-                        if min_price > price_condition["value"]:
-                            filtered_products.append(p)
-                    elif op == "range":
-                        if price_condition["min"] <= min_price <= price_condition["max"]:
-                            filtered_products.append(p)
-                else:
-                    filtered_products.append(p)
+            # Local index (one lookup, price range included) once the catalog is synced
+            filtered_products = product_index.search(query, limit, price_condition)
+            if filtered_products is None:
+                filtered_products = await self._search_medusa(query, limit, price_condition)
             
             # Slice to limit
             filtered_products = filtered_products[:limit]
@@ -83,17 +37,30 @@ class ProductSearchTool(BaseTool):
                 timings_ms={"search_products": duration}
             )
 
+    async def _search_medusa(self, query: str, limit: int, price_condition: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Medusa q= search; with a price filter, more candidates are fetched and filtered here"""
+        # Region (cached by the client) to ensure prices are returned
+        region_id = await self.client.get_default_region_id()
+        
+        # If filtering by price, fetch more candidates
+        fetch_limit = limit * 5 if price_condition else limit
+        
+        products_raw = await self.client.search_products(query, fetch_limit, region_id=region_id)
+        if not price_condition:
+            return products_raw
+        
+        # Products without a price (or an unknown operator) are skipped
+        bounds = price_bounds(price_condition)
+        return [p for p in products_raw if bounds and in_bounds(min_price(p), bounds)]
+
 class ProductDetailTool(BaseTool):
     async def run(self, product_id: str) -> ToolResults:
         start_time = time.time()
         try:
-            # Use cached region to ensure prices are returned
-            global _cached_region_id
-            if _cached_region_id is None:
-                regions = await self.client.get_regions()
-                _cached_region_id = regions[0]['id'] if regions else None
+            # Region (cached by the client) to ensure prices are returned
+            region_id = await self.client.get_default_region_id()
 
-            product_raw = await self.client.get_product(product_id, region_id=_cached_region_id)
+            product_raw = await self.client.get_product(product_id, region_id=region_id)
             if not product_raw:
                  return ToolResults(ok=False, data=None, errors=["product_not_found"], timings_ms={})
             
@@ -0,0 +1,120 @@
+"""
+Benchmark: keyword scoring of IntentClassifier, per-phrase scan vs compiled matcher
+
+Runs the chat lines of the evaluation test cases (report/evaluation/*.csv,
+case-test.txt) through:
+
+  scan     _match_score for every intent (one substring test per phrase,
+           the previous IntentClassifier.run)
+  matcher  PhraseMatcher.scores (one pass over the message)
+
+The keyword table is then grown with --scale-1 synthetic intents per
+original one (phrases of made-up syllables) to show how each path scales
+with the table size. Also reports _extract_product_query and the whole
+IntentClassifier.run per message.
+
+Usage (from chatbot-service/):
+    python -m benchmarks.bench_intent_classifier --rounds 200 --scale 16
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import random
+import statistics
+import time
+from pathlib import Path
+
+from app.agents.intent_classifier import (
+    VI_KEYWORDS,
+    IntentClassifier,
+    PhraseMatcher,
+    _extract_product_query,
+    _match_score,
+)
+from app.models.agent_types import ProcessedInput, SessionContext
+
+EVALUATION_DIR = Path(__file__).resolve().parents[2] / "report" / "evaluation"
+SYLLABLES = ["ba", "lo", "tui", "xach", "ao", "khoac", "giay", "the", "thao", "kinh", "mat", "dong", "ho",
+             "vi", "da", "mu", "non", "quan", "jean", "vay", "dam", "sandal", "boot", "len", "lua"]
+
+
+def load_corpus():
+    lines = []
+    for path in sorted(EVALUATION_DIR.glob("**/*.csv")):
+        with open(path, newline="", encoding="utf-8") as f:
+            lines += [row["user_input"] for row in csv.DictReader(f) if row.get("user_input")]
+    case_file = EVALUATION_DIR / "case-test.txt"
+    if case_file.exists():
+        lines += [line.strip() for line in case_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+    return lines
+
+
+def scaled_table(scale: int, rng: random.Random):
+    """VI_KEYWORDS plus (scale - 1) synthetic intents per original intent"""
+    table = {key: list(phrases) for key, phrases in VI_KEYWORDS.items()}
+    for copy in range(1, scale):
+        for key, phrases in VI_KEYWORDS.items():
+            table[f"{key}.{copy}"] = [" ".join(rng.choice(SYLLABLES) + rng.choice(SYLLABLES)
+                                               for _ in range(len(p.split()))) for p in phrases]
+    return table
+
+
+def per_message_us(fn, corpus, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for line in corpus:
+            fn(line)
+        timings.append((time.perf_counter() - start) * 1e6 / len(corpus))
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=16, help="largest table size, in multiples of VI_KEYWORDS")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    corpus = load_corpus()
+    print(f"corpus: {len(corpus)} chat lines from {EVALUATION_DIR}")
+    print()
+
+    rng = random.Random(args.seed)
+    scale = 1
+    while scale <= args.scale:
+        table = scaled_table(scale, rng)
+        matcher = PhraseMatcher(table)
+        phrases = sum(len(p) for p in table.values())
+        for line in corpus:
+            expected = {key: _match_score(line, p) for key, p in table.items()}
+            assert matcher.scores(line) == expected, line
+        scan = per_message_us(lambda line: {key: _match_score(line, p) for key, p in table.items()},
+                              corpus, args.rounds)
+        compiled = per_message_us(matcher.scores, corpus, args.rounds)
+        print(f"phrases={phrases:>6}  scan={scan:8.1f}us  matcher={compiled:6.1f}us  speedup={scan / compiled:5.1f}x")
+        scale *= 4 if scale < args.scale else 2
+
+    print()
+    print(f"_extract_product_query: {per_message_us(_extract_product_query, corpus, args.rounds):.1f}us per message")
+
+    classifier = IntentClassifier()
+    inputs = [ProcessedInput(text=line, cleaned_text=line, session_id="bench", language="vi",
+                             session_ctx=SessionContext()) for line in corpus]
+
+    async def classify_all():
+        for processed in inputs:
+            await classifier.run(processed)
+
+    timings = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        asyncio.run(classify_all())
+        timings.append((time.perf_counter() - start) * 1e6 / len(inputs))
+    print(f"IntentClassifier.run:   {statistics.median(timings):.1f}us per message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: Medusa calls with a fresh httpx client per call vs the pooled client
+
+Starts a local stub of the Medusa Store API (uvicorn, /store/products returns
+a small product list after --delay-ms) and issues the same GET with:
+
+  fresh   one `async with httpx.AsyncClient()` per call (previous MedusaClient)
+  pooled  MedusaClient through the process-wide keep-alive client
+
+Reports sequential per-call latency (p50/p95) and throughput with
+--concurrency calls in flight. The stub is plain HTTP on localhost, so the
+saving shown is TCP setup and client construction only; against a remote
+HTTPS backend the TLS handshake per call comes on top.
+
+Usage (from chatbot-service/):
+    python -m benchmarks.bench_medusa_client --calls 500 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from app.services.http_client import http_clients
+from app.services.medusa_client import MedusaClient
+
+PRODUCTS = json.dumps({
+    "products": [
+        {"id": f"prod_{i}", "title": f"Balo {i}", "handle": f"balo-{i}",
+         "variants": [{"id": f"variant_{i}", "prices": [{"amount": 450000 + i, "currency_code": "vnd"}]}]}
+        for i in range(5)
+    ]
+}).encode()
+
+
+def stub_app(delay_ms: float):
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": PRODUCTS})
+    return app
+
+
+def start_stub(delay_ms: float) -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(stub_app(delay_ms), host="127.0.0.1", port=port,
+                            log_level="warning", access_log=False, timeout_keep_alive=60)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+async def fresh_call(base_url: str):
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{base_url}/store/products", params={"q": "balo", "limit": 5}, timeout=10.0)
+        response.raise_for_status()
+        return response.json()["products"]
+
+
+async def pooled_call(base_url: str):
+    return await MedusaClient(base_url=base_url, api_key=None).search_products("balo", limit=5)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))]
+
+
+async def sequential(call, base_url: str, calls: int):
+    await call(base_url)
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await call(base_url)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def concurrent(call, base_url: str, calls: int, concurrency: int) -> float:
+    remaining = calls
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await call(base_url)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return calls / (time.perf_counter() - start)
+
+
+async def main(args):
+    base_url = start_stub(args.delay_ms)
+    print(f"stub Medusa: {base_url} delay={args.delay_ms}ms http2={http_clients.http2}")
+    print()
+    for label, call in (("fresh", fresh_call), ("pooled", pooled_call)):
+        timings = await sequential(call, base_url, args.calls)
+        throughput = await concurrent(call, base_url, args.calls, args.concurrency)
+        print(f"{label:<7} p50={statistics.median(timings):7.2f}ms  p95={percentile(timings, 0.95):7.2f}ms  "
+              f"throughput={throughput:8.0f} calls/s (concurrency={args.concurrency})")
+    await http_clients.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="stub processing time per request")
+    asyncio.run(main(parser.parse_args()))
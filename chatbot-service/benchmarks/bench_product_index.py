@@ -0,0 +1,181 @@
+"""
+Benchmark: local BM25 product index vs the Medusa q= search path
+
+Builds a synthetic Vietnamese catalog (product type, style, brand, colour,
+"Ba lô"/"Balo" spellings, VND prices) and runs queries such as
+"balo đen" with "dưới 500k". A product is relevant when it has the queried
+type and colour and satisfies the price condition.
+
+  index    ProductIndex.search (one local lookup, price range included)
+  q=       the previous path simulated locally: case-insensitive substring
+           match of the whole query on title/description (Medusa q=),
+           limit*5 candidates, price filter in Python. The HTTP round trip
+           is not included, so its latency is a lower bound.
+  scan     naive local scan: every folded query word is a substring of the
+           folded title/description, price filter, catalog order.
+
+Reports build time, precision@limit, share of queries with a full page of
+results and latency (p50/p95). No Medusa instance is needed.
+
+Usage (from chatbot-service/):
+    python -m benchmarks.bench_product_index --products 20000 --queries 2000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.services.product_index import ProductIndex, fold, in_bounds, min_price, price_bounds
+
+TYPES = [
+    ("balo", ["Balo", "Ba lô"]),
+    ("tui-xach", ["Túi xách"]),
+    ("tui-deo-cheo", ["Túi đeo chéo"]),
+    ("vi", ["Ví da"]),
+    ("vali", ["Vali"]),
+    ("ao-thun", ["Áo thun"]),
+    ("mu", ["Mũ lưỡi trai"]),
+]
+QUERY_TYPES = {"balo": ["balo", "ba lô", "balo"], "tui-xach": ["túi xách", "tui xach"],
+               "tui-deo-cheo": ["túi đeo chéo"], "vi": ["ví da"], "vali": ["vali"],
+               "ao-thun": ["áo thun", "ao thun"], "mu": ["mũ lưỡi trai"]}
+STYLES = ["laptop", "du lịch", "học sinh", "chống nước", "mini", "thể thao", "công sở", "cao cấp"]
+BRANDS = ["JanSport", "Adidas", "Nike", "Herschel", "Mikkor", "Simplecarry"]
+COLOURS = ["đen", "xanh navy", "đỏ", "xám", "hồng", "trắng", "be", "nâu"]
+PRICE_CONDITIONS = [
+    ("dưới 500k", {"operator": "lt", "value": 500_000}),
+    ("dưới 1 triệu", {"operator": "lt", "value": 1_000_000}),
+    ("trên 1tr5", {"operator": "gt", "value": 1_500_000}),
+    ("từ 300k đến 800k", {"operator": "range", "min": 300_000, "max": 800_000}),
+]
+
+
+def synthetic_catalog(n: int, rng: random.Random):
+    products, truth = [], []
+    for i in range(n):
+        type_key, spellings = rng.choice(TYPES)
+        style, brand, colour = rng.choice(STYLES), rng.choice(BRANDS), rng.choice(COLOURS)
+        price = rng.randrange(15, 250) * 10_000
+        products.append({
+            "id": f"prod_{i}",
+            "title": f"{rng.choice(spellings)} {style} {brand} {colour}",
+            "handle": f"product-{i}",
+            "description": f"{rng.choice(spellings)} {brand} phong cách {style}, màu {colour}, bảo hành 12 tháng.",
+            "tags": [{"value": style}, {"value": brand}],
+            "variants": [{"id": f"variant_{i}", "title": "Default",
+                          "calculated_price": {"calculated_amount": price, "currency_code": "vnd"}}],
+        })
+        truth.append((type_key, colour, price))
+    return products, truth
+
+
+def make_queries(n: int, rng: random.Random):
+    queries = []
+    for _ in range(n):
+        type_key = rng.choice(TYPES)[0]
+        colour = rng.choice(COLOURS)
+        text = f"{rng.choice(QUERY_TYPES[type_key])} {colour}"
+        condition = None
+        if rng.random() < 0.6:
+            label, condition = rng.choice(PRICE_CONDITIONS)
+            text_full = f"{text} {label}"
+        else:
+            text_full = text
+        queries.append((text, text_full, condition, type_key, colour))
+    return queries
+
+
+def substring_search(products, query: str, limit: int, condition):
+    """The previous path: Medusa q= (substring of the whole query), limit*5, filter in Python"""
+    q = query.lower()
+    fetch_limit = limit * 5 if condition else limit
+    candidates = []
+    for p in products:
+        if q in p["title"].lower() or q in p["description"].lower():
+            candidates.append(p)
+            if len(candidates) >= fetch_limit:
+                break
+    if condition:
+        bounds = price_bounds(condition)
+        candidates = [p for p in candidates if in_bounds(min_price(p), bounds)]
+    return candidates[:limit]
+
+
+def scan_search(folded, products, query: str, limit: int, condition):
+    """Naive full scan with word substrings and the price filter in Python"""
+    words = fold(query).split()
+    bounds = price_bounds(condition)
+    results = []
+    for text, p in zip(folded, products):
+        if all(w in text for w in words) and (not bounds or in_bounds(min_price(p), bounds)):
+            results.append(p)
+            if len(results) >= limit:
+                break
+    return results
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    products, truth = synthetic_catalog(args.products, rng)
+    position = {p["id"]: i for i, p in enumerate(products)}
+
+    start = time.perf_counter()
+    index = ProductIndex(products)
+    print(f"catalog: products={len(index):,} terms={len(index.postings):,} "
+          f"build={(time.perf_counter() - start) * 1000:.0f}ms")
+    print()
+
+    queries = make_queries(args.queries, rng)
+    folded = [fold(f"{p['title']} {p['description']}") for p in products]
+
+    def relevant(product, type_key, colour, condition):
+        t, c, price = truth[position[product["id"]]]
+        return t == type_key and c == colour and (not condition or in_bounds(price, price_bounds(condition)))
+
+    runs = {
+        # The index gets the tool's inputs: extracted product query + price condition
+        "index": lambda q: index.search(q[0], args.limit, q[2]),
+        # Medusa q= with the same inputs
+        "q=": lambda q: substring_search(products, q[0], args.limit, q[2]),
+        "scan": lambda q: scan_search(folded, products, q[0], args.limit, q[2]),
+        # The index on the raw message (legacy flow, no extraction)
+        "index raw": lambda q: index.search(q[1], args.limit, q[2]),
+    }
+    for label, run in runs.items():
+        timings, precision, full = [], [], 0
+        for q in queries:
+            started = time.perf_counter()
+            results = run(q)
+            timings.append((time.perf_counter() - started) * 1000)
+            if results:
+                precision.append(sum(relevant(p, q[3], q[4], q[2]) for p in results) / len(results))
+            full += len(results) >= args.limit
+        print(f"{label:<10} precision@{args.limit}={statistics.mean(precision) if precision else 0:6.1%}  "
+              f"answered={len(precision) / len(queries):6.1%}  full page={full / len(queries):6.1%}  "
+              f"p50={statistics.median(timings):7.3f}ms  p95={percentile(timings, 0.95):7.3f}ms")
+
+    # The tool call behind "balo dưới 500k"
+    condition = {"operator": "lt", "value": 500_000}
+    timings = []
+    for _ in range(1000):
+        started = time.perf_counter()
+        index.search("balo", args.limit, condition)
+        timings.append((time.perf_counter() - started) * 1000)
+    print()
+    print(f"'balo' < 500k: p50={statistics.median(timings):.3f}ms p95={percentile(timings, 0.95):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
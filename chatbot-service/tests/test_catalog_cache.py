@@ -0,0 +1,189 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import catalog_cache as catalog_cache_module
+from app.services.catalog_cache import CacheBypass, CatalogCache, normalize_query
+from app.services.http_client import HttpClientManager
+from app.services.medusa_client import MedusaClient
+
+
+class _Loader:
+    def __init__(self, value, delay: float = 0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.value
+
+
+def test_read_through_and_hit_ratio():
+    cache = CatalogCache(use_redis=False)
+    loader = _Loader({"product": {"id": "prod_1"}})
+
+    async def _run():
+        return [await cache.get_or_load("product", "prod_1", loader, ttl=60) for _ in range(4)]
+
+    results = asyncio.run(_run())
+
+    assert loader.calls == 1
+    assert all(r == {"product": {"id": "prod_1"}} for r in results)
+    stats = cache.stats()["namespaces"]["product"]
+    assert stats["hits"] == 3 and stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.75
+
+
+def test_concurrent_requests_are_coalesced():
+    cache = CatalogCache(use_redis=False)
+    loader = _Loader(["balo"], delay=0.01)
+
+    async def _run():
+        return await asyncio.gather(*(cache.get_or_load("search", "balo", loader, ttl=60) for _ in range(10)))
+
+    results = asyncio.run(_run())
+
+    assert loader.calls == 1
+    assert results == [["balo"]] * 10
+    assert cache.stats()["namespaces"]["search"]["coalesced"] == 9
+
+
+def test_cancelled_caller_does_not_cancel_coalesced_load():
+    cache = CatalogCache(use_redis=False)
+    loader = _Loader(["balo"], delay=0.02)
+
+    async def _run():
+        leader = asyncio.ensure_future(cache.get_or_load("search", "balo", loader, ttl=60))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_load("search", "balo", loader, ttl=60))
+        await asyncio.sleep(0)
+        leader.cancel()
+        result = await waiter
+        return leader.cancelled(), result, await cache.get_or_load("search", "balo", loader, ttl=60)
+
+    leader_cancelled, result, cached = asyncio.run(_run())
+
+    assert leader_cancelled
+    assert result == cached == ["balo"]
+    assert loader.calls == 1
+
+
+def test_negative_entries_and_bypass():
+    cache = CatalogCache(use_redis=False)
+    empty = _Loader([])
+    uncached_empty = _Loader([])
+    failing_calls = []
+
+    async def failing():
+        failing_calls.append(1)
+        raise CacheBypass({"error": "boom"})
+
+    async def _run():
+        negative = [await cache.get_or_load("search", "none", empty, ttl=60, negative_ttl=30) for _ in range(2)]
+        for _ in range(2):
+            await cache.get_or_load("search", "other", uncached_empty, ttl=60)
+        errors = [await cache.get_or_load("product", "x", failing, ttl=60) for _ in range(2)]
+        return negative, errors
+
+    negative, errors = asyncio.run(_run())
+
+    assert negative == [[], []]
+    assert empty.calls == 1
+    assert uncached_empty.calls == 2  # no negative_ttl: empty results are not kept
+    assert errors == [{"error": "boom"}] * 2
+    assert len(failing_calls) == 2
+    assert cache.stats()["namespaces"]["search"]["negative"] == 1
+
+
+def test_lru_eviction():
+    cache = CatalogCache(max_entries=2, use_redis=False)
+
+    async def _run():
+        for key in ("a", "b", "a", "c"):
+            await cache.get_or_load("product", key, _Loader({"id": key}), ttl=60)
+
+    asyncio.run(_run())
+
+    assert list(cache._local) == ["product:a", "product:c"]
+
+
+def test_stale_entry_served_while_refreshing(monkeypatch):
+    cache = CatalogCache(use_redis=False)
+    clock = [1000.0]
+    monkeypatch.setattr(catalog_cache_module.time, "monotonic", lambda: clock[0])
+    loader = _Loader([{"id": "reg_1"}])
+
+    async def _run():
+        await cache.get_or_load("regions", "all", loader, ttl=60, stale_ttl=600)
+        clock[0] += 120
+        loader.value = [{"id": "reg_2"}]
+        stale = await cache.get_or_load("regions", "all", loader, ttl=60, stale_ttl=600)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        fresh = await cache.get_or_load("regions", "all", loader, ttl=60, stale_ttl=600)
+        return stale, fresh
+
+    stale, fresh = asyncio.run(_run())
+
+    assert stale == [{"id": "reg_1"}]
+    assert fresh == [{"id": "reg_2"}]
+    assert loader.calls == 2
+
+
+def test_normalize_query():
+    assert normalize_query("  Balo   ĐEN ") == normalize_query("balo đen")
+
+
+@pytest.fixture
+def medusa(monkeypatch):
+    """MedusaClient against a mock Medusa with a fresh cache; returns the request log"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path == "/store/products/missing":
+            return httpx.Response(404, json={"message": "not found"})
+        if request.url.path == "/store/products/broken":
+            return httpx.Response(500, json={"message": "error"})
+        if request.url.path.startswith("/store/products/"):
+            return httpx.Response(200, json={"product": {"id": request.url.path.rsplit("/", 1)[-1]}})
+        return httpx.Response(200, json={"products": [{"id": "prod_1"}], "regions": [{"id": "reg_1"}]})
+
+    manager = HttpClientManager()
+    monkeypatch.setattr(manager, "_create", lambda base_url: httpx.AsyncClient(
+        base_url=base_url, transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr("app.services.medusa_client.http_clients", manager)
+    monkeypatch.setattr("app.services.medusa_client.catalog_cache", CatalogCache(use_redis=False))
+    return requests
+
+
+def test_medusa_client_catalog_calls_are_cached(medusa):
+    async def _run():
+        client = MedusaClient(base_url="http://medusa:9000")
+        region_id = await client.get_default_region_id()
+        await client.get_default_region_id()
+        a = await client.search_products("Balo  Đen", region_id=region_id)
+        b = await MedusaClient(base_url="http://medusa:9000").search_products("balo đen", region_id=region_id)
+        product = await client.get_product("prod_1")
+        again = await client.get_product("prod_1")
+        missing = [await client.get_product("missing") for _ in range(2)]
+        broken = [await client.get_product("broken") for _ in range(2)]
+        return region_id, a, b, product, again, missing, broken
+
+    region_id, a, b, product, again, missing, broken = asyncio.run(_run())
+
+    assert region_id == "reg_1"
+    assert a == b == [{"id": "prod_1"}]
+    assert product == again == {"id": "prod_1"}
+    assert missing == [None, None]
+    assert broken == [None, None]
+    paths = [r.url.path for r in medusa]
+    assert paths.count("/store/regions") == 1
+    assert paths.count("/store/products") == 1
+    assert paths.count("/store/products/prod_1") == 1
+    assert paths.count("/store/products/missing") == 1  # negative entry
+    assert paths.count("/store/products/broken") == 2  # errors are not cached
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from app.agents import executor as executor_module
+from app.agents.executor import Executor
+from app.models.agent_types import ActionPlan, IntentResult, ProcessedInput, ToolResults
+
+
+def _processed(cart_id=None):
+    processed = ProcessedInput(session_id="s1", customer_id="cust_1", text="x", cleaned_text="x")
+    processed.session_ctx.cart_id = cart_id
+    return processed
+
+
+def _slow_tool(name, delay, log):
+    async def _tool(*args, **kwargs):
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+        return ToolResults(ok=True, data={"tool": name}, timings_ms={name: int(delay * 1000)})
+    return _tool
+
+
+def test_independent_tools_run_concurrently(monkeypatch):
+    log = []
+    monkeypatch.setattr("app.tools.report_tools.get_sales_report", _slow_tool("sales", 0.1, log))
+    monkeypatch.setattr("app.tools.report_tools.get_top_products", _slow_tool("top", 0.1, log))
+    plan = ActionPlan(tools=["manager.report_sales", "manager.top_products"])
+
+    start = time.perf_counter()
+    results = asyncio.run(Executor().run(_processed(), IntentResult(intent="manager_report_sales"), plan))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.18
+    assert [event for event, _ in log] == ["start", "start", "end", "end"]
+    assert results.ok
+    assert results.by_tool["manager.report_sales"].data == {"tool": "sales"}
+    assert results.by_tool["manager.top_products"].data == {"tool": "top"}
+    assert results.data == {"tool": "top"}  # last tool of the plan
+    assert results.timings_ms["sales"] == 100 and results.timings_ms["top"] == 100
+    assert {"manager.report_sales", "manager.top_products", "tools_total"} <= set(results.timings_ms)
+
+
+def test_chained_tools_pass_outputs_forward(monkeypatch):
+    log = []
+    added = []
+
+    async def _search(query, limit=10, price_condition=None):
+        log.append("search")
+        await asyncio.sleep(0.02)
+        return ToolResults(ok=True, data=[{"id": "prod_1", "title": "Balo", "variants": [{"id": "variant_1"}]}])
+
+    async def _add(cart_id, variant_id, quantity=1):
+        log.append("add")
+        added.append(variant_id)
+        return ToolResults(ok=True, data={"cart_id": "cart_1"})
+
+    monkeypatch.setattr("app.tools.product_tools.search_products", _search)
+    monkeypatch.setattr("app.tools.cart_tools.add_to_cart", _add)
+    intent = IntentResult(intent="cart_add", entities={"product_query": "balo"})
+    plan = ActionPlan(tools=["product.search", "cart.add"], depends_on={"cart.add": ["product.search"]})
+
+    results = asyncio.run(Executor().run(_processed("cart_1"), intent, plan))
+
+    assert log == ["search", "add"]
+    assert added == ["variant_1"]
+    assert intent.entities["product_title"] == "Balo"
+    assert results.data == {"cart_id": "cart_1"}
+    assert results.by_tool["product.search"].data[0]["id"] == "prod_1"
+
+
+def test_timeouts_and_missing_inputs_are_per_tool(monkeypatch):
+    log = []
+    monkeypatch.setattr("app.tools.report_tools.get_sales_report", _slow_tool("sales", 0.01, log))
+    monkeypatch.setattr("app.tools.report_tools.get_top_products", _slow_tool("top", 1.0, log))
+    monkeypatch.setattr(executor_module, "EXECUTOR_TOOL_TIMEOUTS", {"manager.top_products": 0.05})
+    plan = ActionPlan(tools=["manager.report_sales", "manager.top_products", "cart.view"])
+
+    results = asyncio.run(Executor().run(_processed(), IntentResult(intent="manager_report_sales"), plan))
+
+    assert not results.ok
+    assert results.errors == ["manager.top_products timed out after 0.05s", "Missing cart_id"]
+    assert results.by_tool["manager.report_sales"].ok
+    assert results.data == {"tool": "sales"}  # failed tools leave the data of earlier ones
+
+
+def test_cyclic_dependencies_run_in_plan_order(monkeypatch):
+    log = []
+    monkeypatch.setattr("app.tools.report_tools.get_sales_report", _slow_tool("sales", 0.01, log))
+    monkeypatch.setattr("app.tools.report_tools.get_top_products", _slow_tool("top", 0.01, log))
+    plan = ActionPlan(
+        tools=["manager.report_sales", "manager.top_products"],
+        depends_on={"manager.report_sales": ["manager.top_products"], "manager.top_products": ["manager.report_sales"]},
+    )
+
+    results = asyncio.run(Executor().run(_processed(), IntentResult(intent="manager_report_sales"), plan))
+
+    assert results.ok
+    assert log == [("start", "sales"), ("end", "sales"), ("start", "top"), ("end", "top")]
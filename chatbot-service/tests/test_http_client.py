@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+
+from app.services import http_client
+from app.services.http_client import HttpClientManager, endpoint_timeout
+from app.services.medusa_client import MedusaClient
+
+
+def test_one_client_per_base_url():
+    manager = HttpClientManager()
+
+    async def _run():
+        first = manager.get("http://medusa:9000")
+        same = manager.get("http://medusa:9000/")
+        other = manager.get("http://other:9000")
+        await manager.close()
+        return first, same, other
+
+    first, same, other = asyncio.run(_run())
+
+    assert first is same
+    assert first is not other
+    assert first.is_closed and other.is_closed
+
+
+def test_new_event_loop_gets_new_client():
+    manager = HttpClientManager()
+
+    async def _get():
+        return manager.get("http://medusa:9000")
+
+    assert asyncio.run(_get()) is not asyncio.run(_get())
+
+
+def test_endpoint_timeout_longest_prefix(monkeypatch):
+    monkeypatch.setattr(http_client, "MEDUSA_ENDPOINT_TIMEOUTS", {"/store": 4.0, "/store/products": 2.0})
+    monkeypatch.setattr(http_client, "MEDUSA_TIMEOUT", 9.0)
+
+    assert endpoint_timeout("/store/products/prod_1").read == 2.0
+    assert endpoint_timeout("/store/carts/cart_1").read == 4.0
+    assert endpoint_timeout("/admin/orders").read == 9.0
+
+
+def test_medusa_clients_share_connections(monkeypatch):
+    """Every MedusaClient instance goes through the same pooled client"""
+    manager = HttpClientManager()
+    created = []
+
+    def _create(base_url):
+        def handler(request):
+            return httpx.Response(200, json={"products": [{"id": "prod_1", "path": request.url.path}]})
+        client = httpx.AsyncClient(base_url=base_url, transport=httpx.MockTransport(handler))
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(manager, "_create", _create)
+    monkeypatch.setattr("app.services.medusa_client.http_clients", manager)
+
+    async def _run():
+        results = [await MedusaClient(base_url="http://medusa:9000").search_products("balo") for _ in range(3)]
+        await manager.close()
+        return results
+
+    results = asyncio.run(_run())
+
+    assert len(created) == 1
+    assert results[0] == [{"id": "prod_1", "path": "/store/products"}]
@@ -0,0 +1,66 @@
+import asyncio
+
+from app.agents.intent_classifier import (
+    EN_KEYWORDS,
+    VI_KEYWORDS,
+    VI_MATCHER,
+    EN_MATCHER,
+    IntentClassifier,
+    PhraseMatcher,
+    _extract_product_query,
+    _match_score,
+)
+from app.models.agent_types import ProcessedInput
+
+CHAT_LINES = [
+    "Xin chào shop",
+    "Tìm cho mình balo JanSport màu đen",
+    "Có balo nào giá dưới 500k không?",
+    "tìm kiếm boys Shoes có giá dưới 3tr",
+    "Thêm cái này vào giỏ hàng giúp mình",
+    "Kiểm tra đơn hàng #123 giúp mình",
+    "Phí ship về Hà Nội bao nhiêu?",
+    "Check tồn kho mã SP001",
+    "hi, do you have a black backpack? I want to buy one",
+    "cancel order  order_01ABC please",
+]
+
+
+def test_matcher_scores_match_phrase_scan():
+    for line in CHAT_LINES:
+        assert VI_MATCHER.scores(line) == {k: _match_score(line, p) for k, p in VI_KEYWORDS.items()}
+        assert EN_MATCHER.scores(line) == {k: _match_score(line, p) for k, p in EN_KEYWORDS.items()}
+
+
+def test_matcher_phrase_rules():
+    matcher = PhraseMatcher({"A": ["tìm", "tìm kiếm", "hi"], "B": ["tìm kiếm", "kiếm"], "C": ["kiếm"]})
+
+    # Overlapping phrases all count, multi-word phrases weigh 2, repeats count once
+    assert matcher.scores("Tìm kiếm tìm kiếm") == {"A": 3, "B": 3, "C": 1}
+    # Whole words between spaces only
+    assert matcher.scores("hình tìm, kiếm") == {"A": 0, "B": 1, "C": 1}
+    assert set(matcher.matches("TÌM KIẾM")) == {"tìm", "tìm kiếm", "kiếm"}
+
+
+def test_extract_product_query():
+    assert _extract_product_query("Tìm balo dưới 500k") == "balo"
+    assert _extract_product_query("Có balo màu xanh dương không?") == "balo màu xanh dương không"
+    assert _extract_product_query("tìm backpack trên 500k dưới 1tr") == "backpack"
+    assert _extract_product_query("Tìm cái Superbreak và thêm vào giỏ hàng") == "superbreak"
+    assert _extract_product_query("Tìm thông tin khách hàng 0901234567") == "0901234567"
+    assert _extract_product_query("Cho mình xem chi tiết cái đầu tiên") == ""
+
+
+def test_classifier_entities():
+    def classify(text, language="vi"):
+        processed = ProcessedInput(session_id="s1", text=text, cleaned_text=text, language=language)
+        return asyncio.run(IntentClassifier().run(processed))
+
+    search = classify("Tìm balo màu xanh dưới 500k")
+    assert search.intent == "product_inquiry"
+    assert search.entities["product_query"] == "balo màu xanh"
+    assert search.entities["price_condition"] == {"operator": "lt", "value": 500000}
+
+    assert classify("Gợi ý cho mình vài mẫu hot đi").intent == "product_recommend"
+    assert classify("Thông số kỹ thuật của nó thế nào?").intent == "product_detail"
+    assert classify("where is my order status", language="en").intent == "order_tracking"
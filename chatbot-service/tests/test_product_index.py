@@ -0,0 +1,127 @@
+import asyncio
+
+from app.services.product_index import ProductIndex, ProductIndexSync, fold, tokenize
+from app.tools.product_tools import ProductSearchTool
+
+
+def _product(pid, title, price, description="", tags=()):
+    return {
+        "id": pid,
+        "title": title,
+        "handle": pid,
+        "description": description,
+        "tags": [{"value": t} for t in tags],
+        "variants": [{"id": f"{pid}_v", "title": "Default",
+                      "calculated_price": {"calculated_amount": price, "currency_code": "vnd"}}],
+    }
+
+
+CATALOG = [
+    _product("balo_den", "Ba lô laptop đen", 450_000),
+    _product("balo_xanh", "Balo du lịch xanh", 650_000, "Balo chống nước"),
+    _product("balo_cao_cap", "Balo da cao cấp", 1_800_000),
+    _product("tui_den", "Túi xách đen", 300_000, tags=("công sở",)),
+    _product("vi", "Ví da nam", 250_000, "Phù hợp đi kèm balo"),
+    {"id": "no_price", "title": "Balo mẫu", "handle": "no-price", "variants": []},
+]
+
+
+def _ids(products):
+    return [p["id"] for p in products]
+
+
+def test_fold_and_tokenize():
+    assert fold("Ba lô ĐEN Đỏ") == "ba lo den do"
+    assert "balo" in tokenize("Ba lô")
+    assert tokenize("Balo") == ["balo"]
+
+
+def test_bm25_ranking_with_diacritic_folding():
+    index = ProductIndex(CATALOG)
+
+    # Title matches rank above the description mention; "ba lô" matches "Balo"
+    assert _ids(index.search("balo", limit=10))[-1] == "vi"
+    assert set(_ids(index.search("ba lô", limit=4))) == {"balo_den", "balo_xanh", "balo_cao_cap", "no_price"}
+    assert _ids(index.search("balo den"))[0] == "balo_den"
+    assert _ids(index.search("túi công sở"))[0] == "tui_den"
+
+
+def test_price_conditions():
+    index = ProductIndex(CATALOG)
+
+    assert _ids(index.search("balo dưới 500k", 10, {"operator": "lt", "value": 500_000})) == ["balo_den", "vi"]
+    assert _ids(index.search("balo", 10, {"operator": "gt", "value": 1_000_000})) == ["balo_cao_cap"]
+    assert set(_ids(index.search("balo", 10, {"operator": "range", "min": 450_000, "max": 650_000}))) == {
+        "balo_den", "balo_xanh"}
+    # Bounds follow the previous filter: lt/gt exclusive, range inclusive
+    assert _ids(index.search("balo", 10, {"operator": "lt", "value": 450_000})) == ["vi"]
+
+
+def test_browse_and_unknown_words():
+    index = ProductIndex(CATALOG)
+
+    assert _ids(index.search("sản phẩm", 2, {"operator": "lt", "value": 500_000})) == ["vi", "tui_den"]
+    assert _ids(index.search("", 2)) == ["balo_den", "balo_xanh"]
+    assert index.search("kính râm") == []
+
+
+def test_top_k_matches_full_scoring():
+    catalog = [_product(f"p{i}", f"Balo {'đen' if i % 3 else 'xanh'} mẫu {i % 7}", 100_000 + i * 1000,
+                        "balo đen" * (i % 4)) for i in range(300)]
+    index = ProductIndex(catalog)
+    terms = index.query_terms("balo đen mẫu 3")
+
+    def score(product):
+        return sum(index.doc_weights[int(product["id"][1:])].get(t, 0.0) for t in terms)
+
+    expected = sorted((score(p) for p in catalog), reverse=True)[:10]
+    assert [score(p) for p in index.search("balo đen mẫu 3", 10)] == expected
+
+
+class _FakeMedusa:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.pages = []
+        self.searches = 0
+
+    async def get_default_region_id(self):
+        return "reg_1"
+
+    async def list_products(self, limit, offset, region_id=None):
+        self.pages.append((limit, offset, region_id))
+        return self.catalog[offset:offset + limit], len(self.catalog)
+
+    async def search_products(self, query, limit, region_id=None):
+        self.searches += 1
+        return [p for p in self.catalog if fold(query) in fold(p["title"])][:limit]
+
+
+def test_sync_pages_through_the_catalog(monkeypatch):
+    monkeypatch.setattr("app.services.product_index.PRODUCT_INDEX_PAGE_SIZE", 4)
+    client = _FakeMedusa(CATALOG)
+    sync = ProductIndexSync()
+
+    assert sync.search("balo") is None
+    asyncio.run(sync.sync(client))
+
+    assert client.pages == [(4, 0, "reg_1"), (4, 4, "reg_1")]
+    assert sync.ready and sync.stats()["products"] == len(CATALOG)
+    assert sync.stats()["priced"] == len(CATALOG) - 1
+
+
+def test_search_tool_falls_back_until_index_is_synced(monkeypatch):
+    sync = ProductIndexSync()
+    monkeypatch.setattr("app.tools.product_tools.product_index", sync)
+    client = _FakeMedusa(CATALOG)
+    tool = ProductSearchTool(client)
+    condition = {"operator": "lt", "value": 500_000}
+
+    fallback = asyncio.run(tool.run("balo", limit=5, price_condition=condition))
+    assert client.searches == 1
+    assert fallback.ok and fallback.data == []  # the substring search misses "Ba lô laptop đen"
+
+    asyncio.run(sync.sync(client))
+    indexed = asyncio.run(tool.run("balo", limit=5, price_condition=condition))
+    assert client.searches == 1
+    assert indexed.ok
+    assert [p.id for p in indexed.data] == ["balo_den", "vi"]
@@ -13,12 +13,111 @@ class Settings(BaseSettings):
     # Recommendation settings
     max_recommendations: int = 12
     cache_ttl_seconds: int = 3600  # 1 hour
+    cache_stale_seconds: int = 600  # served stale while one request recomputes
+    cache_local_ttl_seconds: int = 30  # in-process tier in front of Redis
+    cache_local_max_entries: int = 10000
+    cache_redis_timeout_seconds: float = 0.2
+    cache_redis_retry_seconds: int = 30
     min_interactions_for_collaborative: int = 5
     
-    # Algorithm weights
+    # Algorithm weights (score fusion of the personalized candidate strategies)
     content_weight: float = 0.4
     collaborative_weight: float = 0.6
+
+    # Re-ranking of personalized candidates (fusion, exploration, MMR diversity)
+    rerank_rrf_k: int = 10  # rank offset of the reciprocal-rank fusion
+    rerank_fill_weight: float = 0.2  # trending products topping up short lists
+    rerank_diversity_lambda: float = 0.7  # 1.0 = relevance only
+    rerank_collection_weight: float = 0.5  # collection overlap relative to category overlap
+    rerank_exploration: float = 0.1  # share of seeded noise in the relevance
+    rerank_exploration_seconds: int = 3600  # exploration seed rotates per user every period
+    
+    # Similarity batch job
+    similarity_top_k: int = 20
+    similarity_threshold: float = 0.3
+    similarity_block_size: int = 512
+    
+    # Frequently-bought-together miner
+    fbt_min_support: int = 2  # minimum number of baskets containing the pair
+    fbt_top_k: int = 20
+    fbt_lookback_days: int = 180
+    fbt_max_basket_size: int = 50
+    fbt_chunk_size: int = 50000
+    
+    # In-process catalog snapshot
+    catalog_refresh_seconds: int = 60  # incremental refresh by updated_at
+    catalog_full_reload_seconds: int = 3600
     
+    # In-memory product sampler (replaces ORDER BY RANDOM())
+    sampler_refresh_seconds: int = 300
+    sampler_popularity_days: int = 30
+
+    # Buffered /track ingestion
+    ingest_queue_max: int = 50000
+    ingest_batch_size: int = 1000
+    ingest_flush_interval_seconds: float = 1.0
+    ingest_enqueue_timeout_seconds: float = 0.5  # then /track answers 503
+    ingest_max_batch: int = 500  # events per /track/batch request
+    preference_debounce_seconds: int = 60  # at most one preference write per user per window
+
+    # Incremental user-preference model
+    preference_half_life_days: float = 14.0
+    preference_lookback_days: int = 90  # window of the bulk rebuild scan
+    preference_price_quantiles: tuple = (0.05, 0.95)  # published as price_min / price_max
+    preference_chunk_size: int = 50000
+
+    # Popularity counters (rec_product_stats)
+    popularity_rollup_seconds: int = 300
+    popularity_commit_lag_seconds: int = 10
+    popularity_trending_window: str = "7d"
+
+    # Shared personalized candidate pool (carousels)
+    candidate_pool_size: int = 50
+    candidate_pool_ttl_seconds: int = 60
+    candidate_pool_max_users: int = 5000
+
+    # Implicit-feedback ALS collaborative filtering model
+    cf_model_dir: str = "models/cf"
+    cf_factors: int = 32
+    cf_iterations: int = 15
+    cf_cg_steps: int = 3
+    cf_alpha: float = 20.0
+    cf_regularization: float = 0.05
+    cf_lookback_days: int = 365
+    cf_reload_check_seconds: int = 60  # workers pick up models saved by another process
+
+    # Approximate nearest-neighbour item index ("more like this")
+    ann_dims: int = 64
+    ann_nprobe: int = 8
+    ann_kmeans_iterations: int = 8
+    ann_sync_seconds: int = 60  # insert newly published products
+    ann_rebuild_seconds: int = 21600  # refit embeddings and clusters
+
+    # Materialized homepage recommendations (rec_user_recommendations)
+    materialize_size: int = 24  # handles stored per user; larger limits are computed on demand
+    materialize_active_days: int = 30
+    materialize_concurrency: int = 4  # users computed at once
+    materialize_pool_reserve: int = 4  # pool connections left to request handling during a run
+    materialize_batch_size: int = 500  # users per bulk write
+    materialize_max_age_seconds: int = 86400  # older lists are recomputed on demand
+    materialize_incremental_seconds: int = 300
+    materialize_commit_lag_seconds: int = 10
+
+    # rec_user_interactions monthly partitions and retention
+    interaction_partitions_ahead: int = 2  # months created in advance
+    interaction_retention_days: int = 400  # older raw events are compacted into rec_interaction_daily (keep above cf_lookback_days)
+    interaction_maintenance_seconds: int = 21600
+    interaction_migration_lag_seconds: int = 10  # overlap when catching up rows written during a migration
+
+    # Display price when the request names no region/currency: first currency of this
+    # list the product has a price in, else its cheapest price in any currency
+    price_currency_preference: tuple = ("vnd", "usd")
+
+    # Engine query tracing (GET /metrics, ?debug=true timings)
+    trace_slow_query_ms: float = 200.0
+    trace_explain_sample_rate: float = 0.1  # share of slow queries logged with EXPLAIN ANALYZE
+    trace_explain_interval_seconds: int = 300  # at most one plan per query label per interval
+
     class Config:
         env_file = ".env"
 
@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+import asyncio
 import asyncpg
 import json
 from datetime import datetime, timedelta
@@ -10,6 +12,19 @@ import uuid
 from app.config import get_settings
 from app.services.recommendation_engine import RecommendationEngine
 from app.services.interaction_tracker import InteractionTracker
+from app.services.frequently_together import FrequentlyTogetherMiner
+from app.services.catalog_snapshot import get_catalog_snapshot
+from app.services.product_sampler import get_product_sampler
+from app.services.recommendation_cache import get_recommendation_cache
+from app.services.ingestion_pipeline import IngestionBackpressure, get_ingestion_pipeline
+from app.services.candidate_pool import get_candidate_pools
+from app.services.cf_model import CFTrainer, get_cf_model
+from app.services.ann_index import get_item_index
+from app.services.popularity_stats import PopularityStats, WINDOWS, ALL_TIME, COUNTED_INTERACTIONS
+from app.services.query_tracer import trace_queries
+from app.services.materializer import RecommendationMaterializer
+from app.services.interaction_storage import InteractionStorage
+from app.services.metrics import get_metrics
 from app.logging_config import setup_logging, get_rec_logger, log_interaction, log_recommendation_request, log_recommendation_result
 
 # Setup logging
@@ -19,6 +34,14 @@ logger = get_rec_logger("main")
 settings = get_settings()
 app = FastAPI(title="Recommendation Service", version="1.0.0")
 
+metrics = get_metrics()
+REQUEST_SECONDS = metrics.histogram(
+    "rec_request_duration_seconds", "Recommendation request latency", ["context", "cached"])
+REQUEST_QUERIES = metrics.histogram(
+    "rec_request_db_queries", "Engine queries per recommendation request", ["context"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34))
+POOL_CONNECTIONS = metrics.gauge("rec_db_pool_connections", "Database pool connections", ["state"])
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -30,21 +53,61 @@ app.add_middleware(
 
 # Database connection pool
 db_pool = None
+popularity_stats = None
+materializer = None
+interaction_storage = None
 
 @app.on_event("startup")
 async def startup():
-    global db_pool
+    global db_pool, popularity_stats, materializer, interaction_storage
     db_pool = await asyncpg.create_pool(
         settings.database_url, 
         min_size=2, 
         max_size=10,
         server_settings={'search_path': f'{settings.db_schema}, public'}
     )
+    
+    catalog = get_catalog_snapshot()
+    try:
+        await catalog.load(db_pool)
+    except Exception as e:
+        # Engine falls back to SQL hydration until the background refresh succeeds
+        logger.warning(f"Catalog snapshot not loaded at startup: {e}")
+    catalog.start(db_pool)
+    get_product_sampler().start(db_pool)
+    get_item_index().start()
+    await get_recommendation_cache().connect()
+    get_ingestion_pipeline().start(db_pool)
+    try:
+        get_cf_model().load()
+    except Exception as e:
+        # Collaborative candidates fall back to the SQL self-join
+        logger.warning(f"CF model not loaded at startup: {e}")
+    get_cf_model().start()
+    popularity_stats = PopularityStats(db_pool)
+    popularity_stats.start()
+    materializer = RecommendationMaterializer(db_pool)
+    materializer.start()
+    interaction_storage = InteractionStorage(db_pool)
+    interaction_storage.start()
+    
     logger.info(f"Recommendation service started successfully - schema={settings.db_schema}")
 
 @app.on_event("shutdown")
 async def shutdown():
     global db_pool
+    await get_ingestion_pipeline().stop()
+    if popularity_stats:
+        await popularity_stats.stop()
+    if materializer:
+        await materializer.stop()
+    if interaction_storage:
+        await interaction_storage.stop()
+    await get_recommendation_cache().close()
+    await get_cf_model().stop()
+    await get_item_index().stop()
+    await get_product_sampler().stop()
+    await get_catalog_snapshot().stop()
     if db_pool:
         await db_pool.close()
 
@@ -57,98 +120,194 @@ class TrackInteractionRequest(BaseModel):
     interaction_type: str  # view, add_to_cart, purchase, wishlist, search
     metadata: Optional[dict] = None
 
+class TrackBatchRequest(BaseModel):
+    events: List[TrackInteractionRequest]
+
 class RecommendationRequest(BaseModel):
     user_id: str
     product_handle: Optional[str] = None
     context: str = "homepage"  # homepage, product_page, cart, checkout
     limit: int = 12
+    region_id: Optional[str] = None  # prices of this Medusa region (falls back to its currency)
+    currency_code: Optional[str] = None  # prices in this currency when no region is given
+    debug: bool = False  # attach per-query timings (ignored in production)
 
 class RecommendationResponse(BaseModel):
     recommendations: List[dict]
     algorithm: str
     user_id: str
     cached: bool = False
+    timings: Optional[dict] = None
+
+class CarouselRail(BaseModel):
+    recommendations: List[dict]
+    algorithm: str
+    cached: bool = False
+
+class CarouselsResponse(BaseModel):
+    user_id: str
+    rails: Dict[str, CarouselRail]
+
+# Rails built from the shared per-user candidate pool
+CAROUSEL_RAILS = ["for_you", "top_selling", "most_viewed", "most_wishlisted"]
 
 # Routes
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "recommendation"}
 
+@app.get("/catalog/snapshot")
+async def catalog_snapshot_stats():
+    """Size and age of the in-process catalog snapshot"""
+    return get_catalog_snapshot().stats()
+
+@app.get("/ann/stats")
+async def ann_index_stats(measure_recall: bool = False):
+    """Size of the item similarity index and recall@10 against brute force"""
+    index = get_item_index()
+    if measure_recall:
+        index.last_recall = await asyncio.to_thread(index.recall)
+    return index.stats()
+
 @app.post("/track")
 async def track_interaction(request: TrackInteractionRequest):
-    """Track user interaction"""
+    """Track user interaction (buffered; written to the database by the ingestion flusher)"""
     try:
         log_interaction(logger, request.user_id, request.interaction_type, request.product_id, request.metadata)
-        tracker = InteractionTracker(db_pool)
-        interaction_id = await tracker.track(
+        interaction_id = await get_ingestion_pipeline().enqueue(
             user_id=request.user_id,
             session_id=request.session_id,
             product_id=request.product_id,
             product_handle=request.product_handle,
             interaction_type=request.interaction_type,
-            metadata=request.metadata or {}
+            metadata=request.metadata
         )
         
         return {
             "success": True,
             "interaction_id": interaction_id
         }
+    except IngestionBackpressure as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Error tracking interaction: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/track/batch")
+async def track_interactions_batch(request: TrackBatchRequest):
+    """Track a batch of interactions buffered by the client"""
+    if len(request.events) > settings.ingest_max_batch:
+        raise HTTPException(status_code=413, detail=f"At most {settings.ingest_max_batch} events per batch")
+    
+    pipeline = get_ingestion_pipeline()
+    interaction_ids = []
+    try:
+        for event in request.events:
+            interaction_ids.append(await pipeline.enqueue(
+                user_id=event.user_id,
+                session_id=event.session_id,
+                product_id=event.product_id,
+                product_handle=event.product_handle,
+                interaction_type=event.interaction_type,
+                metadata=event.metadata
+            ))
+    except IngestionBackpressure as e:
+        # Events before the rejected one are accepted; the client retries the rest
+        raise HTTPException(
+            status_code=503,
+            detail={"error": str(e), "accepted": len(interaction_ids), "interaction_ids": interaction_ids},
+            headers={"Retry-After": "1"}
+        )
+    
+    logger.info(f"Tracked interaction batch - events={len(interaction_ids)}")
+    return {
+        "success": True,
+        "count": len(interaction_ids),
+        "interaction_ids": interaction_ids
+    }
+
+@app.get("/ingest/stats")
+async def ingest_stats():
+    """Interaction buffer depth, flush and preference-update counters"""
+    return get_ingestion_pipeline().stats()
+
+async def generate_recommendations(engine: RecommendationEngine, user_id: str,
+                                   product_handle: Optional[str], context: str, limit: int):
+    """Dispatch a recommendation request to the engine by context"""
+    if context == "product_page" and product_handle:
+        return await engine.get_similar_products(product_handle, limit=limit)
+    elif context == "cart":
+        return await engine.get_frequently_bought_together(user_id, limit=limit)
+    elif context == "top_selling":
+        return await engine.get_personalized_top_selling(user_id, limit=limit), "top_selling_personalized"
+    elif context == "most_viewed":
+        return await engine.get_personalized_most_viewed(user_id, limit=limit), "most_viewed_personalized"
+    elif context == "most_wishlisted":
+        return await engine.get_personalized_most_wishlisted(user_id, limit=limit), "most_wishlisted_personalized"
+    elif context == "for_you":
+        pool = await engine.get_candidate_pool(user_id)
+        return pool.head(limit), pool.algorithm
+    else:  # homepage or default
+        materialized = await engine.get_materialized_recommendations(user_id, limit)
+        if materialized:
+            return materialized
+        return await engine.get_personalized_recommendations(user_id, limit=limit)
+
+def check_region(region_id: Optional[str]):
+    """Reject unknown regions once the catalog snapshot knows the region list"""
+    pricing = get_catalog_snapshot().pricing
+    if region_id and pricing.regions and not pricing.knows_region(region_id):
+        raise HTTPException(status_code=400, detail=f"Unknown region: {region_id}")
+
+async def serve_recommendations(user_id: str, product_handle: Optional[str],
+                                context: str, limit: int, debug: bool = False,
+                                region_id: Optional[str] = None,
+                                currency_code: Optional[str] = None) -> RecommendationResponse:
+    """Serve recommendations through the two-tier cache (cached lists are region independent)"""
+    import time
+    start_time = time.time()
+    
+    log_recommendation_request(logger, user_id, context, limit, {"product_handle": product_handle})
+    engine = RecommendationEngine(db_pool)
+    
+    with trace_queries() as trace:
+        recommendations, algorithm, cached = await get_recommendation_cache().get_or_compute(
+            user_id, context, product_handle, limit,
+            lambda: generate_recommendations(engine, user_id, product_handle, context, limit)
+        )
+        recommendations = await engine.localize_prices(recommendations, region_id, currency_code)
+    
+    execution_time = (time.time() - start_time) * 1000
+    REQUEST_SECONDS.observe(execution_time / 1000, context=context, cached=str(cached).lower())
+    REQUEST_QUERIES.observe(trace.count, context=context)
+    log_recommendation_result(
+        logger, user_id, algorithm, len(recommendations),
+        execution_time, {"context": context, "product_handle": product_handle,
+                         "region_id": region_id, "currency_code": currency_code,
+                         "cached": cached, "timings": engine.timings,
+                         "queries": trace.count, "db_ms": trace.db_ms}
+    )
+    
+    timings = None
+    if debug and settings.environment != "production":
+        timings = {"total_ms": round(execution_time, 2), "engine": engine.timings, **trace.summary()}
+    
+    return RecommendationResponse(
+        recommendations=recommendations,
+        algorithm=algorithm,
+        user_id=user_id,
+        cached=cached,
+        timings=timings
+    )
+
 @app.post("/recommendations", response_model=RecommendationResponse)
 async def post_recommendations(request: RecommendationRequest):
     """Get personalized recommendations via POST request"""
+    check_region(request.region_id)
     try:
-        import time
-        start_time = time.time()
-        
-        user_id = request.user_id
-        product_handle = request.product_handle
-        context = request.context
-        limit = request.limit
-        
-        log_recommendation_request(logger, user_id, context, limit, {"product_handle": product_handle})
-        engine = RecommendationEngine(db_pool)
-        
-        # Generate recommendations
-        if context == "product_page" and product_handle:
-            recommendations, algorithm = await engine.get_similar_products(
-                product_handle,
-                limit=limit
-            )
-        elif context == "cart":
-            recommendations, algorithm = await engine.get_frequently_bought_together(
-                user_id,
-                limit=limit
-            )
-        elif context == "top_selling":
-            recommendations = await engine.get_personalized_top_selling(user_id, limit=limit)
-            algorithm = "top_selling_personalized"
-        elif context == "most_viewed":
-            recommendations = await engine.get_personalized_most_viewed(user_id, limit=limit)
-            algorithm = "most_viewed_personalized"
-        elif context == "most_wishlisted":
-            recommendations = await engine.get_personalized_most_wishlisted(user_id, limit=limit)
-            algorithm = "most_wishlisted_personalized"
-        else:  # homepage or default
-            recommendations, algorithm = await engine.get_personalized_recommendations(
-                user_id,
-                limit=limit
-            )
-        
-        execution_time = (time.time() - start_time) * 1000
-        log_recommendation_result(
-            logger, user_id, algorithm, len(recommendations),
-            execution_time, {"context": context, "product_handle": product_handle}
-        )
-        
-        return RecommendationResponse(
-            recommendations=recommendations,
-            algorithm=algorithm,
-            user_id=user_id,
-            cached=False
+        return await serve_recommendations(
+            request.user_id, request.product_handle, request.context, request.limit, request.debug,
+            request.region_id, request.currency_code
         )
     except Exception as e:
         logger.error(f"Error getting recommendations: {e}", exc_info=True)
@@ -159,56 +318,82 @@ async def get_recommendations(
     user_id: str,
     product_handle: Optional[str] = None,
     context: str = "homepage",
-    limit: int = 12
+    limit: int = 12,
+    debug: bool = False,
+    region_id: Optional[str] = None,
+    currency_code: Optional[str] = None
 ):
     """Get personalized recommendations via GET request"""
+    check_region(region_id)
     try:
-        import time
-        start_time = time.time()
-        
-        log_recommendation_request(logger, user_id, context, limit, {"product_handle": product_handle})
-        engine = RecommendationEngine(db_pool)
-        
-        # Generate recommendations
-        if context == "product_page" and product_handle:
-            recommendations, algorithm = await engine.get_similar_products(
-                product_handle,
-                limit=limit
-            )
-        elif context == "cart":
-            recommendations, algorithm = await engine.get_frequently_bought_together(
-                user_id,
-                limit=limit
-            )
-        elif context == "top_selling":
-            recommendations = await engine.get_personalized_top_selling(user_id, limit=limit)
-            algorithm = "top_selling_personalized"
-        elif context == "most_viewed":
-            recommendations = await engine.get_personalized_most_viewed(user_id, limit=limit)
-            algorithm = "most_viewed_personalized"
-        elif context == "most_wishlisted":
-            recommendations = await engine.get_personalized_most_wishlisted(user_id, limit=limit)
-            algorithm = "most_wishlisted_personalized"
-        else:  # homepage or default
-            recommendations, algorithm = await engine.get_personalized_recommendations(
-                user_id,
-                limit=limit
-            )
-        
-        execution_time = (time.time() - start_time) * 1000
-        log_recommendation_result(
-            logger, user_id, algorithm, len(recommendations),
-            execution_time, {"context": context, "product_handle": product_handle}
-        )
-        
-        return RecommendationResponse(
-            recommendations=recommendations,
-            algorithm=algorithm,
+        return await serve_recommendations(user_id, product_handle, context, limit, debug,
+                                           region_id, currency_code)
+    except Exception as e:
+        logger.error(f"Error getting recommendations: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/recommendations/carousels", response_model=CarouselsResponse)
+async def get_carousels(user_id: str, rails: Optional[str] = None, limit: int = 12,
+                        region_id: Optional[str] = None, currency_code: Optional[str] = None):
+    """All personalized rails of a page in one request (comma-separated rails, default all)"""
+    names = [r.strip() for r in rails.split(",") if r.strip()] if rails else CAROUSEL_RAILS
+    unknown = [r for r in names if r not in CAROUSEL_RAILS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown rails: {', '.join(unknown)}")
+    check_region(region_id)
+    
+    try:
+        # Rails share one candidate pool build through the pool memo
+        responses = await asyncio.gather(*(
+            serve_recommendations(user_id, None, name, limit, region_id=region_id, currency_code=currency_code)
+            for name in names
+        ))
+        return CarouselsResponse(
             user_id=user_id,
-            cached=False
+            rails={
+                name: CarouselRail(
+                    recommendations=response.recommendations,
+                    algorithm=response.algorithm,
+                    cached=response.cached
+                )
+                for name, response in zip(names, responses)
+            }
         )
     except Exception as e:
-        logger.error(f"Error getting recommendations: {e}", exc_info=True)
+        logger.error(f"Error getting carousels: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and latency of the recommendation cache"""
+    return {**get_recommendation_cache().stats(), "candidate_pools": get_candidate_pools().stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request and engine query histograms in the Prometheus text format"""
+    if db_pool:
+        idle = db_pool.get_idle_size()
+        POOL_CONNECTIONS.set(idle, state="idle")
+        POOL_CONNECTIONS.set(db_pool.get_size() - idle, state="busy")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/popular")
+async def get_popular_products(interaction_type: str = "view", window: str = ALL_TIME, limit: int = 12):
+    """Top products by interaction counter (window: 1h, 24h, 7d, all)"""
+    if window not in WINDOWS and window != ALL_TIME:
+        raise HTTPException(status_code=400, detail=f"Unknown window: {window}")
+    if interaction_type not in COUNTED_INTERACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown interaction type: {interaction_type}")
+    try:
+        engine = RecommendationEngine(db_pool)
+        products = await engine.get_popular_products(interaction_type, limit, window)
+        return {
+            "products": products,
+            "interaction_type": interaction_type,
+            "window": window
+        }
+    except Exception as e:
+        logger.error(f"Error getting popular products: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/user/{user_id}/preferences")
@@ -288,6 +473,78 @@ async def compute_product_similarities():
         logger.error(f"Error computing similarities: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/compute/frequently-together")
+async def compute_frequently_together():
+    """Mine frequently-bought-together pairs from cart/purchase baskets (run periodically)"""
+    try:
+        miner = FrequentlyTogetherMiner(db_pool)
+        result = await miner.run()
+        return {
+            "success": True,
+            **result,
+            "message": "Frequently bought together pairs computed successfully"
+        }
+    except Exception as e:
+        logger.error(f"Error computing frequently bought together: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/compute/cf-model")
+async def compute_cf_model():
+    """Train the ALS collaborative filtering model and load it"""
+    try:
+        result = await CFTrainer(db_pool).run()
+        if result["interactions"]:
+            get_cf_model().load()
+        return {
+            "success": True,
+            **result,
+            "message": "Collaborative filtering model trained successfully"
+        }
+    except Exception as e:
+        logger.error(f"Error training CF model: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cf-model")
+async def cf_model_stats():
+    """Size and training parameters of the loaded CF model"""
+    return get_cf_model().stats()
+
+@app.post("/compute/popularity")
+async def compute_popularity():
+    """Roll interactions up into rec_product_stats now (also runs on a schedule)"""
+    try:
+        result = await popularity_stats.rollup()
+        return {"success": True, **result}
+    except Exception as e:
+        logger.error(f"Error computing popularity counters: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/compute/materialized-recommendations")
+async def compute_materialized_recommendations(incremental: bool = False):
+    """Precompute homepage recommendations for active users (incremental: only users with new interactions)"""
+    try:
+        result = await materializer.run(incremental=incremental)
+        return {"success": True, **result}
+    except Exception as e:
+        logger.error(f"Error materializing recommendations: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/compute/interaction-retention")
+async def compute_interaction_retention():
+    """Create upcoming interaction partitions and compact expired ones (also runs on a schedule)"""
+    try:
+        created = await interaction_storage.ensure_partitions()
+        result = await interaction_storage.compact()
+        return {"success": True, "partitions_created": created, **result}
+    except Exception as e:
+        logger.error(f"Error compacting interactions: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/materialize/stats")
+async def materialize_stats():
+    """Progress of the running (or last) materialization"""
+    return materializer.stats()
+
 @app.post("/compute/user-preferences")
 async def compute_user_preferences(user_id: Optional[str] = None):
     """Compute user preferences from interactions"""
@@ -0,0 +1,407 @@
+import asyncio
+import math
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+
+settings = get_settings()
+logger = get_rec_logger("ann_index")
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Relative weight of the feature blocks before the SVD projection
+TEXT_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.8
+COLLECTION_WEIGHT = 0.5
+
+# (title, description, category_ids, collection_id)
+Document = Tuple[Optional[str], Optional[str], Sequence[str], Optional[str]]
+
+
+class ItemEmbedder:
+    """
+    Dense item embeddings from catalog content.
+
+    Each product becomes a sparse row of TF-IDF title/description tokens
+    (title tokens counted twice), category one-hots and a collection
+    one-hot. The rows are projected onto the top singular vectors of the
+    catalog matrix (randomized SVD) and L2-normalized, so cosine similarity
+    is a dot product. transform() reuses the fitted vocabulary and
+    projection for products published after the fit.
+    """
+
+    def __init__(self, dims: int):
+        self.dims = dims
+        self.vocabulary: Dict[str, int] = {}
+        self.idf: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+
+    def fit_transform(self, docs: Sequence[Document], seed: int = 0) -> np.ndarray:
+        token_lists = [self._tokens(doc) for doc in docs]
+        vocabulary: Dict[str, int] = {}
+        document_frequency: Counter = Counter()
+        for tokens in token_lists:
+            for token in set(tokens):
+                vocabulary.setdefault(token, len(vocabulary))
+                document_frequency[token] += 1
+        n = max(len(docs), 1)
+        idf = np.ones(len(vocabulary), dtype=np.float64)
+        for token, i in vocabulary.items():
+            if not token.startswith(('c:', 'k:')):
+                idf[i] = math.log((1 + n) / (1 + document_frequency[token])) + 1.0
+        self.vocabulary, self.idf = vocabulary, idf
+
+        matrix = self._matrix(token_lists)
+        self.components = _randomized_svd(matrix, min(self.dims, *matrix.shape), seed)
+        return self._project(matrix)
+
+    def transform(self, docs: Sequence[Document]) -> np.ndarray:
+        return self._project(self._matrix([self._tokens(doc) for doc in docs]))
+
+    @staticmethod
+    def _tokens(doc: Document) -> List[str]:
+        title, description, category_ids, collection_id = doc
+        title_tokens = TOKEN_PATTERN.findall((title or '').lower())
+        tokens = title_tokens * 2 + TOKEN_PATTERN.findall((description or '').lower())
+        tokens += [f"c:{c}" for c in category_ids]
+        if collection_id:
+            tokens.append(f"k:{collection_id}")
+        return tokens
+
+    def _matrix(self, token_lists: List[List[str]]) -> sparse.csr_matrix:
+        indptr, indices, data = [0], [], []
+        for tokens in token_lists:
+            counts = Counter(t for t in tokens if t in self.vocabulary)
+            text = {t: (1.0 + math.log(c)) * self.idf[self.vocabulary[t]]
+                    for t, c in counts.items() if not t.startswith(('c:', 'k:'))}
+            norm = math.sqrt(sum(v * v for v in text.values())) or 1.0
+            categories = [t for t in counts if t.startswith('c:')]
+            for t, v in text.items():
+                indices.append(self.vocabulary[t])
+                data.append(TEXT_WEIGHT * v / norm)
+            for t in categories:
+                indices.append(self.vocabulary[t])
+                data.append(CATEGORY_WEIGHT / math.sqrt(len(categories)))
+            for t in counts:
+                if t.startswith('k:'):
+                    indices.append(self.vocabulary[t])
+                    data.append(COLLECTION_WEIGHT)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+            shape=(len(token_lists), max(len(self.vocabulary), 1))
+        )
+
+    def _project(self, matrix: sparse.csr_matrix) -> np.ndarray:
+        vectors = np.asarray(matrix @ self.components.T, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def _randomized_svd(matrix: sparse.csr_matrix, rank: int, seed: int, oversample: int = 10,
+                    power_iterations: int = 2) -> np.ndarray:
+    """Top-rank right singular vectors (rank x features), Halko et al. 2011"""
+    rng = np.random.default_rng(seed)
+    sketch = min(rank + oversample, min(matrix.shape))
+    q, _ = np.linalg.qr(matrix @ rng.normal(size=(matrix.shape[1], sketch)))
+    for _ in range(power_iterations):
+        q, _ = np.linalg.qr(matrix.T @ q)
+        q, _ = np.linalg.qr(matrix @ q)
+    _, _, vt = np.linalg.svd(np.asarray((matrix.T @ q).T), full_matrices=False)
+    return vt[:rank]
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over unit vectors (cosine = dot product).
+
+    Vectors are clustered with spherical k-means into ~sqrt(n) lists. A
+    query scores the centroids, scans the members of the nprobe closest
+    lists and takes the top-K with argpartition. Inserts append to the
+    nearest list; removals are tombstones until the next rebuild.
+    """
+
+    def __init__(self, dims: int):
+        self.dims = dims
+        self.vectors = np.empty((0, dims), dtype=np.float32)
+        self.handles: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.active = np.empty(0, dtype=bool)
+        self.centroids = np.empty((0, dims), dtype=np.float32)
+        self.lists: List[np.ndarray] = []
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def build(self, handles: List[str], vectors: np.ndarray, iterations: int, seed: int = 0):
+        n = len(handles)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.handles = list(handles)
+        self.row_of = {h: i for i, h in enumerate(handles)}
+        self.active = np.ones(n, dtype=bool)
+        self.size = n
+        if n == 0:
+            return
+
+        rng = np.random.default_rng(seed)
+        nlist = max(1, int(round(math.sqrt(n))))
+        centroids = self.vectors[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = self._assign(self.vectors, centroids)
+            members = sparse.csr_matrix(
+                (np.ones(n, dtype=np.float32), (assignment, np.arange(n))), shape=(nlist, n)
+            )
+            sums = np.asarray(members @ self.vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            sums[empty] = self.vectors[rng.choice(n, int(empty.sum()))]
+            centroids = (sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+        assignment = self._assign(self.vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        self.centroids = centroids
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(nlist)]
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[i:i + block] @ centroids.T, axis=1)
+            for i in range(0, len(vectors), block)
+        ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+    def add(self, handle: str, vector: np.ndarray):
+        """Insert (or replace) one vector into its nearest list"""
+        self.remove(handle)
+        if self.size == len(self.vectors):
+            capacity = max(16, 2 * len(self.vectors))
+            grown = np.empty((capacity, self.dims), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+            active = np.zeros(capacity, dtype=bool)
+            active[:self.size] = self.active[:self.size]
+            self.active = active
+        row = self.size
+        self.size += 1
+        self.vectors[row] = vector
+        self.active[row] = True
+        self.handles.append(handle)
+        self.row_of[handle] = row
+        if not len(self.centroids):
+            self.centroids = vector[None, :].astype(np.float32)
+            self.lists = [np.empty(0, dtype=np.int64)]
+        c = int(np.argmax(self.centroids @ vector))
+        self.lists[c] = np.append(self.lists[c], row)
+
+    def remove(self, handle: str):
+        row = self.row_of.pop(handle, None)
+        if row is not None:
+            self.active[row] = False
+
+    def search(self, vector: np.ndarray, k: int, nprobe: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        if not len(self.centroids):
+            return []
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ vector), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.lists[c] for c in probe.tolist()])
+        return self._top(rows, vector, k, exclude)
+
+    def brute_force(self, vector: np.ndarray, k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        return self._top(np.arange(self.size), vector, k, exclude)
+
+    def _top(self, rows: np.ndarray, vector: np.ndarray, k: int, exclude: Optional[str]) -> List[Tuple[str, float]]:
+        keep = self.active[rows]
+        if exclude is not None and exclude in self.row_of:
+            keep &= rows != self.row_of[exclude]
+        rows = rows[keep]
+        if rows.size == 0:
+            return []
+        scores = self.vectors[rows] @ vector
+        k = min(k, rows.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(self.handles[r], float(s)) for r, s in zip(rows[best].tolist(), scores[best].tolist())]
+
+    def vector(self, handle: str) -> Optional[np.ndarray]:
+        row = self.row_of.get(handle)
+        return None if row is None else self.vectors[row]
+
+
+class ItemSimilarityIndex:
+    """
+    "More like this" over the catalog snapshot.
+
+    Embeds every published product (ItemEmbedder) into an IVFIndex. A
+    background loop inserts newly published products and tombstones
+    removed ones every ann_sync_seconds, and refits embeddings and clusters
+    every ann_rebuild_seconds. Recall@K against brute force over a sample
+    of products is measured after every build.
+    """
+
+    def __init__(self, catalog: CatalogSnapshot = None):
+        self.catalog = catalog or get_catalog_snapshot()
+        self.embedder: Optional[ItemEmbedder] = None
+        self.index: Optional[IVFIndex] = None
+        self.built_at: Optional[datetime] = None
+        self.last_build_ms = 0.0
+        self.last_recall: Optional[dict] = None
+        self.inserted = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.index is not None and len(self.index) > 0
+
+    def _documents(self, rows: Sequence[int]) -> List[Document]:
+        c = self.catalog
+        return [(c.titles[i], c.descriptions[i], c.category_ids[i], c.collection_ids[i]) for i in rows]
+
+    def snapshot(self) -> Tuple[List[str], List[Document]]:
+        """Handles and documents of the current catalog (call on the event loop)"""
+        handles = list(self.catalog.index)
+        return handles, self._documents([self.catalog.index[h] for h in handles])
+
+    def build(self, handles: List[str] = None, docs: List[Document] = None):
+        """Fit embeddings and clusters (CPU-bound; may run in an executor given a snapshot)"""
+        if handles is None:
+            handles, docs = self.snapshot()
+        start = time.perf_counter()
+        embedder = ItemEmbedder(settings.ann_dims)
+        vectors = embedder.fit_transform(docs)
+        index = IVFIndex(vectors.shape[1])
+        index.build(handles, vectors, settings.ann_kmeans_iterations)
+
+        self.embedder, self.index = embedder, index
+        self.built_at = datetime.now()
+        self.inserted = 0
+        self.last_build_ms = round((time.perf_counter() - start) * 1000, 2)
+        self.last_recall = self.recall()
+        logger.info(
+            f"ANN index built - products={len(index)} lists={len(index.centroids)} "
+            f"dims={vectors.shape[1]} time={self.last_build_ms}ms recall={self.last_recall}"
+        )
+
+    def sync(self) -> int:
+        """Insert products published since the last build/sync, drop removed ones"""
+        if not self.is_ready:
+            return 0
+        current = self.catalog.index
+        new = [h for h in current if h not in self.index.row_of]
+        for handle in [h for h in self.index.row_of if h not in current]:
+            self.index.remove(handle)
+        if new:
+            vectors = self.embedder.transform(self._documents([current[h] for h in new]))
+            for handle, vector in zip(new, vectors):
+                self.index.add(handle, vector)
+            self.inserted += len(new)
+            logger.info(f"ANN index synced - inserted={len(new)} products={len(self.index)}")
+        return len(new)
+
+    def similar(self, handle: str, k: int) -> List[str]:
+        """Up to k handles most similar to handle (empty if the product is unknown)"""
+        if not self.is_ready:
+            return []
+        vector = self.index.vector(handle)
+        if vector is None:
+            return []
+        return [h for h, _ in self.index.search(vector, k, settings.ann_nprobe, exclude=handle)]
+
+    def recall(self, sample: int = 200, k: int = 10) -> Optional[dict]:
+        """
+        Mean recall@k of the IVF search against exact search on a sample of products.
+
+        Runs in a worker thread while the refresh loop may sync or swap the
+        index: the index is bound once and products removed meanwhile are
+        skipped.
+        """
+        if not self.is_ready:
+            return None
+        index = self.index
+        rng = np.random.default_rng(0)
+        handles = list(index.row_of)
+        queries = rng.choice(len(handles), min(sample, len(handles)), replace=False)
+        hits, total, measured, ann_s, exact_s = 0, 0, 0, 0.0, 0.0
+        for q in queries.tolist():
+            handle = handles[q]
+            vector = index.vector(handle)
+            if vector is None:
+                continue
+            t = time.perf_counter()
+            approx = {h for h, _ in index.search(vector, k, settings.ann_nprobe, exclude=handle)}
+            ann_s += time.perf_counter() - t
+            t = time.perf_counter()
+            exact = {h for h, _ in index.brute_force(vector, k, exclude=handle)}
+            exact_s += time.perf_counter() - t
+            hits += len(approx & exact)
+            total += len(exact)
+            measured += 1
+        n = max(measured, 1)
+        return {
+            "k": k,
+            "nprobe": settings.ann_nprobe,
+            "recall": round(hits / total, 4) if total else None,
+            "ann_ms": round(ann_s / n * 1000, 4),
+            "exact_ms": round(exact_s / n * 1000, 4),
+            "queries": measured
+        }
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "products": len(self.index) if self.index else 0,
+            "lists": len(self.index.centroids) if self.index else 0,
+            "inserted_since_build": self.inserted,
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+            "last_build_ms": self.last_build_ms,
+            "recall": self.last_recall
+        }
+
+    def start(self):
+        """Start the background build/sync loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                rebuild_due = (
+                    self.built_at is None or
+                    (datetime.now() - self.built_at).total_seconds() >= settings.ann_rebuild_seconds
+                )
+                if rebuild_due and self.catalog.is_loaded and len(self.catalog):
+                    handles, docs = self.snapshot()
+                    await loop.run_in_executor(None, self.build, handles, docs)
+                    # Catch up with products published while the build was running
+                    self.sync()
+                else:
+                    self.sync()
+            except Exception as e:
+                logger.error(f"ANN index refresh failed: {e}")
+            await asyncio.sleep(settings.ann_sync_seconds)
+
+
+@lru_cache()
+def get_item_index() -> ItemSimilarityIndex:
+    """Process-wide item similarity index"""
+    return ItemSimilarityIndex()
@@ -0,0 +1,101 @@
+from typing import Iterable, Sequence, Optional, Tuple
+
+from app.logging_config import get_rec_logger
+
+logger = get_rec_logger("bulk_writer")
+
+
+class BulkWriter:
+    """
+    Set-based writer for the pre-computed recommendation tables.
+
+    Rows are streamed into a temporary staging table with COPY
+    (asyncpg copy_records_to_table) and merged into the target table with a
+    single INSERT ... ON CONFLICT. With replace=True the old rows of the job
+    are deleted in the same transaction, so readers switch from the previous
+    result set to the new one atomically.
+    """
+
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+
+    async def write_similarities(self, records: Iterable[Tuple[str, str, float]],
+                                 similarity_type: str, replace: bool = True) -> int:
+        """Write (product_id_1, product_id_2, similarity_score) rows"""
+        return await self._copy_and_merge(
+            table="rec_product_similarities",
+            columns=("product_id_1", "product_id_2", "similarity_score", "similarity_type"),
+            key_columns=("product_id_1", "product_id_2", "similarity_type"),
+            records=((p1, p2, score, similarity_type) for p1, p2, score in records),
+            replace_where=("similarity_type = $1", (similarity_type,)) if replace else None
+        )
+
+    async def write_frequently_together(self, records: Iterable[tuple],
+                                        columns: Sequence[str] = ("product_id_1", "product_id_2",
+                                                                  "co_occurrence_count", "confidence_score"),
+                                        replace: bool = True) -> int:
+        """Write frequently-bought-together rows (one row per ordered pair)"""
+        return await self._copy_and_merge(
+            table="rec_frequently_together",
+            columns=tuple(columns),
+            key_columns=("product_id_1", "product_id_2"),
+            records=records,
+            replace_where=("TRUE", ()) if replace else None
+        )
+
+    async def write_user_preferences(self, records: Iterable[tuple]) -> int:
+        """Upsert (user_id, category_scores, price_min, price_max, state) rows"""
+        return await self._copy_and_merge(
+            table="rec_user_preferences",
+            columns=("user_id", "category_scores", "price_min", "price_max", "state"),
+            key_columns=("user_id",),
+            records=records,
+            timestamp_column="last_updated"
+        )
+
+    async def write_user_recommendations(self, records: Iterable[tuple]) -> int:
+        """Upsert (user_id, handles, algorithm, interactions_at) rows"""
+        return await self._copy_and_merge(
+            table="rec_user_recommendations",
+            columns=("user_id", "handles", "algorithm", "interactions_at"),
+            key_columns=("user_id",),
+            records=records,
+            timestamp_column="computed_at"
+        )
+
+    async def _copy_and_merge(self, table: str, columns: Sequence[str], key_columns: Sequence[str],
+                              records: Iterable[tuple],
+                              replace_where: Optional[Tuple[str, tuple]] = None,
+                              timestamp_column: str = "updated_at") -> int:
+        staging = f"{table}_staging"
+        column_list = ", ".join(columns)
+        key_list = ", ".join(key_columns)
+        updates = ", ".join(
+            f"{col} = EXCLUDED.{col}" for col in columns if col not in key_columns
+        )
+
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(f"""
+                    CREATE TEMP TABLE {staging}
+                    (LIKE {table} INCLUDING DEFAULTS)
+                    ON COMMIT DROP
+                """)
+                await conn.copy_records_to_table(staging, records=records, columns=list(columns))
+
+                if replace_where is not None:
+                    condition, args = replace_where
+                    await conn.execute(f"DELETE FROM {table} WHERE {condition}", *args)
+
+                # DISTINCT ON guards the merge against duplicate keys in one batch
+                status = await conn.execute(f"""
+                    INSERT INTO {table} ({column_list}, {timestamp_column})
+                    SELECT DISTINCT ON ({key_list}) {column_list}, NOW()
+                    FROM {staging}
+                    ON CONFLICT ({key_list})
+                    DO UPDATE SET {updates}, {timestamp_column} = NOW()
+                """)
+
+        count = int(status.split()[-1])
+        logger.info(f"Bulk write complete - table={table} rows={count} replace={replace_where is not None}")
+        return count
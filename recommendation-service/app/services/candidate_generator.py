@@ -0,0 +1,321 @@
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+from app.logging_config import get_rec_logger
+
+logger = get_rec_logger("candidates")
+
+
+class CandidateGenerator:
+    """
+    Candidate generation for personalized recommendations.
+
+    The user profile lookups and the independent strategies each run on
+    their own pooled connection and are awaited together with
+    asyncio.gather. Per-seed lookups are batched into ANY($1::text[])
+    queries, and every strategy returns handles only so the products are
+    hydrated once at the end. Stage timings (ms) are collected in
+    self.timings.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.db_pool = engine.db_pool
+        self.timings: Dict[str, float] = {}
+
+    async def load_profile(self, user_id: str) -> Tuple[dict, dict, List[str]]:
+        """Interaction stats, preferences and recent products in one round"""
+        start = time.perf_counter()
+        stats, prefs, recent_products = await asyncio.gather(
+            self._get_user_interaction_stats(user_id),
+            self.engine._get_user_preferences(user_id),
+            self._get_user_recent_products(user_id, limit=10)
+        )
+        self.timings['profile_ms'] = _elapsed_ms(start)
+        return stats, prefs, recent_products
+
+    async def generate(self, user_id: str, stats: dict, recent_products: List[str],
+                       limit: int) -> Tuple[List[dict], List[Tuple[str, List[str]]]]:
+        """
+        Run all applicable strategies concurrently and hydrate the merged handles once
+
+        Returns the products in merge order and each strategy's ranked handles
+        (the input of the score fusion in the Reranker).
+        """
+        strategies = []
+        if stats['cart_adds'] > 0 or stats['wishlist_adds'] > 0:
+            strategies.append(self._timed('cart_wishlist', self._similar_to_cart_wishlist(user_id, limit // 3)))
+        if stats['views'] > 0:
+            strategies.append(self._timed('category_views', self._category_based_on_views(user_id, limit // 3)))
+        if stats['unique_products_viewed'] >= 3:
+            strategies.append(self._timed('collaborative', self.engine._get_collaborative_handles(user_id, limit // 3)))
+        if recent_products:
+            strategies.append(self._timed('recent_similar', self._similar_to_recent(recent_products[:3], per_seed=2)))
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*strategies)
+        self.timings['strategies_ms'] = _elapsed_ms(start)
+
+        handles = []
+        seen = set()
+        for name, strategy_handles in results:
+            logger.info(f"Candidates from {name} - count={len(strategy_handles)}")
+            for handle in strategy_handles:
+                if handle not in seen:
+                    seen.add(handle)
+                    handles.append(handle)
+
+        start = time.perf_counter()
+        products = await self.engine._get_products_by_handles(handles)
+        position = {handle: i for i, handle in enumerate(handles)}
+        products.sort(key=lambda p: position[p['handle']])
+        self.timings['hydrate_ms'] = _elapsed_ms(start)
+
+        return products, list(results)
+
+    async def _timed(self, name: str, coro) -> Tuple[str, List[str]]:
+        start = time.perf_counter()
+        handles = await coro
+        self.timings[f'{name}_ms'] = _elapsed_ms(start)
+        return name, handles
+
+    async def _get_user_interaction_stats(self, user_id: str) -> dict:
+        """Get user interaction statistics"""
+        async with self.db_pool.acquire() as conn:
+            stats = await conn.fetchrow("""
+                SELECT
+                    COUNT(*) as total_interactions,
+                    COUNT(DISTINCT product_handle) as unique_products_viewed,
+                    SUM(CASE WHEN interaction_type = 'view' THEN 1 ELSE 0 END) as views,
+                    SUM(CASE WHEN interaction_type = 'add_to_cart' THEN 1 ELSE 0 END) as cart_adds,
+                    SUM(CASE WHEN interaction_type = 'wishlist' THEN 1 ELSE 0 END) as wishlist_adds,
+                    SUM(CASE WHEN interaction_type = 'purchase' THEN 1 ELSE 0 END) as purchases
+                FROM rec_user_interactions
+                WHERE user_id = $1
+            """, user_id)
+
+            result = dict(stats) if stats else {}
+            # SUM() is NULL for users without rows
+            result = {key: result.get(key) or 0 for key in (
+                'total_interactions', 'unique_products_viewed',
+                'views', 'cart_adds', 'wishlist_adds', 'purchases'
+            )}
+            logger.debug(f"User interaction stats - user={user_id} stats={result}")
+            return result
+
+    async def _get_user_recent_products(self, user_id: str, limit: int = 10) -> List[str]:
+        """Get user's most recently interacted products"""
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT product_handle, MAX(timestamp) as latest
+                FROM rec_user_interactions
+                WHERE user_id = $1
+                AND product_handle IS NOT NULL
+                GROUP BY product_handle
+                ORDER BY latest DESC
+                LIMIT $2
+            """, user_id, limit)
+
+            return [row['product_handle'] for row in rows]
+
+    async def _similar_to_cart_wishlist(self, user_id: str, limit: int) -> List[str]:
+        """Products sharing a category/collection with the latest cart/wishlist items"""
+        async with self.db_pool.acquire() as conn:
+            items = await conn.fetch("""
+                SELECT product_handle, MAX(timestamp) as latest
+                FROM rec_user_interactions
+                WHERE user_id = $1
+                AND interaction_type IN ('add_to_cart', 'wishlist')
+                AND product_handle IS NOT NULL
+                GROUP BY product_handle
+                ORDER BY latest DESC
+                LIMIT 5
+            """, user_id)
+
+        seeds = [item['product_handle'] for item in items]
+        handles = await self._similar_by_category(seeds, per_seed=2)
+        return handles[:limit]
+
+    async def _category_based_on_views(self, user_id: str, limit: int) -> List[str]:
+        """Unseen products from the user's two most viewed categories and collections"""
+        if self.engine.sampler.is_ready:
+            return await self._category_based_on_views_sampled(user_id, limit)
+
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                WITH viewed AS (
+                    SELECT p.id, p.collection_id
+                    FROM rec_user_interactions ui
+                    JOIN product p ON ui.product_handle = p.handle
+                    WHERE ui.user_id = $1
+                    AND ui.interaction_type = 'view'
+                ),
+                top_categories AS (
+                    SELECT pcp.product_category_id as group_id, COUNT(*) as view_count
+                    FROM viewed v
+                    JOIN product_category_product pcp ON v.id = pcp.product_id
+                    GROUP BY pcp.product_category_id
+                    ORDER BY view_count DESC
+                    LIMIT 2
+                ),
+                top_collections AS (
+                    SELECT collection_id as group_id, COUNT(*) as view_count
+                    FROM viewed
+                    WHERE collection_id IS NOT NULL
+                    GROUP BY collection_id
+                    ORDER BY view_count DESC
+                    LIMIT 2
+                ),
+                seen AS (
+                    SELECT DISTINCT product_handle
+                    FROM rec_user_interactions
+                    WHERE user_id = $1 AND product_handle IS NOT NULL
+                ),
+                candidates AS (
+                    SELECT 0 as kind, tc.group_id, p.handle
+                    FROM top_categories tc
+                    JOIN product_category_product pcp ON pcp.product_category_id = tc.group_id
+                    JOIN product p ON p.id = pcp.product_id
+                    WHERE p.status = 'published' AND p.deleted_at IS NULL
+                    UNION
+                    SELECT 1 as kind, tl.group_id, p.handle
+                    FROM top_collections tl
+                    JOIN product p ON p.collection_id = tl.group_id
+                    WHERE p.status = 'published' AND p.deleted_at IS NULL
+                )
+                SELECT kind, group_id, handle
+                FROM (
+                    SELECT kind, group_id, handle,
+                        ROW_NUMBER() OVER (PARTITION BY kind, group_id ORDER BY RANDOM()) as rn
+                    FROM candidates
+                    WHERE handle NOT IN (SELECT product_handle FROM seen)
+                ) ranked
+                WHERE rn <= 2
+                ORDER BY kind, group_id, rn
+            """, user_id)
+
+            return [row['handle'] for row in rows][:limit]
+
+    async def _category_based_on_views_sampled(self, user_id: str, limit: int) -> List[str]:
+        """Same strategy, with the per-group sampling done in memory"""
+        async with self.db_pool.acquire() as conn:
+            groups = await conn.fetch("""
+                WITH viewed AS (
+                    SELECT p.id, p.collection_id
+                    FROM rec_user_interactions ui
+                    JOIN product p ON ui.product_handle = p.handle
+                    WHERE ui.user_id = $1
+                    AND ui.interaction_type = 'view'
+                )
+                (
+                    SELECT 'category' as kind, pcp.product_category_id as group_id
+                    FROM viewed v
+                    JOIN product_category_product pcp ON v.id = pcp.product_id
+                    GROUP BY pcp.product_category_id
+                    ORDER BY COUNT(*) DESC
+                    LIMIT 2
+                )
+                UNION ALL
+                (
+                    SELECT 'collection' as kind, collection_id as group_id
+                    FROM viewed
+                    WHERE collection_id IS NOT NULL
+                    GROUP BY collection_id
+                    ORDER BY COUNT(*) DESC
+                    LIMIT 2
+                )
+            """, user_id)
+            seen = await conn.fetch("""
+                SELECT DISTINCT product_handle
+                FROM rec_user_interactions
+                WHERE user_id = $1 AND product_handle IS NOT NULL
+            """, user_id)
+
+        exclude = {row['product_handle'] for row in seen}
+        handles = []
+        for group in groups:
+            picked = self.engine.sampler.sample(2, [(group['kind'], group['group_id'])], exclude=exclude)
+            exclude.update(picked)
+            handles.extend(picked)
+        return handles[:limit]
+
+    async def _similar_to_recent(self, seeds: List[str], per_seed: int) -> List[str]:
+        """Pre-computed neighbours of recent products, category fallback for the rest"""
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT product_id_1 as seed, product_id_2 as handle
+                FROM (
+                    SELECT product_id_1, product_id_2,
+                        ROW_NUMBER() OVER (PARTITION BY product_id_1 ORDER BY similarity_score DESC) as rn
+                    FROM rec_product_similarities
+                    WHERE product_id_1 = ANY($1::text[])
+                ) ranked
+                WHERE rn <= $2
+            """, seeds, per_seed)
+
+        by_seed: Dict[str, List[str]] = {seed: [] for seed in seeds}
+        for row in rows:
+            by_seed[row['seed']].append(row['handle'])
+
+        missing = [seed for seed, handles in by_seed.items() if not handles]
+        if missing:
+            for seed, handle in await self._similar_by_category_rows(missing, per_seed):
+                by_seed[seed].append(handle)
+
+        return [handle for seed in seeds for handle in by_seed[seed]]
+
+    async def _similar_by_category(self, seeds: List[str], per_seed: int) -> List[str]:
+        rows = await self._similar_by_category_rows(seeds, per_seed)
+        order = {seed: i for i, seed in enumerate(seeds)}
+        rows.sort(key=lambda row: order[row[0]])
+        return [handle for _, handle in rows]
+
+    async def _similar_by_category_rows(self, seeds: List[str], per_seed: int) -> List[Tuple[str, str]]:
+        """Random same-category/collection products for many seeds in one query"""
+        if not seeds:
+            return []
+
+        sampler = self.engine.sampler
+        if sampler.is_ready:
+            return [
+                (seed, handle)
+                for seed in seeds
+                for handle in sampler.sample(per_seed, sampler.groups_of(seed), exclude={seed})
+            ]
+
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                WITH seed_info AS (
+                    SELECT p.handle as seed, pcp.product_category_id as category_id, p.collection_id
+                    FROM product p
+                    LEFT JOIN product_category_product pcp ON p.id = pcp.product_id
+                    WHERE p.handle = ANY($1::text[])
+                ),
+                candidates AS (
+                    SELECT si.seed, p.handle
+                    FROM seed_info si
+                    JOIN product_category_product pcp ON pcp.product_category_id = si.category_id
+                    JOIN product p ON p.id = pcp.product_id
+                    WHERE p.status = 'published' AND p.deleted_at IS NULL
+                    UNION
+                    SELECT si.seed, p.handle
+                    FROM seed_info si
+                    JOIN product p ON p.collection_id = si.collection_id
+                    WHERE p.status = 'published' AND p.deleted_at IS NULL
+                )
+                SELECT seed, handle
+                FROM (
+                    SELECT seed, handle,
+                        ROW_NUMBER() OVER (PARTITION BY seed ORDER BY RANDOM()) as rn
+                    FROM candidates
+                    WHERE handle != seed
+                ) ranked
+                WHERE rn <= $2
+            """, seeds, per_seed)
+
+            return [(row['seed'], row['handle']) for row in rows]
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+
+settings = get_settings()
+logger = get_rec_logger("candidate_pool")
+
+# Signals a pool can be re-ranked by (rec_product_stats interaction types)
+RANKING_SIGNALS = ['purchase', 'view', 'wishlist']
+
+
+class CandidatePool:
+    """Personalized candidates of one user plus their popularity signals"""
+
+    __slots__ = ('user_id', 'candidates', 'algorithm', 'signals', 'built_at')
+
+    def __init__(self, user_id: str, candidates: List[dict], algorithm: str,
+                 signals: Dict[str, Dict[str, int]]):
+        self.user_id = user_id
+        self.candidates = candidates
+        self.algorithm = algorithm
+        self.signals = signals
+        self.built_at = time.monotonic()
+
+    def head(self, limit: int) -> List[dict]:
+        """Candidates in pipeline order"""
+        return list(self.candidates[:limit])
+
+    def rank(self, signal: str, limit: int) -> List[dict]:
+        """Candidates re-ranked by one signal (stable, so ties keep pipeline order)"""
+        counts = self.signals.get(signal, {})
+        ranked = sorted(self.candidates, key=lambda x: counts.get(x['handle'], 0), reverse=True)
+        return ranked[:limit]
+
+
+Builder = Callable[[], Awaitable[CandidatePool]]
+
+
+class CandidatePoolCache:
+    """
+    Short-lived per-user memo of CandidatePool objects.
+
+    A storefront page rendering several personalized rails asks for the
+    same pool several times within a second; the first request builds it
+    and the others await the same task. Pools expire after
+    candidate_pool_ttl_seconds and are dropped when the user's
+    interactions are flushed.
+    """
+
+    def __init__(self):
+        self._pools: "OrderedDict[str, CandidatePool]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._generation: Dict[str, int] = {}
+        self.counters = {"hits": 0, "builds": 0, "coalesced": 0}
+
+    async def get(self, user_id: str, build: Builder) -> CandidatePool:
+        pool = self._pools.get(user_id)
+        if pool is not None:
+            if time.monotonic() - pool.built_at < settings.candidate_pool_ttl_seconds:
+                self._pools.move_to_end(user_id)
+                self.counters["hits"] += 1
+                return pool
+            del self._pools[user_id]
+
+        task = self._inflight.get(user_id)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            task = asyncio.create_task(self._build(user_id, build))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda t: self._inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    def invalidate_user(self, user_id: str):
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+        self._pools.pop(user_id, None)
+
+    async def _build(self, user_id: str, build: Builder) -> CandidatePool:
+        generation = self._generation.get(user_id, 0)
+        pool = await build()
+        self.counters["builds"] += 1
+        if self._generation.get(user_id, 0) == generation:
+            self._pools[user_id] = pool
+            while len(self._pools) > settings.candidate_pool_max_users:
+                self._pools.popitem(last=False)
+        return pool
+
+    def stats(self) -> dict:
+        return {**self.counters, "users": len(self._pools), "inflight": len(self._inflight)}
+
+
+@lru_cache()
+def get_candidate_pools() -> CandidatePoolCache:
+    """Process-wide candidate pool memo"""
+    return CandidatePoolCache()
@@ -0,0 +1,278 @@
+import asyncio
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.price_resolver import PriceResolver
+
+settings = get_settings()
+logger = get_rec_logger("catalog")
+
+# One row per product; category_ids and category_names are aggregated in the same
+# order so they stay aligned. Prices are loaded separately by the PriceResolver.
+CATALOG_QUERY = """
+    SELECT
+        p.id,
+        p.handle,
+        p.title,
+        p.thumbnail,
+        p.description,
+        p.collection_id,
+        pcol.title as collection_title,
+        p.status,
+        p.deleted_at,
+        COALESCE(
+            ARRAY_AGG(pc.id ORDER BY pc.id) FILTER (WHERE pc.id IS NOT NULL),
+            ARRAY[]::text[]
+        ) as category_ids,
+        COALESCE(
+            ARRAY_AGG(pc.name ORDER BY pc.id) FILTER (WHERE pc.id IS NOT NULL),
+            ARRAY[]::text[]
+        ) as category_names
+    FROM product p
+    LEFT JOIN product_category_product pcp ON p.id = pcp.product_id
+    LEFT JOIN product_category pc ON pcp.product_category_id = pc.id
+    LEFT JOIN product_collection pcol ON p.collection_id = pcol.id
+    WHERE {product_filter}
+    GROUP BY p.id, pcol.title
+"""
+
+CHANGED_PRODUCTS_QUERY = """
+    SELECT p.id FROM product p WHERE p.updated_at > $1
+    UNION
+    SELECT pv.product_id FROM product_variant pv WHERE pv.updated_at > $1
+    UNION
+    SELECT pv.product_id
+    FROM product_variant pv
+    JOIN product_variant_price_set pvps ON pv.id = pvps.variant_id
+    JOIN price pr ON pvps.price_set_id = pr.price_set_id
+    WHERE pr.updated_at > $1
+    UNION
+    SELECT pv.product_id
+    FROM product_variant pv
+    JOIN product_variant_price_set pvps ON pv.id = pvps.variant_id
+    JOIN price pr ON pvps.price_set_id = pr.price_set_id
+    JOIN price_rule prr ON prr.price_id = pr.id
+    WHERE prr.updated_at > $1
+"""
+
+
+class CatalogSnapshot:
+    """
+    In-process snapshot of the published catalog.
+
+    Product fields are kept in parallel lists addressed by a row index
+    (handle -> row), with the display prices per currency and region
+    resolved and formatted at load time (self.pricing). Hydrating a list of
+    handles is then a dict/list lookup instead of the product/variant/price
+    join. The snapshot is loaded at startup, refreshed incrementally from
+    updated_at watermarks and fully rebuilt every catalog_full_reload_seconds
+    (which also compacts rows of unpublished products).
+    """
+
+    def __init__(self):
+        self._reset()
+        self.loaded_at: Optional[datetime] = None
+        self.refreshed_at: Optional[datetime] = None
+        self.watermark: Optional[datetime] = None
+        self.last_refresh_ms: float = 0.0
+        self.refresh_count = 0
+        # Bumped by every full load, which renumbers the rows
+        self.generation = 0
+        self.pricing = PriceResolver()
+        self._task: Optional[asyncio.Task] = None
+
+    def _reset(self):
+        self.index: Dict[str, int] = {}
+        self.handles: List[str] = []
+        self.ids: List[str] = []
+        self.titles: List[str] = []
+        self.thumbnails: List[Optional[str]] = []
+        self.descriptions: List[Optional[str]] = []
+        self.category_ids: List[tuple] = []
+        self.category_names: List[tuple] = []
+        self.collection_ids: List[Optional[str]] = []
+        self.collection_titles: List[Optional[str]] = []
+        self.prices: List[Optional[dict]] = []
+        self.active: List[bool] = []
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    async def load(self, db_pool):
+        """Full (re)load of the published catalog"""
+        start = time.perf_counter()
+        async with db_pool.acquire() as conn:
+            watermark = await conn.fetchval("SELECT NOW()")
+            rows = await conn.fetch(CATALOG_QUERY.format(
+                product_filter="p.status = 'published' AND p.deleted_at IS NULL"
+            ))
+            await self.pricing.load(conn)
+
+        self._reset()
+        for row in rows:
+            self._upsert(row)
+
+        self.generation += 1
+        now = datetime.now()
+        self.loaded_at = self.refreshed_at = now
+        self.watermark = watermark
+        self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 2)
+        self.refresh_count += 1
+        logger.info(f"Catalog snapshot loaded - products={len(self)} time={self.last_refresh_ms}ms")
+
+    async def refresh(self, db_pool):
+        """Apply products, variants and prices changed since the last watermark, and new regions"""
+        if not self.is_loaded:
+            return await self.load(db_pool)
+
+        start = time.perf_counter()
+        async with db_pool.acquire() as conn:
+            watermark = await conn.fetchval("SELECT NOW()")
+            # Regions created since the full load (check_region rejects unknown ones)
+            added_regions = await self.pricing.load_regions(conn)
+            if added_regions:
+                await self.pricing.load_region_prices(conn, added_regions)
+            changed = await conn.fetch(CHANGED_PRODUCTS_QUERY, self.watermark)
+            changed_ids = [row['id'] for row in changed]
+            rows = []
+            if changed_ids:
+                rows = await conn.fetch(CATALOG_QUERY.format(
+                    product_filter="p.id = ANY($1::text[])"
+                ), changed_ids)
+                await self.pricing.load(conn, [row['handle'] for row in rows])
+
+        for row in rows:
+            if row['status'] == 'published' and row['deleted_at'] is None:
+                self._upsert(row)
+            else:
+                self._remove(row['handle'])
+
+        self.refreshed_at = datetime.now()
+        self.watermark = watermark
+        self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 2)
+        self.refresh_count += 1
+        if rows:
+            logger.info(f"Catalog snapshot refreshed - changed={len(rows)} products={len(self)}")
+
+    def _upsert(self, row):
+        handle = row['handle']
+        price = self.pricing.default.get(handle)
+
+        values = (
+            row['id'], row['title'], row['thumbnail'], row['description'],
+            tuple(row['category_ids']), tuple(row['category_names']),
+            row['collection_id'], row['collection_title'], price
+        )
+
+        i = self.index.get(handle)
+        if i is None:
+            i = len(self.handles)
+            self.index[handle] = i
+            self.handles.append(handle)
+            for column in self._columns():
+                column.append(None)
+            self.active.append(True)
+
+        for column, value in zip(self._columns(), values):
+            column[i] = value
+        self.active[i] = True
+
+    def _remove(self, handle: str):
+        i = self.index.pop(handle, None)
+        if i is not None:
+            self.active[i] = False
+
+    def _columns(self):
+        return (
+            self.ids, self.titles, self.thumbnails, self.descriptions,
+            self.category_ids, self.category_names,
+            self.collection_ids, self.collection_titles, self.prices
+        )
+
+    def product(self, i: int) -> dict:
+        """Product payload in the same shape as the SQL hydration"""
+        return self._product(i, self.prices[i])
+
+    def _product(self, i: int, price: Optional[dict]) -> dict:
+        product = {
+            'id': self.ids[i],
+            'handle': self.handles[i],
+            'title': self.titles[i],
+            'thumbnail': self.thumbnails[i],
+            'description': self.descriptions[i]
+        }
+        if price:
+            product['price'] = dict(price)
+        return product
+
+    def get_many(self, handles: Sequence[str], require_price: bool = True,
+                 region_id: Optional[str] = None, currency_code: Optional[str] = None) -> List[dict]:
+        """Hydrate handles in the given order, skipping unknown (and unpriced) products"""
+        localized = bool(region_id or currency_code)
+        result = []
+        for handle in handles:
+            i = self.index.get(handle)
+            if i is None:
+                continue
+            price = self.pricing.resolve(handle, region_id, currency_code) if localized else self.prices[i]
+            if require_price and not price:
+                continue
+            result.append(self._product(i, price))
+        return result
+
+    def stats(self) -> dict:
+        now = datetime.now()
+        return {
+            "loaded": self.is_loaded,
+            "products": len(self),
+            "rows": len(self.handles),
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            "age_seconds": round((now - self.refreshed_at).total_seconds(), 1) if self.refreshed_at else None,
+            "last_refresh_ms": self.last_refresh_ms,
+            "refresh_count": self.refresh_count,
+            "pricing": self.pricing.stats()
+        }
+
+    def start(self, db_pool):
+        """Start the background refresh loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop(db_pool))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self, db_pool):
+        while True:
+            await asyncio.sleep(settings.catalog_refresh_seconds)
+            try:
+                full_reload_due = (
+                    self.loaded_at is None or
+                    (datetime.now() - self.loaded_at).total_seconds() >= settings.catalog_full_reload_seconds
+                )
+                if full_reload_due:
+                    await self.load(db_pool)
+                else:
+                    await self.refresh(db_pool)
+            except Exception as e:
+                logger.error(f"Catalog snapshot refresh failed: {e}")
+
+
+@lru_cache()
+def get_catalog_snapshot() -> CatalogSnapshot:
+    """Process-wide catalog snapshot"""
+    return CatalogSnapshot()
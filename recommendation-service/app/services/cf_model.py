@@ -0,0 +1,347 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.preference_model import INTERACTION_WEIGHTS
+
+settings = get_settings()
+logger = get_rec_logger("cf_model")
+
+# Nonzeros per chunk when evaluating Yᵀ C_u Y x for all rows (bounds temporaries)
+CHUNK_NNZ = 1 << 18
+
+
+def _confidence_product(matrix: sp.csr_matrix, rows: np.ndarray, fixed: np.ndarray,
+                        x: np.ndarray, alpha: float) -> np.ndarray:
+    """Σ_i alpha * r_ui * y_i (y_i · x_u) for every row u, without forming f x f matrices"""
+    nnz = matrix.nnz
+    weighted = np.empty(nnz, dtype=np.float64)
+    for lo in range(0, nnz, CHUNK_NNZ):
+        hi = min(lo + CHUNK_NNZ, nnz)
+        weighted[lo:hi] = np.einsum('nf,nf->n', fixed[matrix.indices[lo:hi]], x[rows[lo:hi]])
+    weighted *= alpha * matrix.data
+    scaled = sp.csr_matrix((weighted, matrix.indices, matrix.indptr), shape=matrix.shape)
+    return scaled @ fixed
+
+
+def als_half_step(matrix: sp.csr_matrix, fixed: np.ndarray, x: np.ndarray, alpha: float,
+                  regularization: float, cg_steps: int = 3) -> np.ndarray:
+    """
+    Approximately solve the implicit-ALS normal equations for every row of
+    matrix against the fixed factors (Hu, Koren & Volinsky 2008):
+
+        (YᵀY + Yᵀ(Cu - I)Y + λI) x_u = Yᵀ Cu p(u),   Cu = 1 + alpha * r_u
+
+    with a few conjugate-gradient steps warm-started from the previous x
+    (Takács et al. 2011). All rows advance together: each step costs one
+    pass over the nonzeros plus a sparse @ dense product, O(nnz * f)
+    instead of O(nnz * f²) for forming the per-row matrices.
+    """
+    base = fixed.T @ fixed + regularization * np.eye(fixed.shape[1])
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    target = sp.csr_matrix((1.0 + alpha * matrix.data, matrix.indices, matrix.indptr),
+                           shape=matrix.shape) @ fixed
+
+    x = x.copy()
+    residual = target - x @ base - _confidence_product(matrix, rows, fixed, x, alpha)
+    direction = residual.copy()
+    rs_old = np.einsum('uf,uf->u', residual, residual)
+    for _ in range(cg_steps):
+        product = direction @ base + _confidence_product(matrix, rows, fixed, direction, alpha)
+        denom = np.einsum('uf,uf->u', direction, product)
+        step = np.divide(rs_old, denom, out=np.zeros_like(rs_old), where=denom > 1e-20)
+        x += step[:, None] * direction
+        residual -= step[:, None] * product
+        rs_new = np.einsum('uf,uf->u', residual, residual)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 1e-20)
+        direction = residual + beta[:, None] * direction
+        rs_old = rs_new
+    return x
+
+
+def train_als(matrix: sp.csr_matrix, factors: int, iterations: int, alpha: float,
+              regularization: float, cg_steps: int = 3, seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """Alternate user and item solves; returns float32 (user_factors, item_factors)"""
+    rng = np.random.default_rng(seed)
+    matrix = matrix.tocsr()
+    matrix.sort_indices()
+    transposed = matrix.T.tocsr()
+    users = rng.normal(0.0, 0.01, (matrix.shape[0], factors))
+    items = rng.normal(0.0, 0.01, (matrix.shape[1], factors))
+    for _ in range(iterations):
+        users = als_half_step(matrix, items, users, alpha, regularization, cg_steps)
+        items = als_half_step(transposed, users, items, alpha, regularization, cg_steps)
+    return users.astype(np.float32), items.astype(np.float32)
+
+
+def top_k(scores: np.ndarray, k: int, exclude: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of the k highest scores, best first (argpartition + sort of k)"""
+    if exclude is not None and exclude.size:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+    k = min(k, scores.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return candidates[np.isfinite(scores[candidates])]
+
+
+class CFTrainer:
+    """
+    Offline trainer for the implicit-feedback collaborative filtering model.
+
+    Interactions are aggregated in SQL into one weighted (user, item) value
+    (purchase 5, add_to_cart 3, wishlist 2, view 1), assembled into a CSR
+    matrix and factorized with ALS. The factors, id maps and the user->item
+    matrix used for exclusions are written as .npy files into a new version
+    directory that settings.cf_model_dir is atomically repointed at.
+    """
+
+    def __init__(self, db_pool, factors: int = None, iterations: int = None):
+        self.db_pool = db_pool
+        self.factors = factors or settings.cf_factors
+        self.iterations = iterations or settings.cf_iterations
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        users, items, matrix = await self._load_matrix()
+        if matrix.nnz == 0:
+            logger.warning("CF training skipped - no interactions")
+            return {"users": 0, "items": 0, "interactions": 0}
+
+        loop = asyncio.get_event_loop()
+        train_start = time.perf_counter()
+        user_factors, item_factors = await loop.run_in_executor(
+            None, train_als, matrix, self.factors, self.iterations,
+            settings.cf_alpha, settings.cf_regularization, settings.cf_cg_steps
+        )
+        train_ms = round((time.perf_counter() - train_start) * 1000, 2)
+
+        save_model(settings.cf_model_dir, users, items, user_factors, item_factors, matrix, {
+            "factors": self.factors,
+            "iterations": self.iterations,
+            "alpha": settings.cf_alpha,
+            "regularization": settings.cf_regularization,
+            "cg_steps": settings.cf_cg_steps,
+            "trained_at": datetime.now().isoformat(),
+            "train_ms": train_ms
+        })
+        result = {
+            "users": len(users),
+            "items": len(items),
+            "interactions": int(matrix.nnz),
+            "train_ms": train_ms,
+            "total_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+        logger.info(f"CF model trained - {result}")
+        return result
+
+    async def _load_matrix(self) -> Tuple[List[str], List[str], sp.csr_matrix]:
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT user_id, product_handle, SUM(
+                    CASE interaction_type
+                        WHEN 'purchase' THEN $1::float
+                        WHEN 'add_to_cart' THEN $2::float
+                        WHEN 'wishlist' THEN $3::float
+                        ELSE $4::float
+                    END
+                ) as weight
+                FROM rec_user_interactions
+                WHERE product_handle IS NOT NULL
+                AND interaction_type = ANY($5::text[])
+                AND timestamp > NOW() - make_interval(days => $6)
+                GROUP BY user_id, product_handle
+            """, INTERACTION_WEIGHTS['purchase'], INTERACTION_WEIGHTS['add_to_cart'],
+                INTERACTION_WEIGHTS['wishlist'], INTERACTION_WEIGHTS['view'],
+                list(INTERACTION_WEIGHTS), settings.cf_lookback_days)
+
+        user_ids: Dict[str, int] = {}
+        item_ids: Dict[str, int] = {}
+        row_idx = np.fromiter((user_ids.setdefault(r['user_id'], len(user_ids)) for r in rows),
+                              dtype=np.int32, count=len(rows))
+        col_idx = np.fromiter((item_ids.setdefault(r['product_handle'], len(item_ids)) for r in rows),
+                              dtype=np.int32, count=len(rows))
+        weights = np.fromiter((r['weight'] for r in rows), dtype=np.float64, count=len(rows))
+        matrix = sp.csr_matrix((weights, (row_idx, col_idx)), shape=(len(user_ids), len(item_ids)))
+        # log scaling keeps heavy viewers from dominating the confidence
+        matrix.data = np.log1p(matrix.data)
+        return list(user_ids), list(item_ids), matrix
+
+
+def save_model(path: str, users: List[str], items: List[str], user_factors: np.ndarray,
+               item_factors: np.ndarray, matrix: sp.csr_matrix, meta: dict):
+    """
+    Write a new model version and atomically repoint path at it.
+
+    path is a symlink into {path}.versions/; the new link is created next to
+    it and renamed over it, so readers always find a complete model. The
+    previous version is kept for workers still mapping it.
+    """
+    versions = f"{path}.versions"
+    version = os.path.join(versions, f"{datetime.now():%Y%m%d%H%M%S%f}-{os.getpid()}")
+    os.makedirs(version)
+    np.save(os.path.join(version, "user_factors.npy"), user_factors)
+    np.save(os.path.join(version, "item_factors.npy"), item_factors)
+    np.save(os.path.join(version, "user_items_indptr.npy"), matrix.indptr.astype(np.int64))
+    np.save(os.path.join(version, "user_items_indices.npy"), matrix.indices.astype(np.int32))
+    with open(os.path.join(version, "ids.json"), "w") as f:
+        json.dump({"users": users, "items": items}, f)
+    with open(os.path.join(version, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        # Directory written before versioning: move it under versions/ once
+        os.replace(path, os.path.join(versions, "legacy"))
+    link = f"{path}.link-{os.getpid()}"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.relpath(version, os.path.dirname(os.path.abspath(path))), link)
+    os.replace(link, path)
+
+    saved = sorted((os.path.join(versions, name) for name in os.listdir(versions)), key=os.path.getmtime)
+    for old in saved[:-2]:
+        if old != version:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+class CFSnapshot:
+    """One loaded model version; never modified after construction"""
+
+    __slots__ = ('user_factors', 'item_factors', 'indptr', 'indices', 'user_index', 'item_index',
+                 'items', 'meta', 'version')
+
+    def __init__(self, directory: str, version: tuple):
+        mmap = lambda name: np.load(os.path.join(directory, name), mmap_mode='r')
+        with open(os.path.join(directory, "ids.json")) as f:
+            ids = json.load(f)
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta: dict = json.load(f)
+        self.user_factors: np.ndarray = mmap("user_factors.npy")
+        self.item_factors: np.ndarray = mmap("item_factors.npy")
+        self.indptr: np.ndarray = mmap("user_items_indptr.npy")
+        self.indices: np.ndarray = mmap("user_items_indices.npy")
+        self.user_index: Dict[str, int] = {u: i for i, u in enumerate(ids["users"])}
+        self.items: List[str] = ids["items"]
+        self.item_index: Dict[str, int] = {h: i for i, h in enumerate(self.items)}
+        self.version = version
+
+
+class CFModel:
+    """
+    Serving side of the CF model.
+
+    Factor arrays are memory-mapped (np.load mmap_mode='r'), so several
+    worker processes share one copy through the page cache. A query is one
+    (items x factors) @ (factors,) product plus argpartition top-K, with
+    the user's own items excluded. Every worker checks the model directory
+    every cf_reload_check_seconds and reloads when a new version was saved
+    (by itself or another worker). A reload builds a new CFSnapshot and
+    swaps it in with one assignment, so a query never mixes two versions.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.cf_model_dir
+        self.snapshot: Optional[CFSnapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.snapshot is not None
+
+    @property
+    def version(self) -> Optional[tuple]:
+        snapshot = self.snapshot
+        return snapshot.version if snapshot else None
+
+    def _current_version(self) -> Optional[tuple]:
+        """(directory, meta.json mtime) that path currently points at"""
+        directory = os.path.realpath(self.path)
+        try:
+            return directory, os.stat(os.path.join(directory, "meta.json")).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> bool:
+        """(Re)load the model directory; returns False when there is no model yet"""
+        version = self._current_version()
+        if version is None:
+            return False
+        # Read every file from the resolved version, even if path is repointed meanwhile
+        snapshot = CFSnapshot(version[0], version)
+        self.snapshot = snapshot
+        logger.info(f"CF model loaded - users={len(snapshot.user_index)} items={len(snapshot.items)}")
+        return True
+
+    def start(self):
+        """Start the periodic check for model versions saved by any worker"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _reload_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(settings.cf_reload_check_seconds)
+            try:
+                version = self._current_version()
+                if version is not None and version != self.version:
+                    await loop.run_in_executor(None, self.load)
+            except Exception as e:
+                logger.error(f"CF model reload failed: {e}")
+
+    def has_user(self, user_id: str) -> bool:
+        snapshot = self.snapshot
+        return snapshot is not None and user_id in snapshot.user_index
+
+    def recommend(self, user_id: str, k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """Top-k (handle, score) for a known user, excluding items they already interacted with"""
+        model = self.snapshot
+        if model is None:
+            return []
+        u = model.user_index.get(user_id)
+        if u is None:
+            return []
+        scores = model.item_factors @ model.user_factors[u]
+        seen = np.asarray(model.indices[model.indptr[u]:model.indptr[u + 1]], dtype=np.int64)
+        extra = [i for i in (model.item_index.get(h) for h in exclude) if i is not None]
+        if extra:
+            seen = np.concatenate([seen, np.asarray(extra, dtype=np.int64)])
+        best = top_k(scores, k, seen)
+        return [(model.items[i], float(scores[i])) for i in best.tolist()]
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"loaded": False, "users": 0, "items": 0}
+        return {
+            "loaded": True,
+            "users": len(snapshot.user_index),
+            "items": len(snapshot.items),
+            **snapshot.meta
+        }
+
+
+@lru_cache()
+def get_cf_model() -> CFModel:
+    """Process-wide CF model"""
+    return CFModel()
@@ -0,0 +1,156 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.bulk_writer import BulkWriter
+
+settings = get_settings()
+logger = get_rec_logger("fbt_miner")
+
+BASKET_INTERACTIONS = ['purchase', 'add_to_cart']
+
+
+class FrequentlyTogetherMiner:
+    """
+    Batch miner for rec_frequently_together.
+
+    Baskets are the purchase/add_to_cart handles of one session (or of the
+    user when no session is recorded). Interactions are streamed through a
+    server-side cursor ordered by basket, so only the current basket is held
+    in Python. Pair co-occurrences are accumulated as packed int64 pair ids
+    and periodically reduced with np.unique, which keeps memory proportional
+    to the number of distinct pairs rather than the number of events.
+    """
+
+    def __init__(self, db_pool, min_support: int = None, top_k: int = None,
+                 lookback_days: int = None, max_basket_size: int = None):
+        self.db_pool = db_pool
+        self.min_support = min_support or settings.fbt_min_support
+        self.top_k = top_k or settings.fbt_top_k
+        self.lookback_days = lookback_days or settings.fbt_lookback_days
+        self.max_basket_size = max_basket_size or settings.fbt_max_basket_size
+        self.chunk_size = settings.fbt_chunk_size
+
+    async def run(self) -> dict:
+        """Mine baskets, score pairs and bulk-load the result"""
+        item_ids, item_counts, pair_keys, pair_counts, baskets = await self._count_baskets()
+        handles = sorted(item_ids, key=item_ids.get)
+        records = self._score_pairs(handles, item_counts, pair_keys, pair_counts, baskets)
+
+        stored = await BulkWriter(self.db_pool).write_frequently_together(
+            records,
+            columns=("product_id_1", "product_id_2", "co_occurrence_count",
+                     "confidence_score", "support", "lift"),
+            replace=True
+        )
+
+        logger.info(
+            f"Frequently-together mined - baskets={baskets} products={len(handles)} "
+            f"pairs={len(pair_keys)} stored={stored}"
+        )
+        return {"baskets": baskets, "products": len(handles), "pairs_stored": stored}
+
+    async def _count_baskets(self) -> Tuple[Dict[str, int], np.ndarray, np.ndarray, np.ndarray, int]:
+        item_ids: Dict[str, int] = {}
+        item_counts: List[int] = []
+        pair_keys = np.empty(0, dtype=np.int64)
+        pair_counts = np.empty(0, dtype=np.int64)
+        pending: List[np.ndarray] = []
+        pending_size = 0
+        baskets = 0
+
+        current_key = None
+        current_items: set = set()
+
+        def close_basket():
+            nonlocal baskets, pending_size
+            if not current_items:
+                return
+            baskets += 1
+            ids = np.fromiter(
+                (item_ids.setdefault(h, len(item_ids)) for h in current_items),
+                dtype=np.int64, count=len(current_items)
+            )
+            item_counts.extend([0] * (len(item_ids) - len(item_counts)))
+            for i in ids.tolist():
+                item_counts[i] += 1
+            if ids.size < 2:
+                return
+            ids.sort()
+            left, right = np.triu_indices(ids.size, k=1)
+            pending.append((ids[left] << 32) | ids[right])
+            pending_size += left.size
+
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = conn.cursor("""
+                    SELECT COALESCE(session_id, user_id) as basket_key, product_handle
+                    FROM rec_user_interactions
+                    WHERE interaction_type = ANY($1::text[])
+                    AND product_handle IS NOT NULL
+                    AND timestamp > NOW() - make_interval(days => $2)
+                    ORDER BY basket_key
+                """, BASKET_INTERACTIONS, self.lookback_days, prefetch=self.chunk_size)
+
+                async for row in cursor:
+                    if row['basket_key'] != current_key:
+                        close_basket()
+                        current_key = row['basket_key']
+                        current_items = set()
+                    if len(current_items) < self.max_basket_size:
+                        current_items.add(row['product_handle'])
+
+                    if pending_size >= self.chunk_size:
+                        pair_keys, pair_counts = self._merge_counts(pair_keys, pair_counts, pending)
+                        pending, pending_size = [], 0
+
+                close_basket()
+
+        pair_keys, pair_counts = self._merge_counts(pair_keys, pair_counts, pending)
+        return item_ids, np.asarray(item_counts, dtype=np.int64), pair_keys, pair_counts, baskets
+
+    @staticmethod
+    def _merge_counts(keys: np.ndarray, counts: np.ndarray, pending: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Fold pending pair ids into the running (sorted keys, counts) arrays"""
+        if not pending:
+            return keys, counts
+        new_keys, new_counts = np.unique(np.concatenate(pending), return_counts=True)
+        all_keys = np.concatenate([keys, new_keys])
+        all_counts = np.concatenate([counts, new_counts])
+        merged_keys, inverse = np.unique(all_keys, return_inverse=True)
+        return merged_keys, np.bincount(inverse, weights=all_counts).astype(np.int64)
+
+    def _score_pairs(self, handles: List[str], item_counts: np.ndarray, pair_keys: np.ndarray,
+                     pair_counts: np.ndarray, baskets: int) -> List[tuple]:
+        """Support / confidence / lift for both directions, top-K per antecedent"""
+        keep = pair_counts >= self.min_support
+        pair_keys, pair_counts = pair_keys[keep], pair_counts[keep]
+        if pair_keys.size == 0:
+            return []
+
+        left = pair_keys >> 32
+        right = pair_keys & 0xFFFFFFFF
+
+        # Emit a -> b and b -> a; confidence is directional, support and lift are not
+        src = np.concatenate([left, right])
+        dst = np.concatenate([right, left])
+        counts = np.concatenate([pair_counts, pair_counts]).astype(np.float64)
+        support = counts / baskets
+        confidence = counts / item_counts[src]
+        lift = confidence / (item_counts[dst] / baskets)
+
+        order = np.lexsort((-confidence, src))
+        src, dst, counts = src[order], dst[order], counts[order]
+        support, confidence, lift = support[order], confidence[order], lift[order]
+        rank = np.arange(src.size) - np.searchsorted(src, src, side='left')
+        keep = rank < self.top_k
+
+        return [
+            (handles[s], handles[d], int(c), float(conf), float(sup), float(lf))
+            for s, d, c, conf, sup, lf in zip(
+                src[keep].tolist(), dst[keep].tolist(), counts[keep].tolist(),
+                confidence[keep].tolist(), support[keep].tolist(), lift[keep].tolist()
+            )
+        ]
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.interaction_tracker import InteractionTracker, PREFERENCE_INTERACTIONS
+from app.services.recommendation_cache import get_recommendation_cache
+from app.services.candidate_pool import get_candidate_pools
+from app.services.materializer import invalidate_materialized
+
+settings = get_settings()
+logger = get_rec_logger("ingestion")
+
+
+class IngestionBackpressure(Exception):
+    """Raised when the buffer stays full for longer than ingest_enqueue_timeout_seconds"""
+
+
+class IngestionPipeline:
+    """
+    Buffered ingestion for /track.
+
+    Events are appended to a bounded in-memory queue and acknowledged
+    immediately. A background flusher drains the queue in batches of up to
+    ingest_batch_size (or every ingest_flush_interval_seconds) and writes
+    them with one COPY. Preference recomputes are debounced: a user touched
+    by a flushed batch keeps its events pending and they are folded into
+    the preference model at most once per preference_debounce_seconds
+    (a failed update keeps them pending for the next round). When the
+    queue is full, enqueue waits briefly and then raises
+    IngestionBackpressure.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._db_pool = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._preference_worker: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._pending_preferences: Dict[str, List[tuple]] = {}
+        self._last_preference_update: Dict[str, float] = {}
+        self.counters = {
+            "enqueued": 0, "written": 0, "rejected": 0, "dropped": 0,
+            "batches": 0, "preference_updates": 0
+        }
+        self.last_flush_ms = 0.0
+
+    def start(self, db_pool):
+        self._db_pool = db_pool
+        self._queue = asyncio.Queue(maxsize=settings.ingest_queue_max)
+        self._stopping = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._preference_worker = asyncio.create_task(self._preference_loop())
+
+    async def stop(self):
+        """Stop the workers, write whatever is still buffered and apply pending preference updates"""
+        # The workers finish the batch they hold (cancelling them would lose it)
+        if self._stopping is not None:
+            self._stopping.set()
+        for task in (self._flusher, self._preference_worker):
+            if task:
+                await task
+        if self._queue is not None:
+            while not self._queue.empty():
+                await self._flush(self._drain_nowait(settings.ingest_batch_size))
+        if self._pending_preferences:
+            await self._update_preferences(list(self._pending_preferences))
+
+    async def enqueue(self, user_id: str, session_id: Optional[str], product_id: Optional[str],
+                      product_handle: Optional[str], interaction_type: str, metadata: Optional[dict]) -> str:
+        """Buffer one interaction and return its id"""
+        interaction_id = f"int_{uuid.uuid4().hex}"
+        event = (interaction_id, user_id, session_id, product_id, product_handle,
+                 interaction_type, json.dumps(metadata or {}), datetime.now())
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(event), settings.ingest_enqueue_timeout_seconds)
+            except asyncio.TimeoutError:
+                self.counters["rejected"] += 1
+                raise IngestionBackpressure("Interaction buffer is full")
+        self.counters["enqueued"] += 1
+        return interaction_id
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": settings.ingest_queue_max,
+            "pending_preference_users": len(self._pending_preferences),
+            "last_flush_ms": self.last_flush_ms
+        }
+
+    async def _flush_loop(self):
+        while True:
+            first = await self._next_event()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + settings.ingest_flush_interval_seconds
+            while len(batch) < settings.ingest_batch_size:
+                batch.extend(self._drain_nowait(settings.ingest_batch_size - len(batch)))
+                remaining = deadline - time.monotonic()
+                if len(batch) >= settings.ingest_batch_size or remaining <= 0 or self._stopping.is_set():
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _next_event(self) -> Optional[tuple]:
+        """Wait for the next buffered event, or None once stop() was called"""
+        if self._stopping.is_set():
+            return None
+        get = asyncio.create_task(self._queue.get())
+        stopping = asyncio.create_task(self._stopping.wait())
+        done, pending = await asyncio.wait({get, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return get.result() if get in done else None
+
+    def _drain_nowait(self, limit: int) -> List[tuple]:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    async def _flush(self, batch: List[tuple]):
+        if not batch:
+            return
+        start = time.perf_counter()
+        tracker = InteractionTracker(self._db_pool)
+        for attempt in range(3):
+            try:
+                await tracker.write_batch(batch)
+                break
+            except Exception as e:
+                logger.error(f"Interaction batch write failed - size={len(batch)} attempt={attempt + 1}: {e}")
+                if attempt < 2:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        else:
+            self.counters["dropped"] += len(batch)
+            return
+
+        self.counters["written"] += len(batch)
+        self.counters["batches"] += 1
+        self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+
+        users = {event[1] for event in batch}
+        for event in batch:
+            if event[5] in PREFERENCE_INTERACTIONS:
+                self._pending_preferences.setdefault(event[1], []).append(event)
+        cache = get_recommendation_cache()
+        pools = get_candidate_pools()
+        for user_id in users:
+            pools.invalidate_user(user_id)
+            await cache.invalidate_user(user_id)
+        try:
+            await invalidate_materialized(self._db_pool, users)
+        except Exception as e:
+            logger.error(f"Materialized list invalidation failed - users={len(users)}: {e}")
+
+    async def _preference_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), 1.0)
+                return
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            window = settings.preference_debounce_seconds
+            due = [u for u in self._pending_preferences
+                   if now - self._last_preference_update.get(u, 0.0) >= window]
+            if due:
+                for user_id in due:
+                    self._last_preference_update[user_id] = now
+                await self._update_preferences(due)
+
+            # Forget users whose window has passed so the map stays small
+            self._last_preference_update = {
+                u: t for u, t in self._last_preference_update.items() if now - t < window
+            }
+
+    async def _update_preferences(self, user_ids: List[str]):
+        taken = {u: self._pending_preferences.pop(u) for u in user_ids if u in self._pending_preferences}
+        events = [event for user_events in taken.values() for event in user_events]
+        try:
+            await InteractionTracker(self._db_pool).apply_interactions(events)
+            self.counters["preference_updates"] += len(user_ids)
+        except Exception as e:
+            logger.error(f"Preference update failed - users={len(user_ids)}: {e}")
+            # Put the events back ahead of any that arrived meanwhile, so they are retried
+            for user_id, user_events in taken.items():
+                self._pending_preferences[user_id] = user_events + self._pending_preferences.get(user_id, [])
+
+
+@lru_cache()
+def get_ingestion_pipeline() -> IngestionPipeline:
+    """Process-wide ingestion pipeline"""
+    return IngestionPipeline()
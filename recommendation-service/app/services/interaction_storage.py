@@ -0,0 +1,299 @@
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+
+settings = get_settings()
+logger = get_rec_logger("interaction_storage")
+
+TABLE = "rec_user_interactions"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Composite indexes matching the engine's access paths (also in database/init_schema.sql):
+# per-user profile/recent/cart lookups, product -> users joins, and per-type time windows
+INTERACTION_INDEXES = [
+    ("idx_rec_interactions_user_time",
+     "(user_id, timestamp DESC) INCLUDE (product_handle, interaction_type)"),
+    ("idx_rec_interactions_product_type",
+     "(product_handle, interaction_type) INCLUDE (user_id)"),
+    ("idx_rec_interactions_type_time",
+     "(interaction_type, timestamp DESC) INCLUDE (product_handle)"),
+    ("idx_rec_interactions_timestamp", "(timestamp DESC)"),
+    ("idx_rec_interactions_created_at", "(created_at)"),
+]
+
+# Compaction target for raw events older than interaction_retention_days. Every
+# statement covers whole days (a monthly partition or one day of the default
+# partition), so users is the exact distinct count of the day. Rows arriving
+# later for an already compacted day keep the larger of the two counts (a lower
+# bound) instead of adding overlapping users twice.
+DAILY_ROLLUP = """
+    INSERT INTO rec_interaction_daily (day, product_handle, interaction_type, events, users)
+    SELECT timestamp::date, COALESCE(product_handle, ''), interaction_type,
+           COUNT(*), COUNT(DISTINCT user_id)
+    FROM {source}
+    WHERE timestamp >= $1 AND timestamp < $2
+    GROUP BY 1, 2, 3
+    ON CONFLICT (day, product_handle, interaction_type)
+    DO UPDATE SET
+        events = rec_interaction_daily.events + EXCLUDED.events,
+        users = GREATEST(rec_interaction_daily.users, EXCLUDED.users)
+"""
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Inverse of partition_name (None for the default or foreign partitions)"""
+    try:
+        return datetime.strptime(name[len(TABLE) + 1:], "%Y_%m").date()
+    except ValueError:
+        return None
+
+
+class InteractionStorage:
+    """
+    Monthly range partitions of rec_user_interactions and their retention.
+
+    Partitions are named rec_user_interactions_YYYY_MM and created
+    interaction_partitions_ahead months in advance; rows that land in the
+    default partition (no monthly partition yet) are moved when their month
+    is created. Months older than interaction_retention_days are folded into
+    rec_interaction_daily and then detached and dropped, which costs a
+    catalog update instead of a DELETE plus vacuum of the raw rows.
+    migrate() converts an unpartitioned table online; compaction only runs
+    once the table is partitioned, from the schedule or the admin endpoint
+    (never at startup).
+    """
+
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+        self._task: Optional[asyncio.Task] = None
+
+    async def is_partitioned(self, conn) -> bool:
+        return await conn.fetchval("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass($1)
+            )
+        """, TABLE)
+
+    async def partitions(self, conn, parent: str = TABLE) -> List[str]:
+        rows = await conn.fetch("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass($1)
+            ORDER BY c.relname
+        """, parent)
+        return [row['relname'] for row in rows]
+
+    async def ensure_partitions(self, since: Optional[date] = None) -> List[str]:
+        """Create the monthly partitions from `since` (default: this month) to the look-ahead"""
+        first = month_start(since or date.today())
+        last = add_months(month_start(date.today()), settings.interaction_partitions_ahead)
+        created = []
+        async with self.db_pool.acquire() as conn:
+            if not await self.is_partitioned(conn):
+                return created
+            existing = set(await self.partitions(conn))
+            month = first
+            while month <= last:
+                if partition_name(month) not in existing:
+                    await self._create_partition(conn, TABLE, month)
+                    created.append(partition_name(month))
+                month = add_months(month, 1)
+        if created:
+            logger.info(f"Interaction partitions created - {created}")
+        return created
+
+    async def _create_partition(self, conn, parent: str, month: date):
+        """Create one month, moving its rows out of the default partition first"""
+        name = partition_name(month)
+        bounds = (datetime.combine(month, datetime.min.time()),
+                  datetime.combine(add_months(month, 1), datetime.min.time()))
+        async with conn.transaction():
+            await conn.execute(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)")
+            if f"{parent}_default" in await self.partitions(conn, parent):
+                await conn.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM {parent}_default
+                        WHERE timestamp >= $1 AND timestamp < $2
+                        RETURNING *
+                    )
+                    INSERT INTO {name} SELECT * FROM moved
+                """, *bounds)
+            await conn.execute(f"""
+                ALTER TABLE {parent} ATTACH PARTITION {name}
+                FOR VALUES FROM ('{bounds[0]:%Y-%m-%d}') TO ('{bounds[1]:%Y-%m-%d}')
+            """)
+
+    async def compact(self) -> dict:
+        """Fold raw events older than the retention window into rec_interaction_daily"""
+        start = time.perf_counter()
+        cutoff = month_start(date.today() - timedelta(days=settings.interaction_retention_days))
+        cutoff_ts = datetime.combine(cutoff, datetime.min.time())
+        dropped, deleted = [], 0
+        async with self.db_pool.acquire() as conn:
+            if not await self.is_partitioned(conn):
+                # Deleting from the unpartitioned heap is what the migration avoids
+                return {"compacted": False, "reason": "not partitioned, run the migration first"}
+            for name in await self.partitions(conn):
+                month = partition_month(name)
+                if month is None or add_months(month, 1) > cutoff:
+                    continue
+                async with conn.transaction():
+                    await conn.execute(DAILY_ROLLUP.format(source=name), datetime.min, cutoff_ts)
+                    await conn.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+                    await conn.execute(f"DROP TABLE {name}")
+                dropped.append(name)
+            source = DEFAULT_PARTITION if DEFAULT_PARTITION in await self.partitions(conn) else None
+
+            if source:
+                # Old rows outside monthly partitions: aggregate and delete a day at a time
+                while True:
+                    oldest = await conn.fetchval(
+                        f"SELECT MIN(timestamp) FROM {source} WHERE timestamp < $1", cutoff_ts)
+                    if oldest is None:
+                        break
+                    day = datetime.combine(oldest.date(), datetime.min.time())
+                    following = min(day + timedelta(days=1), cutoff_ts)
+                    async with conn.transaction():
+                        await conn.execute(DAILY_ROLLUP.format(source=source), day, following)
+                        status = await conn.execute(
+                            f"DELETE FROM {source} WHERE timestamp >= $1 AND timestamp < $2", day, following)
+                    deleted += int(status.split()[-1])
+
+        result = {
+            "compacted": True,
+            "cutoff": cutoff.isoformat(),
+            "partitions_dropped": dropped,
+            "rows_deleted": deleted,
+            "time_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+        logger.info(f"Interaction compaction complete - {result}")
+        return result
+
+    async def migrate(self, drop_legacy: bool = False) -> dict:
+        """
+        Convert an unpartitioned rec_user_interactions into monthly partitions.
+
+        Rows are copied a month at a time into a new partitioned table while
+        the service keeps writing to the old one. The final step locks the
+        old table against writes, copies rows created since the copy started
+        and swaps the names in one transaction. The old table is kept as
+        rec_user_interactions_legacy unless drop_legacy is set.
+        """
+        start = time.perf_counter()
+        staging = f"{TABLE}_partitioned"
+        legacy = f"{TABLE}_legacy"
+        async with self.db_pool.acquire() as conn:
+            if await self.is_partitioned(conn):
+                return {"migrated": False, "reason": "already partitioned"}
+
+            bounds = await conn.fetchrow(f"SELECT MIN(timestamp) as low, MAX(created_at) as watermark FROM {TABLE}")
+            first = month_start(bounds['low'].date() if bounds['low'] else date.today())
+            watermark = bounds['watermark'] or datetime.min
+
+            # Free the canonical index names for the new table
+            indexes = await conn.fetch("""
+                SELECT indexname FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = $1
+                AND indexname NOT LIKE '%\\_legacy'
+            """, TABLE)
+            async with conn.transaction():
+                for row in indexes:
+                    await conn.execute(f"ALTER INDEX {row['indexname']} RENAME TO {row['indexname']}_legacy")
+
+            await conn.execute(f"DROP TABLE IF EXISTS {staging} CASCADE")
+            await conn.execute(f"""
+                CREATE TABLE {staging} (LIKE {TABLE} INCLUDING DEFAULTS)
+                PARTITION BY RANGE (timestamp)
+            """)
+            await conn.execute(f"ALTER TABLE {staging} ADD PRIMARY KEY (id, timestamp)")
+            await conn.execute(f"CREATE TABLE {staging}_default PARTITION OF {staging} DEFAULT")
+            for name, definition in INTERACTION_INDEXES:
+                await conn.execute(f"CREATE INDEX {name} ON {staging} {definition}")
+
+            month = first
+            last = add_months(month_start(date.today()), settings.interaction_partitions_ahead)
+            copied = 0
+            while month <= last:
+                await self._create_partition(conn, staging, month)
+                status = await conn.execute(f"""
+                    INSERT INTO {staging}
+                    SELECT * FROM {TABLE}
+                    WHERE timestamp >= $1 AND timestamp < $2
+                    ON CONFLICT DO NOTHING
+                """, datetime.combine(month, datetime.min.time()),
+                    datetime.combine(add_months(month, 1), datetime.min.time()))
+                copied += int(status.split()[-1])
+                logger.info(f"Interaction migration - {partition_name(month)} copied, total={copied}")
+                month = add_months(month, 1)
+
+            # The partition names now belong to the staging table; swap under a write lock
+            async with conn.transaction():
+                await conn.execute(f"LOCK TABLE {TABLE} IN SHARE ROW EXCLUSIVE MODE")
+                status = await conn.execute(f"""
+                    INSERT INTO {staging}
+                    SELECT * FROM {TABLE}
+                    WHERE created_at > $1 - make_interval(secs => $2::int)
+                    ON CONFLICT DO NOTHING
+                """, watermark, settings.interaction_migration_lag_seconds)
+                caught_up = int(status.split()[-1])
+                await conn.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+                await conn.execute(f"ALTER TABLE {staging} RENAME TO {TABLE}")
+                await conn.execute(f"ALTER TABLE {staging}_default RENAME TO {DEFAULT_PARTITION}")
+                await conn.execute(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {staging}_pkey TO {TABLE}_pkey")
+            if drop_legacy:
+                await conn.execute(f"DROP TABLE {legacy}")
+
+        result = {
+            "migrated": True,
+            "rows": copied + caught_up,
+            "caught_up": caught_up,
+            "legacy_table": None if drop_legacy else legacy,
+            "time_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+        logger.info(f"Interaction migration complete - {result}")
+        return result
+
+    def start(self):
+        """Start the periodic partition/retention maintenance"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _maintenance_loop(self):
+        while True:
+            try:
+                await self.ensure_partitions()
+            except Exception as e:
+                logger.error(f"Interaction partition maintenance failed: {e}")
+            # Compaction runs on the schedule only, not at startup
+            await asyncio.sleep(settings.interaction_maintenance_seconds)
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"Interaction compaction failed: {e}")
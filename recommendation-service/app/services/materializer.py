@@ -0,0 +1,211 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.bulk_writer import BulkWriter
+from app.services.recommendation_engine import RecommendationEngine
+
+settings = get_settings()
+logger = get_rec_logger("materializer")
+
+# One materialization run at a time across service processes
+MATERIALIZE_LOCK_ID = 72016
+WATERMARK_JOB = "materialize"
+
+ACTIVE_USERS_QUERY = """
+    SELECT user_id, MAX(created_at) as last_at
+    FROM rec_user_interactions
+    WHERE timestamp > NOW() - make_interval(days => $1)
+    GROUP BY user_id
+"""
+
+# Users with interactions newer than their stored list. The scan starts at the
+# stored watermark (newest interaction any run has built from; lists deleted by
+# invalidate_materialized do not move it back), minus a lag for rows that were
+# not yet committed when the previous run selected its users. Databases without
+# a watermark row fall back to the newest stored list.
+CHANGED_USERS_QUERY = """
+    WITH changed AS (
+        SELECT user_id, MAX(created_at) as last_at
+        FROM rec_user_interactions
+        WHERE created_at > COALESCE(
+            (SELECT watermark FROM rec_job_watermarks WHERE job = $2),
+            (SELECT MAX(interactions_at) FROM rec_user_recommendations),
+            '-infinity'::timestamp
+        ) - make_interval(secs => $1::int)
+        GROUP BY user_id
+    )
+    SELECT c.user_id, c.last_at
+    FROM changed c
+    LEFT JOIN rec_user_recommendations r ON r.user_id = c.user_id
+    WHERE r.user_id IS NULL OR r.interactions_at IS NULL OR c.last_at > r.interactions_at
+"""
+
+ADVANCE_WATERMARK_QUERY = """
+    INSERT INTO rec_job_watermarks (job, watermark, updated_at)
+    VALUES ($1, $2, NOW())
+    ON CONFLICT (job) DO UPDATE SET
+        watermark = GREATEST(rec_job_watermarks.watermark, EXCLUDED.watermark),
+        updated_at = NOW()
+"""
+
+
+async def invalidate_materialized(db_pool, user_ids: Sequence[str]):
+    """Drop the stored lists of users with new interactions (served on demand until the next run)"""
+    if not user_ids:
+        return
+    async with db_pool.acquire() as conn:
+        await conn.execute("DELETE FROM rec_user_recommendations WHERE user_id = ANY($1::text[])",
+                           list(user_ids))
+
+
+class ConnectionLimiter:
+    """
+    Pool proxy that caps the connections held at once.
+
+    An engine gathers its candidate strategies, so one user can hold several
+    connections; limiting users alone would still drain the pool shared with
+    request handling.
+    """
+
+    def __init__(self, pool, limit: int):
+        self._pool = pool
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self._semaphore:
+            async with self._pool.acquire() as conn:
+                yield conn
+
+
+class RecommendationMaterializer:
+    """
+    Batch job that precomputes homepage recommendations per user.
+
+    A full run recomputes every user active in the last
+    materialize_active_days; an incremental run only users whose newest
+    interaction is later than the one their stored list was computed from.
+    Users are computed with the regular engine, materialize_concurrency at a
+    time on at most pool size - materialize_pool_reserve connections, and
+    written materialize_batch_size at a time with one COPY + merge
+    into rec_user_recommendations, so the homepage path becomes a
+    primary-key lookup for them.
+    """
+
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+        self.progress: dict = {}
+        self.last_run: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self, incremental: bool = False) -> dict:
+        # Session lock on its own connection, so the run does not hold a pooled one
+        lock_conn = await asyncpg.connect(settings.database_url)
+        try:
+            if not await lock_conn.fetchval("SELECT pg_try_advisory_lock($1)", MATERIALIZE_LOCK_ID):
+                logger.info("Materialization skipped - another run is in progress")
+                return {"skipped": True}
+            try:
+                return await self._run(incremental)
+            finally:
+                await lock_conn.execute("SELECT pg_advisory_unlock($1)", MATERIALIZE_LOCK_ID)
+        finally:
+            await lock_conn.close()
+
+    async def _run(self, incremental: bool) -> dict:
+        start = time.perf_counter()
+        users = await self._select_users(incremental)
+        mode = "incremental" if incremental else "full"
+        self.progress = {
+            "mode": mode, "users": len(users), "done": 0, "written": 0, "failed": 0,
+            "started_at": datetime.now().isoformat()
+        }
+        logger.info(f"Materialization started - mode={mode} users={len(users)}")
+
+        semaphore = asyncio.Semaphore(settings.materialize_concurrency)
+        connections = max(1, self.db_pool.get_max_size() - settings.materialize_pool_reserve)
+        engine_pool = ConnectionLimiter(self.db_pool, connections)
+        writer = BulkWriter(self.db_pool)
+        watermark = None
+        batch_size = settings.materialize_batch_size
+        for lo in range(0, len(users), batch_size):
+            batch = users[lo:lo + batch_size]
+            results = await asyncio.gather(*(self._compute(engine_pool, user_id, last_at, semaphore)
+                                             for user_id, last_at in batch))
+            records = [r for r in results if r is not None]
+            if records:
+                self.progress["written"] += await writer.write_user_recommendations(records)
+                newest = max(r[3] for r in records)
+                watermark = newest if watermark is None else max(watermark, newest)
+            self.progress["done"] += len(batch)
+            self.progress["failed"] += len(batch) - len(records)
+
+            elapsed = time.perf_counter() - start
+            self.progress["users_per_second"] = round(self.progress["done"] / elapsed, 1)
+            logger.info(f"Materialization progress - {self.progress['done']}/{len(users)} users "
+                        f"({self.progress['users_per_second']} users/s)")
+
+        if watermark is not None:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(ADVANCE_WATERMARK_QUERY, WATERMARK_JOB, watermark)
+
+        result = {**self.progress, "time_ms": round((time.perf_counter() - start) * 1000, 2)}
+        self.last_run = result
+        logger.info(f"Materialization complete - {result}")
+        return result
+
+    async def _select_users(self, incremental: bool) -> List[Tuple[str, datetime]]:
+        async with self.db_pool.acquire() as conn:
+            if incremental:
+                rows = await conn.fetch(CHANGED_USERS_QUERY, settings.materialize_commit_lag_seconds,
+                                        WATERMARK_JOB)
+            else:
+                rows = await conn.fetch(ACTIVE_USERS_QUERY, settings.materialize_active_days)
+        return [(row['user_id'], row['last_at']) for row in rows]
+
+    async def _compute(self, engine_pool, user_id: str, last_at: datetime,
+                       semaphore: asyncio.Semaphore) -> Optional[tuple]:
+        async with semaphore:
+            try:
+                engine = RecommendationEngine(engine_pool)
+                recommendations, algorithm = await engine.get_personalized_recommendations(
+                    user_id, limit=settings.materialize_size)
+            except Exception as e:
+                logger.error(f"Materialization failed - user={user_id}: {e}")
+                return None
+        return (user_id, [r['handle'] for r in recommendations], algorithm, last_at)
+
+    def stats(self) -> dict:
+        return {"progress": self.progress, "last_run": self.last_run}
+
+    def start(self):
+        """Start the periodic incremental run"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._incremental_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _incremental_loop(self):
+        while True:
+            await asyncio.sleep(settings.materialize_incremental_seconds)
+            try:
+                await self.run(incremental=True)
+            except Exception as e:
+                logger.error(f"Incremental materialization failed: {e}")
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Sequence
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+
+settings = get_settings()
+logger = get_rec_logger("popularity")
+
+# Sliding windows recomputed on every rollup; 'all' is accumulated from a watermark
+WINDOWS = {
+    '1h': '1 hour',
+    '24h': '24 hours',
+    '7d': '7 days'
+}
+ALL_TIME = 'all'
+
+COUNTED_INTERACTIONS = ['view', 'add_to_cart', 'purchase', 'wishlist']
+
+# Serializes rollups across service processes (the all-time merge is not idempotent)
+ROLLUP_LOCK_ID = 72010
+
+
+class PopularityStats:
+    """
+    Per-product, per-interaction-type counters in rec_product_stats.
+
+    A periodic rollup rewrites the 1h/24h/7d windows from range scans over
+    the timestamp index (cost bounded by the window, not the table) and adds
+    interactions inserted since the last rollup to the all-time counters
+    (created_at watermark). Reads are index scans on
+    (time_window, interaction_type, count DESC) or primary-key lookups, so
+    top-N and per-candidate counts cost O(k) however large
+    rec_user_interactions grows.
+    """
+
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+        self.last_rollup_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def rollup(self) -> dict:
+        """Refresh the sliding windows and fold new interactions into all-time counts"""
+        start = time.perf_counter()
+        rows = {}
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", ROLLUP_LOCK_ID)
+
+                for window, interval in WINDOWS.items():
+                    await conn.execute("DELETE FROM rec_product_stats WHERE time_window = $1", window)
+                    status = await conn.execute(f"""
+                        INSERT INTO rec_product_stats
+                        (product_handle, interaction_type, time_window, count, updated_at)
+                        SELECT product_handle, interaction_type, $1, COUNT(*), NOW()
+                        FROM rec_user_interactions
+                        WHERE timestamp > NOW() - INTERVAL '{interval}'
+                        AND interaction_type = ANY($2::text[])
+                        AND product_handle IS NOT NULL
+                        GROUP BY product_handle, interaction_type
+                    """, window, COUNTED_INTERACTIONS)
+                    rows[window] = int(status.split()[-1])
+
+                # Rows committed in the last few seconds may still be invisible to us, so
+                # stop the watermark short of NOW() and pick them up on the next rollup
+                status = await conn.execute("""
+                    WITH bounds AS (
+                        SELECT
+                            COALESCE(
+                                (SELECT MAX(rolled_up_to) FROM rec_product_stats WHERE time_window = $1),
+                                '-infinity'::timestamp
+                            ) as low,
+                            (NOW() - make_interval(secs => $3::int))::timestamp as high
+                    )
+                    INSERT INTO rec_product_stats
+                    (product_handle, interaction_type, time_window, count, rolled_up_to, updated_at)
+                    SELECT ui.product_handle, ui.interaction_type, $1, COUNT(*), MAX(b.high), NOW()
+                    FROM rec_user_interactions ui, bounds b
+                    WHERE ui.created_at > b.low AND ui.created_at <= b.high
+                    AND ui.interaction_type = ANY($2::text[])
+                    AND ui.product_handle IS NOT NULL
+                    GROUP BY ui.product_handle, ui.interaction_type
+                    ON CONFLICT (product_handle, interaction_type, time_window)
+                    DO UPDATE SET
+                        count = rec_product_stats.count + EXCLUDED.count,
+                        rolled_up_to = EXCLUDED.rolled_up_to,
+                        updated_at = NOW()
+                """, ALL_TIME, COUNTED_INTERACTIONS, settings.popularity_commit_lag_seconds)
+                rows[ALL_TIME] = int(status.split()[-1])
+
+        self.last_rollup_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"Popularity rollup complete - rows={rows} time={self.last_rollup_ms}ms")
+        return {"rows": rows, "time_ms": self.last_rollup_ms}
+
+    async def top(self, interaction_type: str, window: str = ALL_TIME, limit: int = 12) -> List[str]:
+        """Most-interacted handles for one interaction type and window"""
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT product_handle
+                FROM rec_product_stats
+                WHERE time_window = $1 AND interaction_type = $2
+                ORDER BY count DESC, product_handle
+                LIMIT $3
+            """, window, interaction_type, limit)
+        return [row['product_handle'] for row in rows]
+
+    async def counts(self, interaction_type: str, handles: Sequence[str],
+                     window: str = ALL_TIME) -> Dict[str, int]:
+        """Counters of the given handles (handles without interactions are omitted)"""
+        if not handles:
+            return {}
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT product_handle, count
+                FROM rec_product_stats
+                WHERE time_window = $1 AND interaction_type = $2
+                AND product_handle = ANY($3::text[])
+            """, window, interaction_type, list(handles))
+        return {row['product_handle']: row['count'] for row in rows}
+
+    async def counts_by_type(self, interaction_types: Sequence[str], handles: Sequence[str],
+                             window: str = ALL_TIME) -> Dict[str, Dict[str, int]]:
+        """Counters of the given handles for several interaction types in one query"""
+        result = {t: {} for t in interaction_types}
+        if not handles:
+            return result
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT product_handle, interaction_type, count
+                FROM rec_product_stats
+                WHERE time_window = $1 AND interaction_type = ANY($2::text[])
+                AND product_handle = ANY($3::text[])
+            """, window, list(interaction_types), list(handles))
+        for row in rows:
+            result[row['interaction_type']][row['product_handle']] = row['count']
+        return result
+
+    def start(self):
+        """Start the periodic rollup loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._rollup_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _rollup_loop(self):
+        while True:
+            try:
+                await self.rollup()
+            except Exception as e:
+                logger.error(f"Popularity rollup failed: {e}")
+            await asyncio.sleep(settings.popularity_rollup_seconds)
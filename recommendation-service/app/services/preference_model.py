@@ -0,0 +1,365 @@
+import json
+import math
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.bulk_writer import BulkWriter
+
+settings = get_settings()
+logger = get_rec_logger("preferences")
+
+INTERACTION_WEIGHTS = {
+    'purchase': 5.0,
+    'add_to_cart': 3.0,
+    'wishlist': 2.0,
+    'view': 1.0
+}
+
+# Relative accuracy of the price sketch (bucket i covers [GAMMA^(i-1), GAMMA^i))
+SKETCH_GAMMA = 1.05
+SKETCH_MAX_BUCKETS = 128
+
+# Rebase decayed values once the growth factor exceeds 2^REBASE_HALF_LIVES
+REBASE_HALF_LIVES = 64
+
+EPOCH = datetime(1970, 1, 1)
+
+# Category and price are extracted server-side so the scan never JSON-parses in Python
+INTERACTION_SCAN_QUERY = """
+    SELECT
+        user_id,
+        interaction_type,
+        metadata->>'category' as category,
+        CASE WHEN metadata->>'price' ~ '^[0-9]+(\\.[0-9]+)?$'
+             THEN (metadata->>'price')::float END as price,
+        EXTRACT(EPOCH FROM timestamp)::float as ts
+    FROM rec_user_interactions
+    WHERE timestamp > NOW() - make_interval(days => $1)
+    AND jsonb_typeof(metadata) = 'object'
+    {user_filter}
+"""
+
+
+def _epoch(ts: datetime) -> float:
+    """Seconds since epoch of a naive timestamp, matching EXTRACT(EPOCH FROM timestamp)"""
+    return (ts - EPOCH).total_seconds()
+
+
+def _bucket(price: float) -> int:
+    return int(math.ceil(math.log(price) / math.log(SKETCH_GAMMA)))
+
+
+class PreferenceState:
+    """
+    Compact per-user preference record.
+
+    Category weights and price-sketch counts decay exponentially with
+    preference_half_life_days. Instead of decaying every value on each
+    event, values are stored relative to a reference time: an event at time
+    t adds weight * 2^((t - ref) / half_life). All values share the same
+    factor, so normalized scores and quantiles are unaffected by it, and
+    adding an event is O(1). The reference is moved forward (rescaling all
+    values) only when the factor grows too large.
+    """
+
+    __slots__ = ('ref', 'scores', 'buckets', 'price_min', 'price_max', 'events')
+
+    def __init__(self, ref: float):
+        self.ref = ref
+        self.scores: Dict[str, float] = {}
+        self.buckets: Dict[int, float] = {}
+        self.price_min: Optional[float] = None
+        self.price_max: Optional[float] = None
+        self.events = 0
+
+    def add(self, ts: float, interaction_type: str, category: Optional[str], price: Optional[float]):
+        half_life = settings.preference_half_life_days * 86400.0
+        exponent = (ts - self.ref) / half_life
+        if exponent > REBASE_HALF_LIVES:
+            self._rebase(ts, half_life)
+            exponent = 0.0
+        weight = INTERACTION_WEIGHTS.get(interaction_type, 1.0) * 2.0 ** exponent
+
+        if category:
+            self.scores[category] = self.scores.get(category, 0.0) + weight
+        if price is not None and price > 0:
+            b = _bucket(price)
+            self.buckets[b] = self.buckets.get(b, 0.0) + weight
+            if len(self.buckets) > SKETCH_MAX_BUCKETS:
+                self._collapse()
+            self.price_min = price if self.price_min is None else min(self.price_min, price)
+            self.price_max = price if self.price_max is None else max(self.price_max, price)
+        self.events += 1
+
+    def _rebase(self, ref: float, half_life: float):
+        factor = 2.0 ** ((self.ref - ref) / half_life)
+        self.scores = {k: v * factor for k, v in self.scores.items()}
+        self.buckets = {k: v * factor for k, v in self.buckets.items()}
+        self.ref = ref
+
+    def _collapse(self):
+        """
+        Merge the lightest pair of neighbouring buckets into the heavier one.
+
+        Only that pair's mass moves, by one occupied-bucket gap, so either
+        quantile shifts at most to the neighbouring bucket and only when it
+        falls inside the pair; both tails keep their resolution.
+        """
+        keys = sorted(self.buckets)
+        pairs = zip(keys, keys[1:])
+        low, high = min(pairs, key=lambda p: self.buckets[p[0]] + self.buckets[p[1]])
+        if self.buckets[low] > self.buckets[high]:
+            low, high = high, low
+        self.buckets[high] += self.buckets.pop(low)
+
+    def merge(self, other: 'PreferenceState'):
+        """Add the values of another state of the same user (e.g. from a later chunk)"""
+        half_life = settings.preference_half_life_days * 86400.0
+        if other.ref > self.ref:
+            self._rebase(other.ref, half_life)
+        factor = 2.0 ** ((other.ref - self.ref) / half_life)
+        for k, v in other.scores.items():
+            self.scores[k] = self.scores.get(k, 0.0) + v * factor
+        for k, v in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0.0) + v * factor
+        while len(self.buckets) > SKETCH_MAX_BUCKETS:
+            self._collapse()
+        if other.price_min is not None:
+            self.price_min = other.price_min if self.price_min is None else min(self.price_min, other.price_min)
+            self.price_max = other.price_max if self.price_max is None else max(self.price_max, other.price_max)
+        self.events += other.events
+
+    def category_scores(self) -> Dict[str, float]:
+        """Scores normalized to the top category (same scale as before)"""
+        if not self.scores:
+            return {}
+        top = max(self.scores.values())
+        return {k: round(v / top, 6) for k, v in self.scores.items()}
+
+    def price_quantile(self, q: float) -> Optional[float]:
+        if not self.buckets:
+            return None
+        keys = sorted(self.buckets)
+        total = sum(self.buckets.values())
+        running = 0.0
+        for b in keys:
+            running += self.buckets[b]
+            if running >= q * total:
+                break
+        value = 2.0 * SKETCH_GAMMA ** b / (SKETCH_GAMMA + 1.0)
+        return min(max(value, self.price_min), self.price_max)
+
+    def price_bounds(self) -> Tuple[Optional[float], Optional[float]]:
+        """Decayed low/high price quantiles, robust to one-off outliers"""
+        low, high = settings.preference_price_quantiles
+        return self.price_quantile(low), self.price_quantile(high)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'ref': self.ref,
+            'c': self.scores,
+            'b': {str(k): v for k, v in self.buckets.items()},
+            'p': [self.price_min, self.price_max],
+            'n': self.events
+        })
+
+    @classmethod
+    def from_json(cls, raw) -> 'PreferenceState':
+        data = json.loads(raw) if isinstance(raw, str) else raw
+        state = cls(data['ref'])
+        state.scores = data.get('c', {})
+        state.buckets = {int(k): v for k, v in data.get('b', {}).items()}
+        state.price_min, state.price_max = data.get('p', [None, None])
+        state.events = data.get('n', 0)
+        return state
+
+    def record(self, user_id: str) -> tuple:
+        """(user_id, category_scores, price_min, price_max, state) row for rec_user_preferences"""
+        bounds = [None if p is None else Decimal(str(round(p, 2))) for p in self.price_bounds()]
+        return (user_id, json.dumps(self.category_scores()), bounds[0], bounds[1], self.to_json())
+
+
+class PreferenceModel:
+    """
+    Maintains rec_user_preferences from interactions.
+
+    apply() folds newly written interactions into the stored per-user
+    states (one read and one bulk write per call). rebuild() recomputes
+    states from a single streamed scan of rec_user_interactions, aggregated
+    with NumPy one chunk at a time and merged per user, either for all users
+    active in the lookback window or for a given list of users.
+    """
+
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+        self.chunk_size = settings.preference_chunk_size
+
+    async def apply(self, events: Sequence[tuple]) -> int:
+        """
+        Fold (id, user_id, session_id, product_id, product_handle,
+        interaction_type, metadata_json, timestamp) events into user states.
+        Users without a stored state are rebuilt from their history instead
+        (which already contains these events).
+        """
+        by_user: Dict[str, List[tuple]] = {}
+        for event in events:
+            by_user.setdefault(event[1], []).append(event)
+        if not by_user:
+            return 0
+
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT user_id, state FROM rec_user_preferences
+                WHERE user_id = ANY($1::text[]) AND state IS NOT NULL
+            """, list(by_user))
+        states = {row['user_id']: PreferenceState.from_json(row['state']) for row in rows}
+
+        records = []
+        for user_id, user_events in by_user.items():
+            state = states.get(user_id)
+            if state is None:
+                continue
+            for event in user_events:
+                category, price = self._parse_metadata(event[6])
+                if category or price is not None:
+                    state.add(_epoch(event[7]), event[5], category, price)
+            records.append(state.record(user_id))
+
+        written = await self._write(records)
+        missing = [u for u in by_user if u not in states]
+        if missing:
+            written += await self.rebuild(missing)
+        return written
+
+    async def rebuild(self, user_ids: Optional[List[str]] = None) -> int:
+        """Recompute states from one scan (all active users when user_ids is None)"""
+        start = time.perf_counter()
+        states, interactions = await self._scan(user_ids)
+        written = await self._write([state.record(user_id) for user_id, state in states.items()])
+        logger.info(
+            f"Preferences rebuilt - users={len(states)} interactions={interactions} "
+            f"time={(time.perf_counter() - start) * 1000:.2f}ms"
+        )
+        return written
+
+    async def _scan(self, user_ids: Optional[List[str]]) -> Tuple[Dict[str, PreferenceState], int]:
+        """Per-user states and the number of interactions scanned; rows are dropped chunk by chunk"""
+        states: Dict[str, PreferenceState] = {}
+        interactions = 0
+        args = [settings.preference_lookback_days]
+        user_filter = ""
+        if user_ids is not None:
+            user_filter = "AND user_id = ANY($2::text[])"
+            args.append(list(user_ids))
+
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(INTERACTION_SCAN_QUERY.format(user_filter=user_filter), *args)
+                while True:
+                    rows = await cursor.fetch(self.chunk_size)
+                    if not rows:
+                        break
+                    interactions += len(rows)
+                    for user_id, partial in self._aggregate(*self._columns(rows)).items():
+                        state = states.get(user_id)
+                        if state is None:
+                            states[user_id] = partial
+                        else:
+                            state.merge(partial)
+
+        return states, interactions
+
+    @staticmethod
+    def _columns(rows) -> tuple:
+        return (
+            np.asarray([r['user_id'] for r in rows], dtype=object),
+            np.asarray([r['interaction_type'] for r in rows], dtype=object),
+            np.asarray([r['category'] for r in rows], dtype=object),
+            np.asarray([np.nan if r['price'] is None else r['price'] for r in rows], dtype=np.float64),
+            np.asarray([r['ts'] for r in rows], dtype=np.float64)
+        )
+
+    @staticmethod
+    def _aggregate(users: np.ndarray, types: np.ndarray, categories: np.ndarray,
+                   prices: np.ndarray, stamps: np.ndarray) -> Dict[str, PreferenceState]:
+        """Vectorized equivalent of folding every event with PreferenceState.add"""
+        if users.size == 0:
+            return {}
+        ref = float(stamps.max())
+        half_life = settings.preference_half_life_days * 86400.0
+        weights = np.fromiter((INTERACTION_WEIGHTS.get(t, 1.0) for t in types),
+                              dtype=np.float64, count=types.size)
+        weights *= np.exp2((stamps - ref) / half_life)
+
+        user_names, user_idx = np.unique(users, return_inverse=True)
+        states = {str(u): PreferenceState(ref) for u in user_names}
+        names = user_names.tolist()
+
+        # Category weights per (user, category)
+        has_category = np.fromiter((bool(c) for c in categories), dtype=bool, count=categories.size)
+        if has_category.any():
+            cat_names, cat_idx = np.unique(categories[has_category].astype(str), return_inverse=True)
+            keys = user_idx[has_category] * cat_names.size + cat_idx
+            pair_keys, inverse = np.unique(keys, return_inverse=True)
+            sums = np.bincount(inverse, weights=weights[has_category])
+            for key, value in zip(pair_keys.tolist(), sums.tolist()):
+                u, c = divmod(key, cat_names.size)
+                states[names[u]].scores[str(cat_names[c])] = value
+
+        # Price min/max and sketch counts per user
+        has_price = np.isfinite(prices) & (prices > 0)
+        if has_price.any():
+            pu, pp, pw = user_idx[has_price], prices[has_price], weights[has_price]
+            order = np.argsort(pu, kind='stable')
+            pu, pp, pw = pu[order], pp[order], pw[order]
+            starts = np.flatnonzero(np.r_[True, pu[1:] != pu[:-1]])
+            mins = np.minimum.reduceat(pp, starts)
+            maxs = np.maximum.reduceat(pp, starts)
+            for u, lo, hi in zip(pu[starts].tolist(), mins.tolist(), maxs.tolist()):
+                states[names[u]].price_min, states[names[u]].price_max = lo, hi
+
+            buckets = np.ceil(np.log(pp) / np.log(SKETCH_GAMMA)).astype(np.int64)
+            offset = buckets.min()
+            span = int(buckets.max() - offset) + 1
+            bucket_keys, inverse = np.unique(pu * span + (buckets - offset), return_inverse=True)
+            counts = np.bincount(inverse, weights=pw)
+            for key, value in zip(bucket_keys.tolist(), counts.tolist()):
+                u, b = divmod(key, span)
+                states[names[u]].buckets[int(b + offset)] = value
+
+        events = np.bincount(user_idx, weights=(has_category | has_price).astype(np.float64))
+        for u, n in enumerate(events.tolist()):
+            state = states[names[u]]
+            state.events = int(n)
+            while len(state.buckets) > SKETCH_MAX_BUCKETS:
+                state._collapse()
+
+        return {u: s for u, s in states.items() if s.events}
+
+    async def _write(self, records: List[tuple]) -> int:
+        if not records:
+            return 0
+        return await BulkWriter(self.db_pool).write_user_preferences(records)
+
+    @staticmethod
+    def _parse_metadata(metadata) -> Tuple[Optional[str], Optional[float]]:
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                return None, None
+        if not isinstance(metadata, dict):
+            return None, None
+        category = metadata.get('category')
+        price = None
+        try:
+            price = float(metadata['price']) if 'price' in metadata else None
+        except (TypeError, ValueError):
+            pass
+        return (str(category) if category else None), price
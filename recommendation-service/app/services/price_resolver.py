@@ -0,0 +1,192 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+
+settings = get_settings()
+logger = get_rec_logger("prices")
+
+# Cheapest variant price per product, currency and region rule (region_id NULL:
+# the price applies to every region using the currency). Prices with any other
+# rule (customer group, quantity, ...) are conditional and never displayed.
+# Plain aggregation; which price is displayed is decided in PriceResolver.
+PRICES_QUERY = """
+    SELECT
+        p.handle,
+        LOWER(pr.currency_code) as currency_code,
+        prr.value as region_id,
+        MIN(pr.amount) as amount
+    FROM product p
+    JOIN product_variant pv ON pv.product_id = p.id
+    JOIN product_variant_price_set pvps ON pv.id = pvps.variant_id
+    JOIN price pr ON pvps.price_set_id = pr.price_set_id
+    LEFT JOIN price_rule prr
+        ON prr.price_id = pr.id
+        AND prr.attribute = 'region_id'
+        AND prr.deleted_at IS NULL
+    WHERE pv.deleted_at IS NULL
+    AND pr.deleted_at IS NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM price_rule other
+        WHERE other.price_id = pr.id
+        AND other.attribute <> 'region_id'
+        AND other.deleted_at IS NULL
+    )
+    AND {product_filter}
+    GROUP BY p.handle, LOWER(pr.currency_code), prr.value
+"""
+
+REGIONS_QUERY = """
+    SELECT id, LOWER(currency_code) as currency_code
+    FROM region
+    WHERE deleted_at IS NULL
+"""
+
+# Distinct (amount, currency) payloads shared before the table is started over
+MAX_SHARED_PAYLOADS = 50000
+
+
+class PriceResolver:
+    """
+    Display prices of every product per currency and per region.
+
+    Prices are loaded with one aggregate query and formatted once. Resolving
+    a product's price is then a dict lookup. Products with the same amount
+    and currency share one payload dict, which keeps the cache compact
+    (up to MAX_SHARED_PAYLOADS distinct ones).
+
+    - A region uses its region-specific price, falling back to the price in
+      the region's currency.
+    - A currency uses the rule-free price when there is one, and otherwise
+      the cheapest region price in that currency.
+    - The default follows price_currency_preference, then the cheapest
+      price in any other currency.
+    """
+
+    def __init__(self):
+        self.regions: Dict[str, str] = {}  # region_id -> currency_code
+        self.by_currency: Dict[str, Dict[str, dict]] = {}
+        self.by_region: Dict[str, Dict[str, dict]] = {}
+        self.default: Dict[str, dict] = {}
+        self._payloads: Dict[tuple, dict] = {}
+        self.preference = [c.lower() for c in settings.price_currency_preference]
+
+    async def load_regions(self, conn) -> List[str]:
+        """Reload the region list; returns the ids of regions that were not known before"""
+        rows = await conn.fetch(REGIONS_QUERY)
+        regions = {row['id']: row['currency_code'] for row in rows}
+        added = [r for r in regions if r not in self.regions]
+        for region_id in self.by_region.keys() - regions.keys():
+            del self.by_region[region_id]
+        self.regions = regions
+        return added
+
+    async def load_region_prices(self, conn, region_ids: Sequence[str]):
+        """Load the region-specific prices of regions added after the full load"""
+        rows = await conn.fetch(PRICES_QUERY.format(
+            product_filter="p.status = 'published' AND p.deleted_at IS NULL AND prr.value = ANY($1::text[])"
+        ), list(region_ids))
+        for row in rows:
+            region_id, currency = row['region_id'], row['currency_code']
+            if row['amount'] is not None and self.regions.get(region_id) == currency:
+                self.by_region.setdefault(region_id, {})[row['handle']] = self._payload(row['amount'], currency)
+
+    async def load(self, conn, handles: Optional[Sequence[str]] = None):
+        """Load the prices of all published products (with regions), or reload the given handles"""
+        if handles is None:
+            await self.load_regions(conn)
+            rows = await conn.fetch(PRICES_QUERY.format(
+                product_filter="p.status = 'published' AND p.deleted_at IS NULL"
+            ))
+            self.by_currency, self.by_region, self.default, self._payloads = {}, {}, {}, {}
+        else:
+            rows = await conn.fetch(PRICES_QUERY.format(
+                product_filter="p.handle = ANY($1::text[])"
+            ), list(handles))
+            self.remove(handles)
+        self._apply(rows)
+
+    def _apply(self, rows):
+        general = defaultdict(dict)  # handle -> currency -> amount (no region rule)
+        ruled = defaultdict(dict)  # handle -> currency -> cheapest region price
+        for row in rows:
+            handle, currency, amount = row['handle'], row['currency_code'], row['amount']
+            if amount is None:
+                continue
+            region_id = row['region_id']
+            if region_id is None:
+                general[handle][currency] = amount
+                continue
+            if self.regions.get(region_id) == currency:
+                self.by_region.setdefault(region_id, {})[handle] = self._payload(amount, currency)
+            if currency not in ruled[handle] or amount < ruled[handle][currency]:
+                ruled[handle][currency] = amount
+
+        for handle in general.keys() | ruled.keys():
+            amounts = {**ruled.get(handle, {}), **general.get(handle, {})}
+            for currency, amount in amounts.items():
+                self.by_currency.setdefault(currency, {})[handle] = self._payload(amount, currency)
+            self.default[handle] = self._payload(*self._choose(amounts))
+
+    def _choose(self, amounts: Dict[str, float]) -> tuple:
+        for currency in self.preference:
+            if currency in amounts:
+                return amounts[currency], currency
+        currency = min(amounts, key=amounts.get)
+        return amounts[currency], currency
+
+    def _payload(self, amount, currency: str) -> dict:
+        key = (amount, currency)
+        payload = self._payloads.get(key)
+        if payload is None:
+            if len(self._payloads) >= MAX_SHARED_PAYLOADS:
+                # Payloads in use stay valid; only amounts seen from now on are shared
+                self._payloads = {}
+            payload = self._payloads[key] = {
+                'amount': format_price(amount, currency),
+                'currencyCode': currency.upper()
+            }
+        return payload
+
+    def remove(self, handles: Sequence[str]):
+        for prices in (self.default, *self.by_currency.values(), *self.by_region.values()):
+            for handle in handles:
+                prices.pop(handle, None)
+
+    def knows_region(self, region_id: str) -> bool:
+        return region_id in self.regions
+
+    def resolve(self, handle: str, region_id: Optional[str] = None,
+                currency_code: Optional[str] = None) -> Optional[dict]:
+        """Shared price payload of a product (callers copy it before handing it out)"""
+        if region_id:
+            price = self.by_region.get(region_id, {}).get(handle)
+            if price:
+                return price
+            currency_code = self.regions.get(region_id, currency_code)
+        if currency_code:
+            return self.by_currency.get(currency_code.lower(), {}).get(handle)
+        return self.default.get(handle)
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self.default),
+            "currencies": {c: len(prices) for c, prices in self.by_currency.items()},
+            "regions": {r: len(self.by_region.get(r, {})) for r in self.regions},
+            "payloads": len(self._payloads)
+        }
+
+
+def format_price(amount: float, currency_code: str) -> str:
+    """Format price with proper currency symbol and formatting"""
+    currency_upper = currency_code.upper()
+
+    if currency_upper == "VND":
+        return f"{int(amount):,}₫"
+    elif currency_upper == "USD":
+        return f"${amount:,.2f}"
+    elif currency_upper == "EUR":
+        return f"€{amount:,.2f}"
+    else:
+        return f"{amount:,.2f} {currency_upper}"
@@ -0,0 +1,250 @@
+import asyncio
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+
+settings = get_settings()
+logger = get_rec_logger("sampler")
+
+ALL = ('all', None)
+
+
+class _Group:
+    """Members of one category/collection with a Vose alias table for weighted draws"""
+
+    __slots__ = ('members', 'prob', 'alias', 'total_weight')
+
+    def __init__(self, members: np.ndarray, weights: np.ndarray):
+        self.members = members
+        self.total_weight = float(weights.sum())
+        self.prob, self.alias = _alias_table(weights)
+
+    def __len__(self) -> int:
+        return self.members.size
+
+    def draw(self, rng: np.random.Generator, size: int, weighted: bool) -> np.ndarray:
+        slots = rng.integers(0, self.members.size, size=size)
+        if weighted:
+            use_alias = rng.random(size) >= self.prob[slots]
+            slots = np.where(use_alias, self.alias[slots], slots)
+        return self.members[slots]
+
+
+class ProductSampler:
+    """
+    Random-access sampling over published, priced products.
+
+    Keeps the catalog rows of every category and collection (plus the whole
+    catalog) as NumPy arrays built from the CatalogSnapshot, refreshed on a
+    schedule. A uniform draw is a random index into the array and a
+    popularity-weighted draw goes through an alias table, so a sample of k
+    handles costs O(k) regardless of catalog size. This replaces
+    ORDER BY RANDOM() LIMIT n, which sorts the whole filtered set per call.
+    Exclusion sets (already seen handles) are handled by rejection.
+
+    Group members are snapshot row indices, valid for one snapshot
+    generation: after a full catalog reload the groups are rebuilt before
+    the next draw.
+    """
+
+    def __init__(self, catalog: CatalogSnapshot = None):
+        self.catalog = catalog or get_catalog_snapshot()
+        self.rng = np.random.default_rng()
+        self.groups: Dict[Tuple[str, Optional[str]], _Group] = {}
+        self.popularity: Dict[str, float] = {}
+        self.built_at: Optional[datetime] = None
+        self.generation: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.built_at is not None and self.catalog.is_loaded
+
+    def rebuild(self):
+        """Rebuild group arrays and alias tables from the current snapshot"""
+        start = time.perf_counter()
+        catalog = self.catalog
+        members: Dict[Tuple[str, Optional[str]], List[int]] = {ALL: []}
+
+        for handle, i in catalog.index.items():
+            if not catalog.prices[i]:
+                continue
+            members[ALL].append(i)
+            for category_id in catalog.category_ids[i]:
+                members.setdefault(('category', category_id), []).append(i)
+            collection_id = catalog.collection_ids[i]
+            if collection_id:
+                members.setdefault(('collection', collection_id), []).append(i)
+
+        groups = {}
+        for key, rows in members.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            # +1 smoothing keeps never-interacted products reachable
+            weights = np.fromiter(
+                (self.popularity.get(catalog.handles[i], 0.0) + 1.0 for i in rows.tolist()),
+                dtype=np.float64, count=rows.size
+            )
+            groups[key] = _Group(rows, weights)
+
+        self.groups = groups
+        self.generation = catalog.generation
+        self.built_at = datetime.now()
+        logger.info(
+            f"Sampler rebuilt - products={len(groups[ALL])} groups={len(groups)} "
+            f"time={(time.perf_counter() - start) * 1000:.2f}ms"
+        )
+
+    def _ensure_current(self):
+        """Rebuild when the snapshot was fully reloaded since the last build"""
+        if self.built_at is not None and self.generation != self.catalog.generation:
+            self.rebuild()
+
+    async def load_popularity(self, db_pool):
+        """Interaction counts per handle over the popularity window"""
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT product_handle, COUNT(*) as count
+                FROM rec_user_interactions
+                WHERE product_handle IS NOT NULL
+                AND timestamp > NOW() - make_interval(days => $1)
+                GROUP BY product_handle
+            """, settings.sampler_popularity_days)
+        self.popularity = {row['product_handle']: float(row['count']) for row in rows}
+
+    def sample(self, k: int, groups: Sequence[Tuple[str, Optional[str]]] = (ALL,),
+               exclude: Iterable[str] = (), weighted: bool = False) -> List[str]:
+        """
+        Draw up to k distinct handles from the union of groups
+
+        Args:
+            k: Number of handles
+            groups: ('all', None), ('category', id) or ('collection', id) keys
+            exclude: Handles that must not be returned
+            weighted: Popularity-weighted instead of uniform
+        """
+        self._ensure_current()
+        group_list = [self.groups[g] for g in groups if g in self.groups and len(self.groups[g])]
+        if k <= 0 or not group_list:
+            return []
+
+        exclude = set(exclude)
+        handles = self.catalog.handles
+        active = self.catalog.active
+        size = sum(len(g) for g in group_list)
+
+        # Small pools: enumerate instead of rejecting
+        if size <= 2 * (k + len(exclude)):
+            return self._sample_small(group_list, k, exclude, weighted)
+
+        # Pick a group per draw in proportion to its size (or weight), then a member within it
+        group_weights = np.array(
+            [g.total_weight if weighted else len(g) for g in group_list], dtype=np.float64
+        )
+        group_weights /= group_weights.sum()
+
+        picked: List[str] = []
+        picked_set = set()
+        for _ in range(8):
+            batch = 2 * (k - len(picked)) + 4
+            draws = np.empty(batch, dtype=np.int64)
+            group_of_draw = self.rng.choice(len(group_list), size=batch, p=group_weights)
+            for g, group in enumerate(group_list):
+                slots = np.flatnonzero(group_of_draw == g)
+                if slots.size:
+                    draws[slots] = group.draw(self.rng, slots.size, weighted)
+
+            # Draws are in random order, so the first k accepted ones are an unbiased sample
+            for i in draws.tolist():
+                handle = handles[i]
+                if not active[i] or handle in exclude or handle in picked_set:
+                    continue
+                picked.append(handle)
+                picked_set.add(handle)
+                if len(picked) == k:
+                    return picked
+
+        return picked
+
+    def _sample_small(self, group_list: List[_Group], k: int, exclude: set, weighted: bool) -> List[str]:
+        handles = self.catalog.handles
+        active = self.catalog.active
+        rows = np.unique(np.concatenate([g.members for g in group_list]))
+        rows = np.asarray([i for i in rows.tolist() if active[i] and handles[i] not in exclude], dtype=np.int64)
+        if rows.size == 0:
+            return []
+        p = None
+        if weighted:
+            w = np.asarray([self.popularity.get(handles[i], 0.0) + 1.0 for i in rows.tolist()])
+            p = w / w.sum()
+        chosen = self.rng.choice(rows, size=min(k, rows.size), replace=False, p=p)
+        return [handles[i] for i in chosen.tolist()]
+
+    def groups_of(self, handle: str) -> List[Tuple[str, Optional[str]]]:
+        """Category and collection keys of a product"""
+        i = self.catalog.index.get(handle)
+        if i is None:
+            return []
+        groups = [('category', c) for c in self.catalog.category_ids[i]]
+        if self.catalog.collection_ids[i]:
+            groups.append(('collection', self.catalog.collection_ids[i]))
+        return groups
+
+    def start(self, db_pool):
+        """Start the scheduled rebuild loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop(db_pool))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self, db_pool):
+        await self.load_popularity(db_pool)
+        if self.catalog.is_loaded:
+            self.rebuild()
+
+    async def _refresh_loop(self, db_pool):
+        while True:
+            try:
+                await self.refresh(db_pool)
+            except Exception as e:
+                logger.error(f"Sampler refresh failed: {e}")
+            await asyncio.sleep(settings.sampler_refresh_seconds)
+
+
+def _alias_table(weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vose's alias method: O(n) build, O(1) weighted draw"""
+    n = weights.size
+    prob = np.ones(n, dtype=np.float64)
+    alias = np.arange(n, dtype=np.int64)
+    if n == 0 or weights.sum() <= 0:
+        return prob, alias
+
+    scaled = weights * (n / weights.sum())
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1.0
+        (small if scaled[l] < 1.0 else large).append(l)
+    return prob, alias
+
+
+@lru_cache()
+def get_product_sampler() -> ProductSampler:
+    """Process-wide product sampler"""
+    return ProductSampler()
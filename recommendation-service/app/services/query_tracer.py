@@ -0,0 +1,243 @@
+import asyncio
+import random
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.metrics import get_metrics
+
+settings = get_settings()
+logger = get_rec_logger("query_tracer")
+
+metrics = get_metrics()
+QUERY_SECONDS = metrics.histogram(
+    "rec_db_query_duration_seconds", "Engine query duration by calling function", ["query"])
+QUERY_ROWS = metrics.counter(
+    "rec_db_query_rows_total", "Rows returned or affected by engine queries", ["query"])
+POOL_WAIT_SECONDS = metrics.histogram(
+    "rec_db_pool_wait_seconds", "Time spent waiting for a pooled connection")
+SLOW_QUERIES = metrics.counter(
+    "rec_db_slow_queries_total", "Engine queries slower than trace_slow_query_ms", ["query"])
+
+# Trace of the request being served; None outside serve_recommendations
+current_trace: ContextVar[Optional["QueryTrace"]] = ContextVar("current_trace", default=None)
+
+
+class QueryTrace:
+    """Queries issued while serving one request"""
+
+    __slots__ = ('spans',)
+
+    def __init__(self):
+        self.spans: List[dict] = []
+
+    def add(self, label: str, duration_ms: float, rows: int, wait_ms: float):
+        self.spans.append({
+            "query": label,
+            "ms": round(duration_ms, 3),
+            "rows": rows,
+            "pool_wait_ms": round(wait_ms, 3)
+        })
+
+    @property
+    def count(self) -> int:
+        return len(self.spans)
+
+    @property
+    def db_ms(self) -> float:
+        return round(sum(s["ms"] for s in self.spans), 2)
+
+    def summary(self) -> dict:
+        """Totals plus per-label count/time/rows, slowest label first"""
+        by_query: Dict[str, dict] = {}
+        for span in self.spans:
+            entry = by_query.setdefault(span["query"], {"count": 0, "ms": 0.0, "rows": 0})
+            entry["count"] += 1
+            entry["ms"] = round(entry["ms"] + span["ms"], 3)
+            entry["rows"] += span["rows"]
+        return {
+            "queries": self.count,
+            "db_ms": self.db_ms,
+            "pool_wait_ms": round(sum(s["pool_wait_ms"] for s in self.spans), 2),
+            "by_query": dict(sorted(by_query.items(), key=lambda kv: -kv[1]["ms"])),
+            "spans": self.spans
+        }
+
+
+@contextmanager
+def trace_queries():
+    """Collect the queries of the enclosed request (tasks it spawns inherit the trace)"""
+    trace = QueryTrace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+def _row_count(method: str, result) -> int:
+    if method == 'fetch':
+        return len(result)
+    if method in ('fetchrow', 'fetchval'):
+        return 0 if result is None else 1
+    if isinstance(result, str):
+        # Command status such as 'INSERT 0 25' or 'COPY 1000'
+        tail = result.rsplit(' ', 1)[-1]
+        return int(tail) if tail.isdigit() else 0
+    return 0
+
+
+class TracedConnection:
+    """
+    asyncpg connection proxy that times fetch/fetchrow/fetchval/execute.
+
+    Queries are labelled with the qualified name of the calling function
+    (e.g. CandidateGenerator._category_based_on_views), so the existing
+    engine code needs no changes. The pool wait of the acquire is charged
+    to the first query on the connection. Everything else (transaction,
+    cursor, copy_*) is passed through untouched.
+    """
+
+    def __init__(self, conn, pool, wait_ms: float):
+        self._conn = conn
+        self._pool = pool
+        self._wait_ms = wait_ms
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def fetch(self, query: str, *args, **kwargs):
+        return await self._run('fetch', _caller(), query, args, kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        return await self._run('fetchrow', _caller(), query, args, kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        return await self._run('fetchval', _caller(), query, args, kwargs)
+
+    async def execute(self, query: str, *args, **kwargs):
+        return await self._run('execute', _caller(), query, args, kwargs)
+
+    async def _run(self, method: str, label: str, query: str, args: tuple, kwargs: dict):
+        wait_ms, self._wait_ms = self._wait_ms, 0.0
+        start = time.perf_counter()
+        result = await getattr(self._conn, method)(query, *args, **kwargs)
+        duration_ms = (time.perf_counter() - start) * 1000
+        rows = _row_count(method, result)
+
+        QUERY_SECONDS.observe(duration_ms / 1000, query=label)
+        QUERY_ROWS.inc(rows, query=label)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(label, duration_ms, rows, wait_ms)
+        if duration_ms >= settings.trace_slow_query_ms:
+            SLOW_QUERIES.inc(query=label)
+            get_explain_sampler().slow_query(self._pool, label, query, args, duration_ms)
+        return result
+
+
+class _TracedAcquire:
+    def __init__(self, pool):
+        self._pool = pool
+        self._context = pool.acquire()
+
+    async def __aenter__(self) -> TracedConnection:
+        start = time.perf_counter()
+        conn = await self._context.__aenter__()
+        wait_ms = (time.perf_counter() - start) * 1000
+        POOL_WAIT_SECONDS.observe(wait_ms / 1000)
+        return TracedConnection(conn, self._pool, wait_ms)
+
+    async def __aexit__(self, *exc):
+        return await self._context.__aexit__(*exc)
+
+
+class TracedPool:
+    """asyncpg pool proxy handing out TracedConnection objects"""
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def acquire(self) -> _TracedAcquire:
+        return _TracedAcquire(self._pool)
+
+    async def fetch(self, query: str, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn._run('fetch', _caller(), query, args, kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn._run('fetchrow', _caller(), query, args, kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn._run('fetchval', _caller(), query, args, kwargs)
+
+    async def execute(self, query: str, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn._run('execute', _caller(), query, args, kwargs)
+
+
+def traced(pool):
+    """Wrap a pool once (engines are created per request from the same pool)"""
+    return pool if pool is None or isinstance(pool, TracedPool) else TracedPool(pool)
+
+
+def _caller() -> str:
+    # Frame 0 is _caller, 1 the proxy method, 2 the code that issued the query
+    return sys._getframe(2).f_code.co_qualname
+
+
+class ExplainSampler:
+    """
+    Logs slow queries and, for a sample of them, their EXPLAIN ANALYZE plan.
+
+    The plan is taken in a background task on a separate connection with the
+    original arguments, at most once per query label per
+    trace_explain_interval_seconds. Only SELECT/WITH statements are
+    re-executed; writes are logged without a plan.
+    """
+
+    def __init__(self):
+        self._last_explained: Dict[str, float] = {}
+        self._tasks = set()
+
+    def slow_query(self, pool, label: str, query: str, args: tuple, duration_ms: float):
+        now = time.monotonic()
+        readonly = query.lstrip().upper().startswith(('SELECT', 'WITH'))
+        due = now - self._last_explained.get(label, float('-inf')) >= settings.trace_explain_interval_seconds
+        if not (readonly and due and random.random() < settings.trace_explain_sample_rate):
+            logger.warning(f"Slow query - {label} took {duration_ms:.1f}ms")
+            return
+
+        self._last_explained[label] = now
+        task = asyncio.create_task(self._explain(pool, label, query, args, duration_ms))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, pool, label: str, query: str, args: tuple, duration_ms: float):
+        # Untraced pool, so the EXPLAIN does not show up in the request trace or metrics
+        timeout_ms = int(max(duration_ms * 10, 1000))
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction(readonly=True):
+                    await conn.execute(f"SET LOCAL statement_timeout = {timeout_ms}")
+                    rows = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {query}", *args)
+            plan = "\n".join(row[0] for row in rows)
+            logger.warning(f"Slow query - {label} took {duration_ms:.1f}ms, plan:\n{plan}")
+        except Exception as e:
+            logger.warning(f"Slow query - {label} took {duration_ms:.1f}ms (EXPLAIN failed: {e})")
+
+
+@lru_cache()
+def get_explain_sampler() -> ExplainSampler:
+    """Process-wide slow-query EXPLAIN sampler"""
+    return ExplainSampler()
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+
+settings = get_settings()
+logger = get_rec_logger("cache")
+
+Compute = Callable[[], Awaitable[Tuple[List[dict], str]]]
+
+
+class RecommendationCache:
+    """
+    Two-tier cache for /recommendations responses.
+
+    Tier 1 is an in-process LRU with a short TTL, tier 2 is Redis (one hash
+    per user, so a user's entries can be dropped with a single DEL).
+    Entries are fresh for cache_ttl_seconds and may then be served stale
+    for cache_stale_seconds while one background task recomputes them
+    (stale-while-revalidate). Concurrent misses for the same key share one
+    computation (single-flight). If Redis is unreachable the cache keeps
+    working with the local tier only and retries Redis after a back-off.
+    """
+
+    def __init__(self):
+        # Keyed by (user_id, field): ids and product handles may contain any character
+        self._local: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self._local_keys_by_user: Dict[str, set] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Invalidations of users with computations in flight (dropped when the last one ends)
+        self._computing: Dict[str, int] = {}
+        self._generation: Dict[str, int] = {}
+        self._redis: Optional[aioredis.Redis] = None
+        self._redis_retry_at = 0.0
+        self.counters = {
+            "local_hits": 0, "redis_hits": 0, "stale_hits": 0, "misses": 0,
+            "coalesced": 0, "invalidations": 0, "redis_errors": 0
+        }
+        self.latency_ms = {"lookup_total": 0.0, "lookups": 0, "compute_total": 0.0, "computes": 0}
+
+    async def connect(self):
+        self._redis = aioredis.from_url(
+            settings.redis_url,
+            socket_timeout=settings.cache_redis_timeout_seconds,
+            socket_connect_timeout=settings.cache_redis_timeout_seconds
+        )
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._redis is not None:
+            await self._redis.close()
+
+    @staticmethod
+    def make_key(context: str, product_handle: Optional[str], limit: int) -> str:
+        return f"{context}:{product_handle or '-'}:{limit}"
+
+    async def get_or_compute(self, user_id: str, context: str, product_handle: Optional[str],
+                             limit: int, compute: Compute) -> Tuple[List[dict], str, bool]:
+        """Return (recommendations, algorithm, cached)"""
+        field = self.make_key(context, product_handle, limit)
+        start = time.perf_counter()
+        entry, tier = await self._lookup(user_id, field)
+        self.latency_ms["lookup_total"] += (time.perf_counter() - start) * 1000
+        self.latency_ms["lookups"] += 1
+
+        now = time.time()
+        if entry is not None:
+            if now < entry["fresh_until"]:
+                self.counters[f"{tier}_hits"] += 1
+                return entry["recommendations"], entry["algorithm"], True
+            if now < entry["stale_until"]:
+                self.counters["stale_hits"] += 1
+                self._single_flight(user_id, field, compute)
+                return entry["recommendations"], entry["algorithm"], True
+
+        self.counters["misses"] += 1
+        recommendations, algorithm = await asyncio.shield(self._single_flight(user_id, field, compute))
+        return recommendations, algorithm, False
+
+    async def invalidate_user(self, user_id: str):
+        """Drop every cached response of a user (called when /track records an interaction)"""
+        self.counters["invalidations"] += 1
+        if user_id in self._computing:
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+        for field in self._local_keys_by_user.pop(user_id, ()):
+            self._local.pop((user_id, field), None)
+        if self._redis_available():
+            try:
+                await self._redis.delete(self._redis_key(user_id))
+            except Exception as e:
+                self._redis_failed(e)
+
+    def stats(self) -> dict:
+        c = self.counters
+        hits = c["local_hits"] + c["redis_hits"] + c["stale_hits"]
+        lookups = hits + c["misses"]
+        return {
+            **c,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "local_entries": len(self._local),
+            "inflight": len(self._inflight),
+            "redis_available": self._redis_available(),
+            "avg_lookup_ms": round(self.latency_ms["lookup_total"] / self.latency_ms["lookups"], 3)
+            if self.latency_ms["lookups"] else None,
+            "avg_compute_ms": round(self.latency_ms["compute_total"] / self.latency_ms["computes"], 2)
+            if self.latency_ms["computes"] else None
+        }
+
+    def _single_flight(self, user_id: str, field: str, compute: Compute) -> asyncio.Task:
+        key = (user_id, field)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            return task
+        task = asyncio.create_task(self._compute_and_store(user_id, field, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return task
+
+    def _finish(self, key: Tuple[str, str], task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Recommendation computation failed - key={key} error={task.exception()}")
+
+    async def _compute_and_store(self, user_id: str, field: str, compute: Compute) -> Tuple[List[dict], str]:
+        self._computing[user_id] = self._computing.get(user_id, 0) + 1
+        try:
+            generation = self._generation.get(user_id, 0)
+            start = time.perf_counter()
+            recommendations, algorithm = await compute()
+            self.latency_ms["compute_total"] += (time.perf_counter() - start) * 1000
+            self.latency_ms["computes"] += 1
+            # Skip the write if an interaction invalidated the user while we were computing
+            invalidated = self._generation.get(user_id, 0) != generation
+        finally:
+            self._computing[user_id] -= 1
+            if not self._computing[user_id]:
+                del self._computing[user_id]
+                self._generation.pop(user_id, None)
+
+        if not invalidated:
+            now = time.time()
+            entry = {
+                "recommendations": recommendations,
+                "algorithm": algorithm,
+                "fresh_until": now + settings.cache_ttl_seconds,
+                "stale_until": now + settings.cache_ttl_seconds + settings.cache_stale_seconds
+            }
+            self._store_local(user_id, field, entry)
+            if self._redis_available():
+                try:
+                    redis_key = self._redis_key(user_id)
+                    async with self._redis.pipeline(transaction=False) as pipe:
+                        pipe.hset(redis_key, field, json.dumps(entry))
+                        pipe.expire(redis_key, settings.cache_ttl_seconds + settings.cache_stale_seconds)
+                        await pipe.execute()
+                except Exception as e:
+                    self._redis_failed(e)
+
+        return recommendations, algorithm
+
+    async def _lookup(self, user_id: str, field: str) -> Tuple[Optional[dict], Optional[str]]:
+        key = (user_id, field)
+        entry = self._local.get(key)
+        if entry is not None:
+            if time.time() < entry["local_until"]:
+                self._local.move_to_end(key)
+                return entry, "local"
+            self._local.pop(key, None)
+
+        if not self._redis_available():
+            return None, None
+        try:
+            raw = await self._redis.hget(self._redis_key(user_id), field)
+        except Exception as e:
+            self._redis_failed(e)
+            return None, None
+        if raw is None:
+            return None, None
+
+        entry = json.loads(raw)
+        self._store_local(user_id, field, entry)
+        return entry, "redis"
+
+    def _store_local(self, user_id: str, field: str, entry: dict):
+        key = (user_id, field)
+        entry = dict(entry, local_until=min(time.time() + settings.cache_local_ttl_seconds, entry["stale_until"]))
+        self._local[key] = entry
+        self._local.move_to_end(key)
+        self._local_keys_by_user.setdefault(user_id, set()).add(field)
+        while len(self._local) > settings.cache_local_max_entries:
+            (old_user, old_field), _ = self._local.popitem(last=False)
+            fields = self._local_keys_by_user.get(old_user)
+            if fields is not None:
+                fields.discard(old_field)
+                if not fields:
+                    del self._local_keys_by_user[old_user]
+
+    @staticmethod
+    def _redis_key(user_id: str) -> str:
+        return f"rec:recommendations:{user_id}"
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception):
+        self.counters["redis_errors"] += 1
+        if self._redis_available():
+            logger.warning(f"Redis cache unavailable, using local tier only: {error}")
+        self._redis_retry_at = time.monotonic() + settings.cache_redis_retry_seconds
+
+
+@lru_cache()
+def get_recommendation_cache() -> RecommendationCache:
+    """Process-wide recommendation cache"""
+    return RecommendationCache()
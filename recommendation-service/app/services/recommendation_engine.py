@@ -1,42 +1,46 @@
 import asyncpg
-import json
-from datetime import datetime, timedelta
 from typing import List, Tuple, Optional
 import numpy as np
 from collections import defaultdict, Counter
-import random
+import time
 
 from app.config import get_settings
 from app.logging_config import get_rec_logger, log_algorithm_selection
+from app.services.similarity_engine import SimilarityEngine
+from app.services.bulk_writer import BulkWriter
+from app.services.candidate_generator import CandidateGenerator
+from app.services.catalog_snapshot import get_catalog_snapshot
+from app.services.price_resolver import PriceResolver
+from app.services.product_sampler import get_product_sampler
+from app.services.popularity_stats import PopularityStats, ALL_TIME
+from app.services.cf_model import get_cf_model
+from app.services.ann_index import get_item_index
+from app.services.candidate_pool import CandidatePool, RANKING_SIGNALS, get_candidate_pools
+from app.services.query_tracer import traced
+from app.services.reranker import Reranker
 
 settings = get_settings()
 logger = get_rec_logger("engine")
 
-def format_price(amount: float, currency_code: str) -> str:
-    """Format price with proper currency symbol and formatting"""
-    currency_upper = currency_code.upper()
-    
-    if currency_upper == "VND":
-        return f"{int(amount):,}₫"
-    elif currency_upper == "USD":
-        return f"${amount:,.2f}"
-    elif currency_upper == "EUR":
-        return f"€{amount:,.2f}"
-    else:
-        return f"{amount:,.2f} {currency_upper}"
-
 class RecommendationEngine:
     def __init__(self, db_pool):
-        self.db_pool = db_pool
+        # Queries are timed per calling function (GET /metrics, debug timings)
+        self.db_pool = traced(db_pool)
+        self.catalog = get_catalog_snapshot()
+        self.sampler = get_product_sampler()
+        self.popularity = PopularityStats(self.db_pool)
+        self.cf_model = get_cf_model()
+        self.item_index = get_item_index()
+        self.candidates = CandidateGenerator(self)
+        self.reranker = Reranker(self.catalog)
+        self.timings = self.candidates.timings
     
     async def get_personalized_recommendations(self, user_id: str, limit: int = 12) -> Tuple[List[dict], str]:
         """Get personalized recommendations for user (hybrid approach)"""
         
         logger.info(f"Getting personalized recommendations - user={user_id} limit={limit}")
         
-        user_stats = await self._get_user_interaction_stats(user_id)
-        prefs = await self._get_user_preferences(user_id)
-        recent_products = await self._get_user_recent_products(user_id, limit=10)
+        user_stats, prefs, recent_products = await self.candidates.load_profile(user_id)
         
         if user_stats['total_interactions'] > 0:
             log_algorithm_selection(
@@ -51,119 +55,62 @@ class RecommendationEngine:
         if trending:
             return trending, "trending"
         return await self._get_random_products(limit), "random"
-        
-        # Hybrid recommendation
-        recommendations = []
-        
-        # 1. Content-based: Based on user preferences
-        if prefs and prefs.get('category_scores'):
-            content_recs = await self._get_content_based_recommendations(prefs, limit=limit//2)
-            recommendations.extend(content_recs)
-        
-        # 2. Collaborative: Similar users' purchases
-        collab_recs = await self._get_collaborative_recommendations(user_id, limit=limit//2)
-        recommendations.extend(collab_recs)
-        
-        # 3. Similar to recently viewed
-        if recent_products:
-            for product_handle in recent_products[:3]:
-                similar = await self._get_similar_products_by_handle(product_handle, limit=2)
-                recommendations.extend(similar)
-        
-        # Remove duplicates, keep order
-        seen = set()
-        unique_recs = []
-        for rec in recommendations:
-            if rec['handle'] not in seen:
-                seen.add(rec['handle'])
-                unique_recs.append(rec)
-        
-        # If still not enough, add random popular products
-        if len(unique_recs) < limit:
-            random_products = await self._get_random_products(limit - len(unique_recs))
-            for product in random_products:
-                if product['handle'] not in seen:
-                    unique_recs.append(product)
-                    seen.add(product['handle'])
-        
-        # DEMO MODE: Shuffle to show different products on each refresh
-        random.shuffle(unique_recs)
-        
-        return unique_recs[:limit], "hybrid"
     
-    async def _get_user_interaction_stats(self, user_id: str) -> dict:
-        """Get user interaction statistics"""
+    async def get_materialized_recommendations(self, user_id: str, limit: int) -> Optional[Tuple[List[dict], str]]:
+        """Stored list of the materialization job, or None when missing, stale or too short"""
         async with self.db_pool.acquire() as conn:
-            stats = await conn.fetchrow("""
-                SELECT 
-                    COUNT(*) as total_interactions,
-                    COUNT(DISTINCT product_handle) as unique_products_viewed,
-                    SUM(CASE WHEN interaction_type = 'view' THEN 1 ELSE 0 END) as views,
-                    SUM(CASE WHEN interaction_type = 'add_to_cart' THEN 1 ELSE 0 END) as cart_adds,
-                    SUM(CASE WHEN interaction_type = 'wishlist' THEN 1 ELSE 0 END) as wishlist_adds,
-                    SUM(CASE WHEN interaction_type = 'purchase' THEN 1 ELSE 0 END) as purchases
-                FROM recommendation.rec_user_interactions
+            row = await conn.fetchrow("""
+                SELECT handles
+                FROM rec_user_recommendations
                 WHERE user_id = $1
-            """, user_id)
-            
-            result = dict(stats) if stats else {
-                'total_interactions': 0, 'unique_products_viewed': 0,
-                'views': 0, 'cart_adds': 0, 'wishlist_adds': 0, 'purchases': 0
-            }
-            logger.debug(f"User interaction stats - user={user_id} stats={result}")
-            return result
+                AND computed_at > NOW() - make_interval(secs => $2::int)
+            """, user_id, settings.materialize_max_age_seconds)
+        if not row:
+            return None
+        
+        handles = row['handles']
+        products = await self._get_products_by_handles(handles)
+        position = {handle: i for i, handle in enumerate(handles)}
+        products.sort(key=lambda p: position[p['handle']])
+        if len(products) < min(limit, settings.materialize_size):
+            return None
+        return products[:limit], "materialized"
     
     async def _get_interaction_based_recommendations(self, user_id: str, stats: dict, prefs: dict, recent_products: List[str], limit: int) -> Tuple[List[dict], str]:
         """Generate recommendations based on user interactions"""
-        recommendations = []
-        
-        # Strategy 1: Similar to products in cart/wishlist (highest priority)
-        if stats['cart_adds'] > 0 or stats['wishlist_adds'] > 0:
-            cart_wishlist_recs = await self._get_similar_to_cart_wishlist(user_id, limit=limit//3)
-            recommendations.extend(cart_wishlist_recs)
-            logger.info(f"Added similar to cart/wishlist - count={len(cart_wishlist_recs)}")
-        
-        # Strategy 2: Category-based on viewed products
-        if stats['views'] > 0:
-            category_recs = await self._get_category_based_on_views(user_id, limit=limit//3)
-            recommendations.extend(category_recs)
-            logger.info(f"Added category-based recommendations - count={len(category_recs)}")
-        
-        # Strategy 3: Collaborative filtering (users with similar interactions)
-        if stats['unique_products_viewed'] >= 3:
-            collab_recs = await self._get_collaborative_recommendations(user_id, limit=limit//3)
-            recommendations.extend(collab_recs)
-            logger.info(f"Added collaborative recommendations - count={len(collab_recs)}")
-        
-        # Strategy 4: Similar to most viewed products
-        if recent_products and len(recent_products) > 0:
-            for product_handle in recent_products[:3]:
-                similar = await self._get_similar_products_by_handle(product_handle, limit=2)
-                recommendations.extend(similar)
-            logger.info(f"Added similar to recent products - count={len(recent_products)}")
-        
-        seen = set()
-        unique_recs = []
-        for rec in recommendations:
-            if rec['handle'] not in seen:
-                seen.add(rec['handle'])
-                unique_recs.append(rec)
+        # Strategies (cart/wishlist, viewed categories, collaborative, similar to recent)
+        # run concurrently; the result is already de-duplicated and hydrated
+        unique_recs, ranked = await self.candidates.generate(user_id, stats, recent_products, limit)
+        seen = {rec['handle'] for rec in unique_recs}
         
         if len(unique_recs) < limit:
+            fill_start = time.perf_counter()
             trending = await self._get_trending_products(limit - len(unique_recs))
+            fill = []
             for product in trending:
                 if product['handle'] not in seen:
                     unique_recs.append(product)
                     seen.add(product['handle'])
+                    fill.append(product['handle'])
+            ranked.append(('fill', fill))
+            self.timings['fill_ms'] = round((time.perf_counter() - fill_start) * 1000, 2)
         
-        random.shuffle(unique_recs)
+        # Score fusion, seeded exploration and category/collection diversity
+        unique_recs = self.reranker.rerank(unique_recs, ranked, limit, seed_key=user_id)
+        self.timings['rerank_ms'] = self.reranker.last_ms
         
         algorithm = f"personalized({stats['total_interactions']} interactions)"
-        return unique_recs[:limit], algorithm
+        return unique_recs, algorithm
     
     async def get_similar_products(self, product_handle: str, limit: int = 12) -> Tuple[List[dict], str]:
         """Get products similar to given product"""
         
+        if self.item_index.is_ready:
+            # Over-fetch a little: hydration skips unpriced products
+            similar = self.catalog.get_many(self.item_index.similar(product_handle, limit + 4))[:limit]
+            if similar:
+                return similar, "ann"
+        
         similar = await self._get_precomputed_similar(product_handle, limit)
         
         if similar:
@@ -174,112 +121,52 @@ class RecommendationEngine:
     async def get_frequently_bought_together(self, user_id: str, limit: int = 6) -> Tuple[List[dict], str]:
         """Get products frequently bought together with cart items"""
         
-        # Get user's cart items (from recent add_to_cart interactions)
+        # Look up the pre-mined pairs for the user's recent cart items in one query
         async with self.db_pool.acquire() as conn:
-            cart_items = await conn.fetch("""
-                SELECT DISTINCT product_handle
-                FROM rec_user_interactions
-                WHERE user_id = $1
-                AND interaction_type = 'add_to_cart'
-                AND timestamp > NOW() - INTERVAL '7 days'
-                ORDER BY product_handle
-                LIMIT 5
-            """, user_id)
+            rows = await conn.fetch("""
+                WITH cart_items AS (
+                    SELECT product_handle, MAX(timestamp) as latest
+                    FROM rec_user_interactions
+                    WHERE user_id = $1
+                    AND interaction_type = 'add_to_cart'
+                    AND product_handle IS NOT NULL
+                    AND timestamp > NOW() - INTERVAL '7 days'
+                    GROUP BY product_handle
+                    ORDER BY latest DESC
+                    LIMIT 5
+                )
+                SELECT ft.product_id_2 as handle, MAX(ft.confidence_score) as score
+                FROM rec_frequently_together ft
+                JOIN cart_items ci ON ft.product_id_1 = ci.product_handle
+                WHERE ft.product_id_2 NOT IN (SELECT product_handle FROM cart_items)
+                GROUP BY ft.product_id_2
+                ORDER BY score DESC
+                LIMIT $2
+            """, user_id, limit)
         
-        if not cart_items:
+        if not rows:
             return [], "none"
         
-        # Get frequently bought together items
-        recommendations = []
-        async with self.db_pool.acquire() as conn:
-            for item in cart_items:
-                fbt = await conn.fetch("""
-                    SELECT product_id_2, confidence_score
-                    FROM rec_frequently_together
-                    WHERE product_id_1 = $1
-                    ORDER BY confidence_score DESC
-                    LIMIT 3
-                """, item['product_handle'])
-                
-                for row in fbt:
-                    recommendations.append({
-                        'handle': row['product_id_2'],
-                        'score': float(row['confidence_score'])
-                    })
-        
-        # Get product details
-        if recommendations:
-            handles = [r['handle'] for r in recommendations[:limit]]
-            products = await self._get_products_by_handles(handles)
-            return products, "frequently_bought_together"
-        
-        return [], "none"
+        handles = [row['handle'] for row in rows]
+        products = await self._get_products_by_handles(handles)
+        position = {handle: i for i, handle in enumerate(handles)}
+        products.sort(key=lambda p: position[p['handle']])
+        return products, "frequently_bought_together"
     
     async def compute_all_similarities(self) -> int:
         """Compute product similarities (run as batch job)"""
+        similarity_engine = SimilarityEngine()
         
-        # Get all products from Medusa using product_category and product_collection
         async with self.db_pool.acquire() as conn:
-            products = await conn.fetch("""
-                SELECT DISTINCT
-                    p.id,
-                    p.handle,
-                    p.title,
-                    p.description,
-                    COALESCE(pc.name, pcol.title, 'uncategorized') as category,
-                    pv.calculated_price_id
-                FROM product p
-                LEFT JOIN product_category_product pcp ON p.id = pcp.product_id
-                LEFT JOIN product_category pc ON pcp.product_category_id = pc.id
-                LEFT JOIN product_collection pcol ON p.collection_id = pcol.id
-                LEFT JOIN product_variant pv ON p.id = pv.product_id
-                WHERE p.status = 'published'
-                AND p.deleted_at IS NULL
-                LIMIT 1000
-            """)
+            products = await similarity_engine.load_products(conn)
         
-        count = 0
+        pairs = await similarity_engine.compute(products)
         
-        for i, prod1 in enumerate(products):
-            for prod2 in products[i+1:]:
-                similarity = self._compute_content_similarity(prod1, prod2)
-                
-                if similarity > 0.3:
-                    await self._store_similarity(
-                        prod1['handle'],
-                        prod2['handle'],
-                        similarity,
-                        'content'
-                    )
-                    count += 1
+        # Replace the previous content neighbours in one COPY + merge
+        await BulkWriter(self.db_pool).write_similarities(pairs, 'content', replace=True)
         
-        return count
-    
-    def _compute_content_similarity(self, prod1: dict, prod2: dict) -> float:
-        """Compute similarity between two products"""
-        score = 0.0
-        
-        if prod1.get('category') == prod2.get('category') and prod1.get('category'):
-            score += 0.6
-        
-        if prod1.get('title') and prod2.get('title'):
-            words1 = set(prod1['title'].lower().split())
-            words2 = set(prod2['title'].lower().split())
-            overlap = len(words1 & words2) / max(len(words1 | words2), 1)
-            score += overlap * 0.4
-        
-        return min(score, 1.0)
-    
-    async def _store_similarity(self, handle1: str, handle2: str, score: float, sim_type: str):
-        """Store product similarity"""
-        async with self.db_pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO rec_product_similarities 
-                (product_id_1, product_id_2, similarity_score, similarity_type, updated_at)
-                VALUES ($1, $2, $3, $4, NOW())
-                ON CONFLICT (product_id_1, product_id_2, similarity_type)
-                DO UPDATE SET similarity_score = $3, updated_at = NOW()
-            """, handle1, handle2, score, sim_type)
+        logger.info(f"Stored content similarities - products={len(products)} pairs={len(pairs)}")
+        return len(pairs)
     
     async def _get_user_preferences(self, user_id: str) -> dict:
         """Get user preferences"""
@@ -298,127 +185,14 @@ class RecommendationEngine:
                 'price_max': float(prefs['price_max']) if prefs['price_max'] else None
             }
     
-    async def _get_user_recent_products(self, user_id: str, limit: int = 10) -> List[str]:
-        """Get user's recently viewed/interacted products"""
-        async with self.db_pool.acquire() as conn:
-            rows = await conn.fetch("""
-                SELECT DISTINCT ON (product_handle) product_handle, timestamp
-                FROM rec_user_interactions
-                WHERE user_id = $1
-                AND product_handle IS NOT NULL
-                ORDER BY product_handle, timestamp DESC
-                LIMIT $2
-            """, user_id, limit)
-            
-            return [row['product_handle'] for row in rows]
-    
-    async def _get_content_based_recommendations(self, prefs: dict, limit: int) -> List[dict]:
-        """Get recommendations based on user preferences using product_category and product_collection"""
-        category_scores = prefs.get('category_scores', {})
-        
-        if isinstance(category_scores, str):
-            try:
-                category_scores = json.loads(category_scores)
-            except:
-                category_scores = {}
-        
-        if not category_scores:
-            return []
-        
-        top_categories = sorted(category_scores.items(), key=lambda x: x[1], reverse=True)[:3]
-        
-        recommendations = []
-        async with self.db_pool.acquire() as conn:
-            for category_name, score in top_categories:
-                # Try to find products by product_category first
-                products = await conn.fetch("""
-                    WITH product_vnd_price AS (
-                        SELECT DISTINCT
-                            p.id,
-                            p.handle,
-                            p.title,
-                            p.thumbnail,
-                            pc.name as category,
-                            pr.amount,
-                            pr.currency_code,
-                            ROW_NUMBER() OVER (PARTITION BY p.id ORDER BY 
-                                CASE WHEN pr.currency_code = 'vnd' THEN 1 
-                                     WHEN pr.currency_code = 'usd' THEN 2 
-                                     ELSE 3 END
-                            ) as rn
-                        FROM product p
-                        LEFT JOIN product_category_product pcp ON p.id = pcp.product_id
-                        LEFT JOIN product_category pc ON pcp.product_category_id = pc.id
-                        LEFT JOIN product_variant pv ON p.id = pv.product_id
-                        LEFT JOIN product_variant_price_set pvps ON pv.id = pvps.variant_id
-                        LEFT JOIN price pr ON pvps.price_set_id = pr.price_set_id
-                        WHERE pc.name ILIKE $1
-                        AND p.status = 'published'
-                        AND p.deleted_at IS NULL
-                    )
-                    SELECT id, handle, title, thumbnail, category, amount, currency_code
-                    FROM product_vnd_price
-                    WHERE rn = 1
-                    ORDER BY RANDOM()
-                    LIMIT 2
-                """, f"%{category_name}%")
-                
-                # If no products found in categories, try collections
-                if not products:
-                    products = await conn.fetch("""
-                        WITH product_vnd_price AS (
-                            SELECT 
-                                p.id,
-                                p.handle,
-                                p.title,
-                                p.thumbnail,
-                                pcol.title as category,
-                                pr.amount,
-                                pr.currency_code,
-                                ROW_NUMBER() OVER (PARTITION BY p.id ORDER BY 
-                                    CASE WHEN pr.currency_code = 'vnd' THEN 1 
-                                         WHEN pr.currency_code = 'usd' THEN 2 
-                                         ELSE 3 END
-                                ) as rn
-                            FROM product p
-                            LEFT JOIN product_collection pcol ON p.collection_id = pcol.id
-                            LEFT JOIN product_variant pv ON p.id = pv.product_id
-                            LEFT JOIN product_variant_price_set pvps ON pv.id = pvps.variant_id
-                            LEFT JOIN price pr ON pvps.price_set_id = pr.price_set_id
-                            WHERE pcol.title ILIKE $1
-                            AND p.status = 'published'
-                            AND p.deleted_at IS NULL
-                        )
-                        SELECT id, handle, title, thumbnail, category, amount, currency_code
-                        FROM product_vnd_price
-                        WHERE rn = 1
-                        ORDER BY RANDOM()
-                        LIMIT 2
-                    """, f"%{category_name}%")
-                
-                for p in products:
-                    rec = {
-                        'id': p['id'],
-                        'handle': p['handle'],
-                        'title': p['title'],
-                        'thumbnail': p['thumbnail'],
-                        'score': score
-                    }
-                    
-                    if p['amount'] and p['currency_code']:
-                        rec['price'] = {
-                            'amount': format_price(p['amount'], p['currency_code']),
-                            'currencyCode': p['currency_code'].upper()
-                        }
-                    
-                    recommendations.append(rec)
-        
-        return recommendations[:limit]
+    async def _get_collaborative_handles(self, user_id: str, limit: int) -> List[str]:
+        """Collaborative candidates, by relevance from the ALS model when it knows the user"""
+        if self.cf_model.has_user(user_id):
+            return [handle for handle, _ in self.cf_model.recommend(user_id, limit)]
+        return await self._get_collaborative_handles_sql(user_id, limit)
     
-    async def _get_collaborative_recommendations(self, user_id: str, limit: int) -> List[dict]:
-        """Get recommendations based on similar users"""
-        
-        # Find similar users (users who interacted with same products)
+    async def _get_collaborative_handles_sql(self, user_id: str, limit: int) -> List[str]:
+        """Find product handles bought/carted by users who interacted with the same products"""
         async with self.db_pool.acquire() as conn:
             similar_users = await conn.fetch("""
                 WITH user_products AS (
@@ -448,227 +222,86 @@ class RecommendationEngine:
                 LIMIT $2
             """, user_id, limit)
             
-            handles = [row['product_handle'] for row in similar_users]
-            
-            if not handles:
-                return []
-            
-            return await self._get_products_by_handles(handles)
+            return [row['product_handle'] for row in similar_users]
     
     async def _get_trending_products(self, limit: int) -> List[dict]:
-        """Get trending products (most viewed recently)"""
-        return await self.get_most_viewed_products(limit)
-
-    async def get_most_viewed_products(self, user_id: str, limit: int) -> List[dict]:
-        """Get most viewed products from personalized recommendations"""
-        # 1. Get a larger pool of personalized recommendations
-        candidates, _ = await self.get_personalized_recommendations(user_id, limit=50)
-        
-        if not candidates:
+        """Get trending products (most viewed recently, topped up with all-time views)"""
+        handles = await self.popularity.top('view', settings.popularity_trending_window, limit)
+        if len(handles) < limit:
+            seen = set(handles)
+            more = await self.popularity.top('view', ALL_TIME, limit + len(handles))
+            handles.extend(h for h in more if h not in seen)
+        if not handles:
             return []
-            
-        candidate_handles = [p['handle'] for p in candidates]
+        return (await self._get_products_by_handles(handles))[:limit]
+
+    async def get_candidate_pool(self, user_id: str) -> CandidatePool:
+        """Personalized candidate pool of a user, built once per TTL and shared by all rails"""
+        async def build() -> CandidatePool:
+            candidates, algorithm = await self.get_personalized_recommendations(
+                user_id, limit=settings.candidate_pool_size
+            )
+            signals = await self.popularity.counts_by_type(
+                RANKING_SIGNALS, [p['handle'] for p in candidates]
+            )
+            return CandidatePool(user_id, candidates, algorithm, signals)
         
-        # 2. Sort candidates by view count
-        async with self.db_pool.acquire() as conn:
-            # Get view counts for these candidates
-            stats = await conn.fetch("""
-                SELECT product_handle, COUNT(*) as views
-                FROM rec_user_interactions
-                WHERE interaction_type = 'view'
-                AND product_handle = ANY($1::text[])
-                GROUP BY product_handle
-            """, candidate_handles)
-            
-            # Create a map of handle -> views
-            view_map = {row['product_handle']: row['views'] for row in stats}
-            
-            # Sort candidates by views (descending)
-            candidates.sort(key=lambda x: view_map.get(x['handle'], 0), reverse=True)
-            
-            return candidates[:limit]
+        return await get_candidate_pools().get(user_id, build)
+
+    async def _rank_personalized_by(self, user_id: str, interaction_type: str, limit: int) -> List[dict]:
+        """Personalized candidates ordered by their all-time counter for one interaction type"""
+        pool = await self.get_candidate_pool(user_id)
+        return pool.rank(interaction_type, limit)
 
     async def get_personalized_top_selling(self, user_id: str, limit: int) -> List[dict]:
         """Get top selling products from personalized recommendations"""
-        # 1. Get a larger pool of personalized recommendations
-        candidates, _ = await self.get_personalized_recommendations(user_id, limit=50)
-        
-        if not candidates:
-            return []
-            
-        candidate_handles = [p['handle'] for p in candidates]
-        
-        # 2. Sort candidates by purchase count
-        async with self.db_pool.acquire() as conn:
-            # Get purchase counts for these candidates
-            stats = await conn.fetch("""
-                SELECT product_handle, COUNT(*) as purchases
-                FROM rec_user_interactions
-                WHERE interaction_type = 'purchase'
-                AND product_handle = ANY($1::text[])
-                GROUP BY product_handle
-            """, candidate_handles)
-            
-            purchase_map = {row['product_handle']: row['purchases'] for row in stats}
-            candidates.sort(key=lambda x: purchase_map.get(x['handle'], 0), reverse=True)
-            
-            return candidates[:limit]
+        return await self._rank_personalized_by(user_id, 'purchase', limit)
 
     async def get_personalized_most_viewed(self, user_id: str, limit: int) -> List[dict]:
         """Get most viewed products from personalized recommendations"""
-        # 1. Get a larger pool of personalized recommendations
-        candidates, _ = await self.get_personalized_recommendations(user_id, limit=50)
-        
-        if not candidates:
-            return []
-            
-        candidate_handles = [p['handle'] for p in candidates]
-        
-        # 2. Sort candidates by view count
-        async with self.db_pool.acquire() as conn:
-            # Get view counts for these candidates
-            stats = await conn.fetch("""
-                SELECT product_handle, COUNT(*) as views
-                FROM rec_user_interactions
-                WHERE interaction_type = 'view'
-                AND product_handle = ANY($1::text[])
-                GROUP BY product_handle
-            """, candidate_handles)
-            
-            view_map = {row['product_handle']: row['views'] for row in stats}
-            candidates.sort(key=lambda x: view_map.get(x['handle'], 0), reverse=True)
-            
-            return candidates[:limit]
+        return await self._rank_personalized_by(user_id, 'view', limit)
 
     async def get_personalized_most_wishlisted(self, user_id: str, limit: int) -> List[dict]:
         """Get most wishlisted products from personalized recommendations"""
-        # 1. Get a larger pool of personalized recommendations
-        candidates, _ = await self.get_personalized_recommendations(user_id, limit=50)
-        
-        if not candidates:
+        return await self._rank_personalized_by(user_id, 'wishlist', limit)
+
+    async def get_popular_products(self, interaction_type: str, limit: int,
+                                   window: str = ALL_TIME) -> List[dict]:
+        """Most-interacted products for one interaction type and window (global)"""
+        handles = await self.popularity.top(interaction_type, window, limit)
+        if not handles:
             return []
-            
-        candidate_handles = [p['handle'] for p in candidates]
-        
-        # 2. Sort candidates by wishlist count
-        async with self.db_pool.acquire() as conn:
-            # Get wishlist counts for these candidates
-            stats = await conn.fetch("""
-                SELECT product_handle, COUNT(*) as wishes
-                FROM rec_user_interactions
-                WHERE interaction_type = 'wishlist'
-                AND product_handle = ANY($1::text[])
-                GROUP BY product_handle
-            """, candidate_handles)
-            
-            wishlist_map = {row['product_handle']: row['wishes'] for row in stats}
-            candidates.sort(key=lambda x: wishlist_map.get(x['handle'], 0), reverse=True)
-            
-            return candidates[:limit]
+        return await self._get_products_by_handles(handles)
 
-    async def get_top_selling_products(self, limit: int) -> List[dict]:
+    async def get_top_selling_products(self, limit: int, window: str = ALL_TIME) -> List[dict]:
         """Get top selling products (global)"""
-        async with self.db_pool.acquire() as conn:
-            rows = await conn.fetch("""
-                SELECT product_handle, COUNT(*) as count
-                FROM rec_user_interactions
-                WHERE interaction_type = 'purchase'
-                GROUP BY product_handle
-                ORDER BY count DESC
-                LIMIT $1
-            """, limit)
-            
-            handles = [row['product_handle'] for row in rows]
-            if not handles:
-                return []
-            return await self._get_products_by_handles(handles)
+        return await self.get_popular_products('purchase', limit, window)
 
-    async def get_most_viewed_products(self, limit: int) -> List[dict]:
+    async def get_most_viewed_products(self, limit: int, window: str = ALL_TIME) -> List[dict]:
         """Get most viewed products (global)"""
-        async with self.db_pool.acquire() as conn:
-            rows = await conn.fetch("""
-                SELECT product_handle, COUNT(*) as count
-                FROM rec_user_interactions
-                WHERE interaction_type = 'view'
-                GROUP BY product_handle
-                ORDER BY count DESC
-                LIMIT $1
-            """, limit)
-            
-            handles = [row['product_handle'] for row in rows]
-            if not handles:
-                return []
-            return await self._get_products_by_handles(handles)
+        return await self.get_popular_products('view', limit, window)
 
-    async def get_most_wishlisted_products(self, limit: int) -> List[dict]:
+    async def get_most_wishlisted_products(self, limit: int, window: str = ALL_TIME) -> List[dict]:
         """Get most wishlisted products (global)"""
-        async with self.db_pool.acquire() as conn:
-            rows = await conn.fetch("""
-                SELECT product_handle, COUNT(*) as count
-                FROM rec_user_interactions
-                WHERE interaction_type = 'wishlist'
-                GROUP BY product_handle
-                ORDER BY count DESC
-                LIMIT $1
-            """, limit)
-            
-            handles = [row['product_handle'] for row in rows]
-            if not handles:
-                return []
-            return await self._get_products_by_handles(handles)
+        return await self.get_popular_products('wishlist', limit, window)
     
     async def _get_random_products(self, limit: int) -> List[dict]:
         """Get random popular products"""
+        if self.sampler.is_ready:
+            return self.catalog.get_many(self.sampler.sample(limit, weighted=True))
+        
         async with self.db_pool.acquire() as conn:
-            products = await conn.fetch("""
-                WITH product_first_price AS (
-                    SELECT 
-                        p.id,
-                        p.handle,
-                        p.title,
-                        p.thumbnail,
-                        p.description,
-                        pr.amount,
-                        pr.currency_code,
-                        ROW_NUMBER() OVER (PARTITION BY p.id ORDER BY 
-                            CASE WHEN pr.currency_code = 'vnd' THEN 1 
-                                 WHEN pr.currency_code = 'usd' THEN 2 
-                                 ELSE 3 END
-                        ) as rn
-                    FROM product p
-                    LEFT JOIN product_variant pv ON p.id = pv.product_id
-                    LEFT JOIN product_variant_price_set pvps ON pv.id = pvps.variant_id
-                    LEFT JOIN price pr ON pvps.price_set_id = pr.price_set_id
-                    WHERE p.status = 'published'
-                    AND p.deleted_at IS NULL
-                )
-                SELECT id, handle, title, thumbnail, description, amount, currency_code
-                FROM product_first_price
-                WHERE rn = 1 AND amount IS NOT NULL
+            # Oversampled: products without a price are dropped by the hydration
+            rows = await conn.fetch("""
+                SELECT handle
+                FROM product
+                WHERE status = 'published'
+                AND deleted_at IS NULL
                 ORDER BY RANDOM()
                 LIMIT $1
-            """, limit)
-            
-            result = []
-            for row in products:
-                product_dict = {
-                    'id': row['id'],
-                    'handle': row['handle'],
-                    'title': row['title'],
-                    'thumbnail': row['thumbnail'],
-                    'description': row['description']
-                }
-                
-                # Add price if available
-                if row['amount'] and row['currency_code']:
-                    product_dict['price'] = {
-                        'amount': format_price(row['amount'], row['currency_code']),
-                        'currencyCode': row['currency_code'].upper()
-                    }
-                
-                result.append(product_dict)
-            
-            return result
+            """, limit * 2)
+        
+        return (await self._get_products_by_handles([row['handle'] for row in rows]))[:limit]
     
     async def _get_precomputed_similar(self, product_handle: str, limit: int) -> List[dict]:
         """Get pre-computed similar products"""
@@ -689,6 +322,14 @@ class RecommendationEngine:
     
     async def _get_similar_by_category(self, product_handle: str, limit: int) -> List[dict]:
         """Get similar products by product_category and product_collection"""
+        if self.sampler.is_ready:
+            groups = self.sampler.groups_of(product_handle)
+            per_group = limit // 2 + 1
+            handles = self.sampler.sample(per_group, [g for g in groups if g[0] == 'category'], exclude={product_handle})
+            handles += self.sampler.sample(per_group, [g for g in groups if g[0] == 'collection'],
+                                           exclude={product_handle, *handles})
+            return self.catalog.get_many(handles[:limit])
+        
         async with self.db_pool.acquire() as conn:
             # Get product's categories and collection
             product_info = await conn.fetchrow("""
@@ -754,205 +395,49 @@ class RecommendationEngine:
             
             return unique_similar
     
-    async def _get_similar_to_cart_wishlist(self, user_id: str, limit: int) -> List[dict]:
-        """Get products similar to items in cart/wishlist"""
-        async with self.db_pool.acquire() as conn:
-            # Get cart/wishlist items
-            items = await conn.fetch("""
-                SELECT product_handle, MAX(timestamp) as latest
-                FROM recommendation.rec_user_interactions
-                WHERE user_id = $1
-                AND interaction_type IN ('add_to_cart', 'wishlist')
-                GROUP BY product_handle
-                ORDER BY latest DESC
-                LIMIT 5
-            """, user_id)
-            
-            recommendations = []
-            for item in items:
-                similar = await self._get_similar_by_category(item['product_handle'], limit=2)
-                recommendations.extend(similar)
-            
-            return recommendations[:limit]
-    
-    async def _get_category_based_on_views(self, user_id: str, limit: int) -> List[dict]:
-        """Get recommendations based on product_category and product_collection of viewed products"""
-        async with self.db_pool.acquire() as conn:
-            # Get top product categories from viewed products
-            categories = await conn.fetch("""
-                SELECT pc.name as category_name, pc.id as category_id, COUNT(*) as view_count
-                FROM recommendation.rec_user_interactions ui
-                JOIN product p ON ui.product_handle = p.handle
-                JOIN product_category_product pcp ON p.id = pcp.product_id
-                JOIN product_category pc ON pcp.product_category_id = pc.id
-                WHERE ui.user_id = $1
-                AND ui.interaction_type = 'view'
-                GROUP BY pc.name, pc.id
-                ORDER BY view_count DESC
-                LIMIT 2
-            """, user_id)
-            
-            # Get top product collections from viewed products  
-            collections = await conn.fetch("""
-                SELECT pcol.title as collection_title, pcol.id as collection_id, COUNT(*) as view_count
-                FROM recommendation.rec_user_interactions ui
-                JOIN product p ON ui.product_handle = p.handle
-                JOIN product_collection pcol ON p.collection_id = pcol.id
-                WHERE ui.user_id = $1
-                AND ui.interaction_type = 'view'
-                GROUP BY pcol.title, pcol.id
-                ORDER BY view_count DESC
-                LIMIT 2
-            """, user_id)
-            
-            recommendations = []
-            
-            # Get products from top viewed categories
-            for cat in categories:
-                products = await conn.fetch("""
-                    SELECT p.id, p.handle, p.title, p.thumbnail
-                    FROM (
-                        SELECT DISTINCT p.id, p.handle, p.title, p.thumbnail
-                        FROM product p
-                        JOIN product_category_product pcp ON p.id = pcp.product_id
-                        JOIN product_category pc ON pcp.product_category_id = pc.id
-                        WHERE pc.id = $1
-                        AND p.status = 'published'
-                        AND p.deleted_at IS NULL
-                        AND p.handle NOT IN (
-                            SELECT DISTINCT product_handle 
-                            FROM recommendation.rec_user_interactions 
-                            WHERE user_id = $2 AND product_handle IS NOT NULL
-                        )
-                    ) p
-                    ORDER BY RANDOM()
-                    LIMIT 2
-                """, cat['category_id'], user_id)
-                
-                recommendations.extend([dict(row) for row in products])
-            
-            # Get products from top viewed collections
-            for col in collections:
-                products = await conn.fetch("""
-                    SELECT p.id, p.handle, p.title, p.thumbnail
-                    FROM product p
-                    JOIN product_collection pcol ON p.collection_id = pcol.id
-                    WHERE pcol.id = $1
-                    AND p.status = 'published'
-                    AND p.deleted_at IS NULL
-                    AND p.handle NOT IN (
-                        SELECT DISTINCT product_handle 
-                        FROM recommendation.rec_user_interactions 
-                        WHERE user_id = $2 AND product_handle IS NOT NULL
-                    )
-                    ORDER BY RANDOM()
-                    LIMIT 2
-                """, col['collection_id'], user_id)
-                
-                recommendations.extend([dict(row) for row in products])
-            
-            return recommendations[:limit]
-    
-    async def _get_similar_products_by_handle(self, product_handle: str, limit: int) -> List[dict]:
-        """Helper to get similar products"""
-        similar, _ = await self.get_similar_products(product_handle, limit)
-        return similar
-    
     async def _get_products_by_handles(self, handles: List[str]) -> List[dict]:
         """Fetch full product details by handles"""
         if not handles:
             return []
         
+        if self.catalog.is_loaded:
+            return self.catalog.get_many(handles)
+        
         async with self.db_pool.acquire() as conn:
             products = await conn.fetch("""
-                WITH product_first_price AS (
-                    SELECT 
-                        p.id,
-                        p.handle,
-                        p.title,
-                        p.thumbnail,
-                        p.description,
-                        pr.amount,
-                        pr.currency_code,
-                        ROW_NUMBER() OVER (PARTITION BY p.id ORDER BY 
-                            CASE WHEN pr.currency_code = 'vnd' THEN 1 
-                                 WHEN pr.currency_code = 'usd' THEN 2 
-                                 ELSE 3 END
-                        ) as rn
-                    FROM product p
-                    LEFT JOIN product_variant pv ON p.id = pv.product_id
-                    LEFT JOIN product_variant_price_set pvps ON pv.id = pvps.variant_id
-                    LEFT JOIN price pr ON pvps.price_set_id = pr.price_set_id
-                    WHERE p.handle = ANY($1::text[])
-                    AND p.status = 'published'
-                    AND p.deleted_at IS NULL
-                )
-                SELECT id, handle, title, thumbnail, description, amount, currency_code
-                FROM product_first_price
-                WHERE rn = 1 AND amount IS NOT NULL
+                SELECT id, handle, title, thumbnail, description
+                FROM product
+                WHERE handle = ANY($1::text[])
+                AND status = 'published'
+                AND deleted_at IS NULL
             """, handles)
-            
-            result = []
-            for row in products:
-                product_dict = {
-                    'id': row['id'],
-                    'handle': row['handle'],
-                    'title': row['title'],
-                    'thumbnail': row['thumbnail'],
-                    'description': row['description']
-                }
-                
-                # Add price if available
-                if row['amount'] and row['currency_code']:
-                    product_dict['price'] = {
-                        'amount': format_price(row['amount'], row['currency_code']),
-                        'currencyCode': row['currency_code'].upper()
-                    }
-                
-                result.append(product_dict)
-            
-            return result
-    
-    async def get_cached_recommendations(self, cache_key: str) -> Optional[dict]:
-        """Get cached recommendations"""
-        async with self.db_pool.acquire() as conn:
-            cached = await conn.fetchrow("""
-                SELECT recommendations, algorithm
-                FROM rec_recommendations_cache
-                WHERE cache_key = $1
-                AND expires_at > NOW()
-            """, cache_key)
-
-            if cached:
-                recommendations = cached['recommendations']
-                # Parse JSON if it's a string
-                if isinstance(recommendations, str):
-                    try:
-                        recommendations = json.loads(recommendations)
-                    except:
-                        recommendations = []
-                
-                return {
-                    'recommendations': recommendations,
-                    'algorithm': cached['algorithm']
-                }
-
-            return None
-    
-    async def cache_recommendations(self, cache_key: str, user_id: str, 
-                                   recommendations: List[dict], algorithm: str):
-        """Cache recommendations"""
-        expires_at = datetime.now() + timedelta(seconds=settings.cache_ttl_seconds)
+            pricing = PriceResolver()
+            await pricing.load(conn, handles)
         
-        async with self.db_pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO rec_recommendations_cache 
-                (cache_key, user_id, recommendations, algorithm, created_at, expires_at)
-                VALUES ($1, $2, $3, $4, NOW(), $5)
-                ON CONFLICT (cache_key)
-                DO UPDATE SET 
-                    recommendations = $3,
-                    algorithm = $4,
-                    created_at = NOW(),
-                    expires_at = $5
-            """, cache_key, user_id, json.dumps(recommendations), algorithm, expires_at)
+        result = []
+        for row in products:
+            price = pricing.default.get(row['handle'])
+            if price:
+                result.append({**dict(row), 'price': dict(price)})
+        
+        return result
+    
+    async def localize_prices(self, products: List[dict], region_id: Optional[str] = None,
+                              currency_code: Optional[str] = None) -> List[dict]:
+        """Reprice hydrated products for a region/currency, dropping products without a price there"""
+        if not products or not (region_id or currency_code):
+            return products
+        
+        pricing = self.catalog.pricing
+        if not self.catalog.is_loaded:
+            pricing = PriceResolver()
+            async with self.db_pool.acquire() as conn:
+                await pricing.load_regions(conn)
+                await pricing.load(conn, [p['handle'] for p in products])
+        
+        localized = []
+        for product in products:
+            price = pricing.resolve(product['handle'], region_id, currency_code)
+            if price:
+                localized.append({**product, 'price': dict(price)})
+        return localized
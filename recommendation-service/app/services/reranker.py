@@ -0,0 +1,138 @@
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+from app.services.catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+
+settings = get_settings()
+logger = get_rec_logger("reranker")
+
+# Candidate strategy -> fusion weight family
+STRATEGY_FAMILIES = {
+    'cart_wishlist': 'content',
+    'category_views': 'content',
+    'recent_similar': 'content',
+    'collaborative': 'collaborative',
+    'fill': 'fill',
+}
+
+
+def family_weights() -> Dict[str, float]:
+    return {
+        'content': settings.content_weight,
+        'collaborative': settings.collaborative_weight,
+        'fill': settings.rerank_fill_weight,
+    }
+
+
+class Reranker:
+    """
+    Final ordering of personalized candidates.
+
+    1. Fusion. Every strategy contributes a weighted reciprocal rank:
+       weight / (rerank_rrf_k + rank). Content strategies use content_weight,
+       the collaborative one collaborative_weight, and trending fill
+       rerank_fill_weight. A product found by several strategies adds up
+       their contributions.
+    2. Exploration. A share of the relevance (rerank_exploration) is seeded
+       noise. The seed comes from the user and the current
+       rerank_exploration_seconds period, so a user sees a stable list
+       within a period and a rotated one in the next. Cached and
+       materialized lists stay reproducible.
+    3. Diversity. Maximal marginal relevance over the cosine similarity of
+       the candidates' categories and collections. The feature matrix comes
+       from the catalog snapshot, so no database work is added, and only the
+       similarity rows of the picked products are computed.
+
+    self.last_ms holds the duration of the last call.
+    """
+
+    def __init__(self, catalog: Optional[CatalogSnapshot] = None):
+        self.catalog = catalog or get_catalog_snapshot()
+        self.last_ms = 0.0
+
+    def rerank(self, products: List[dict], ranked: Sequence[Tuple[str, Sequence[str]]],
+               limit: int, seed_key: str, now: Optional[float] = None) -> List[dict]:
+        """Top `limit` products; `ranked` holds (strategy, handles in strategy order) pairs"""
+        start = time.perf_counter()
+        if not products:
+            return []
+        relevance = self.fuse(products, ranked)
+        relevance = self.explore(relevance, seed_key, now)
+        order = mmr(relevance, self.features(products), limit, settings.rerank_diversity_lambda)
+        self.last_ms = round((time.perf_counter() - start) * 1000, 3)
+        return [products[i] for i in order]
+
+    def fuse(self, products: List[dict], ranked: Sequence[Tuple[str, Sequence[str]]]) -> np.ndarray:
+        """Weighted reciprocal-rank fusion, scaled to a maximum of 1"""
+        position = {p['handle']: i for i, p in enumerate(products)}
+        weights = family_weights()
+        relevance = np.zeros(len(products))
+        for strategy, handles in ranked:
+            weight = weights.get(STRATEGY_FAMILIES.get(strategy, 'content'), 0.0)
+            idx = [position[h] for h in handles if h in position]
+            if not idx:
+                continue
+            ranks = np.arange(len(idx), dtype=np.float64)
+            np.add.at(relevance, idx, weight / (settings.rerank_rrf_k + ranks))
+        top = relevance.max()
+        return relevance / top if top > 0 else relevance
+
+    def explore(self, relevance: np.ndarray, seed_key: str, now: Optional[float] = None) -> np.ndarray:
+        share = settings.rerank_exploration
+        if share <= 0:
+            return relevance
+        period = int((now if now is not None else time.time()) // settings.rerank_exploration_seconds)
+        rng = np.random.default_rng(zlib.crc32(f"{seed_key}:{period}".encode()))
+        return (1 - share) * relevance + share * rng.random(len(relevance))
+
+    def features(self, products: List[dict]) -> np.ndarray:
+        """L2-normalized category/collection memberships, one row per product"""
+        weight = settings.rerank_collection_weight
+        categories: Dict[str, int] = {}
+        collections: Dict[str, int] = {}
+        rows, cols, values = [], [], []
+        collection_rows, collection_cols, collection_values = [], [], []
+        index, category_ids, collection_ids = self.catalog.index, self.catalog.category_ids, self.catalog.collection_ids
+        for r, product in enumerate(products):
+            i = index.get(product['handle'])
+            if i is None:
+                continue
+            product_categories = category_ids[i]
+            collection_id = collection_ids[i]
+            # Row norm known up front: sqrt(categories + weight^2 for the collection)
+            norm = (len(product_categories) + (weight * weight if collection_id else 0.0)) ** 0.5
+            for category_id in product_categories:
+                rows.append(r)
+                cols.append(categories.setdefault(category_id, len(categories)))
+                values.append(1.0 / norm)
+            if collection_id:
+                collection_rows.append(r)
+                collection_cols.append(collections.setdefault(collection_id, len(collections)))
+                collection_values.append(weight / norm)
+
+        features = np.zeros((len(products), max(1, len(categories) + len(collections))), dtype=np.float32)
+        features[rows + collection_rows, cols + [len(categories) + c for c in collection_cols]] = values + collection_values
+        return features
+
+
+def mmr(relevance: np.ndarray, features: np.ndarray, limit: int, lam: float) -> List[int]:
+    """
+    Greedy maximal marginal relevance: lam * relevance - (1 - lam) * max cosine
+    similarity to the products already picked (rows of `features` are normalized).
+    """
+    n = len(relevance)
+    penalty = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    order = []
+    for _ in range(min(limit, n)):
+        scores = np.where(available, lam * relevance - (1 - lam) * penalty, -np.inf)
+        j = int(scores.argmax())
+        order.append(j)
+        available[j] = False
+        np.maximum(penalty, features @ features[j], out=penalty)
+    return order
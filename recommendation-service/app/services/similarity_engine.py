@@ -0,0 +1,137 @@
+import asyncio
+from typing import List, Tuple, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from app.config import get_settings
+from app.logging_config import get_rec_logger
+
+settings = get_settings()
+logger = get_rec_logger("similarity")
+
+CATEGORY_WEIGHT = 0.6
+TITLE_WEIGHT = 0.4
+
+
+class SimilarityEngine:
+    """
+    Vectorized content similarity between products.
+
+    Scores are the same blend used by the original pairwise loop:
+    0.6 if the products share a category plus 0.4 * Jaccard overlap of the
+    lower-cased title tokens. Pairs are produced block by block from sparse
+    matrix products, so memory stays O(block_size * n) instead of O(n^2),
+    and only the top-K neighbours of every product are kept.
+    """
+
+    def __init__(self, top_k: int = None, threshold: float = None, block_size: int = None):
+        self.top_k = top_k or settings.similarity_top_k
+        self.threshold = settings.similarity_threshold if threshold is None else threshold
+        self.block_size = block_size or settings.similarity_block_size
+
+    async def load_products(self, conn) -> List[dict]:
+        """Load every published product with its categories (no catalog cap)"""
+        rows = await conn.fetch("""
+            SELECT
+                p.handle,
+                p.title,
+                COALESCE(
+                    ARRAY_AGG(DISTINCT pc.name) FILTER (WHERE pc.name IS NOT NULL),
+                    ARRAY[]::text[]
+                ) as categories,
+                MAX(pcol.title) as collection
+            FROM product p
+            LEFT JOIN product_category_product pcp ON p.id = pcp.product_id
+            LEFT JOIN product_category pc ON pcp.product_category_id = pc.id
+            LEFT JOIN product_collection pcol ON p.collection_id = pcol.id
+            WHERE p.status = 'published'
+            AND p.deleted_at IS NULL
+            GROUP BY p.id, p.handle, p.title
+        """)
+
+        products = []
+        for row in rows:
+            categories = list(row['categories'])
+            if not categories:
+                categories = [row['collection'] or 'uncategorized']
+            products.append({
+                'handle': row['handle'],
+                'title': row['title'],
+                'categories': categories
+            })
+        return products
+
+    async def compute(self, products: Sequence[dict]) -> List[Tuple[str, str, float]]:
+        """Run the CPU-bound computation off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.compute_top_k, products)
+
+    def compute_top_k(self, products: Sequence[dict]) -> List[Tuple[str, str, float]]:
+        """Return (handle, neighbour_handle, score) rows, top-K per product"""
+        n = len(products)
+        if n < 2:
+            return []
+
+        handles = [p['handle'] for p in products]
+        titles = self._build_token_matrix([(p.get('title') or '').lower().split() for p in products])
+        categories = self._build_token_matrix([p.get('categories') or [] for p in products])
+        titles_t = titles.T.tocsr()
+        categories_t = categories.T.tocsr()
+        title_sizes = np.asarray(titles.sum(axis=1)).ravel()
+
+        pairs: List[Tuple[str, str, float]] = []
+
+        for start in range(0, n, self.block_size):
+            stop = min(start + self.block_size, n)
+
+            # Title Jaccard: |a & b| / (|a| + |b| - |a & b|) on shared-token pairs only
+            inter = (titles[start:stop] @ titles_t).tocoo()
+            union = title_sizes[start + inter.row] + title_sizes[inter.col] - inter.data
+            jaccard = sparse.csr_matrix(
+                (TITLE_WEIGHT * inter.data / np.maximum(union, 1), (inter.row, inter.col)),
+                shape=(stop - start, n)
+            )
+
+            same_category = (categories[start:stop] @ categories_t).tocsr()
+            same_category.data = np.full_like(same_category.data, CATEGORY_WEIGHT)
+
+            scores = (jaccard + same_category).tocoo()
+            rows, cols, data = scores.row, scores.col, np.minimum(scores.data, 1.0)
+
+            keep = (data > self.threshold) & (cols != rows + start)
+            rows, cols, data = rows[keep], cols[keep], data[keep]
+            if data.size == 0:
+                continue
+
+            # Top-K per row: sort by (row, -score), then keep the first K of each row
+            order = np.lexsort((-data, rows))
+            rows, cols, data = rows[order], cols[order], data[order]
+            row_starts = np.searchsorted(rows, rows, side='left')
+            keep = (np.arange(rows.size) - row_starts) < self.top_k
+            rows, cols, data = rows[keep], cols[keep], data[keep]
+
+            pairs.extend(
+                (handles[start + r], handles[c], float(s))
+                for r, c, s in zip(rows.tolist(), cols.tolist(), data.tolist())
+            )
+
+        logger.info(f"Computed content similarities - products={n} pairs={len(pairs)} top_k={self.top_k}")
+        return pairs
+
+    @staticmethod
+    def _build_token_matrix(token_lists: Sequence[Sequence[str]]) -> sparse.csr_matrix:
+        """Binary product x token matrix (each token counted once per product)"""
+        vocabulary = {}
+        indptr = [0]
+        indices = []
+        for tokens in token_lists:
+            for token in set(tokens):
+                indices.append(vocabulary.setdefault(token, len(vocabulary)))
+            indptr.append(len(indices))
+
+        data = np.ones(len(indices), dtype=np.float64)
+        return sparse.csr_matrix(
+            (data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(token_lists), max(len(vocabulary), 1))
+        )
@@ -0,0 +1,121 @@
+"""
+Benchmark: ALS collaborative filtering model training and queries
+
+Generates a synthetic implicit-feedback matrix with latent user segments,
+trains the ALS model, and reports:
+- training time per iteration;
+- top-K query latency through CFModel (memory-mapped factors);
+- leave-one-out hit rate@K against a global-popularity baseline.
+No database is needed; the model is saved to a temporary directory.
+
+Usage (from recommendation-service/):
+    python -m benchmarks.bench_cf_model --users 100000 --items 20000 --interactions 2000000
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from app.services.cf_model import CFModel, save_model, top_k, train_als
+
+
+def synthetic_matrix(users: int, items: int, interactions: int, segments: int, seed: int):
+    """Users prefer the items of one segment (Zipf within it) with 20% noise"""
+    rng = np.random.default_rng(seed)
+    user_segment = rng.integers(0, segments, users)
+    item_order = rng.permutation(items)
+    per_segment = items // segments
+
+    rows = rng.integers(0, users, interactions)
+    rank = np.minimum(rng.zipf(1.2, interactions) - 1, per_segment - 1)
+    cols = item_order[user_segment[rows] * per_segment + rank]
+    noise = rng.random(interactions) < 0.2
+    cols[noise] = rng.integers(0, items, noise.sum())
+    weights = rng.choice([1.0, 2.0, 3.0, 5.0], interactions, p=[0.7, 0.1, 0.15, 0.05])
+
+    matrix = sp.csr_matrix((weights, (rows, cols)), shape=(users, items))
+    matrix.data = np.log1p(matrix.data)
+    return matrix
+
+
+def hold_out(matrix: sp.csr_matrix, seed: int):
+    """Remove one random item per user with at least 3 items"""
+    rng = np.random.default_rng(seed)
+    matrix = matrix.tolil(copy=True)
+    held = {}
+    for u in range(matrix.shape[0]):
+        row = matrix.rows[u]
+        if len(row) >= 3:
+            item = row[rng.integers(len(row))]
+            held[u] = item
+            matrix[u, item] = 0
+    matrix = matrix.tocsr()
+    matrix.eliminate_zeros()
+    return matrix, held
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--interactions", type=int, default=1000000)
+    parser.add_argument("--segments", type=int, default=50)
+    parser.add_argument("--factors", type=int, default=32)
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--cg-steps", type=int, default=3)
+    parser.add_argument("--alpha", type=float, default=20.0)
+    parser.add_argument("--regularization", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--eval-users", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    matrix = synthetic_matrix(args.users, args.items, args.interactions, args.segments, args.seed)
+    train, held = hold_out(matrix, args.seed)
+    print(f"users={args.users} items={args.items} nnz={train.nnz} held_out={len(held)}")
+
+    start = time.perf_counter()
+    user_factors, item_factors = train_als(
+        train, args.factors, args.iterations, args.alpha, args.regularization, args.cg_steps
+    )
+    train_s = time.perf_counter() - start
+    print(f"train: {train_s:.2f}s total, {train_s / args.iterations * 1000:.0f}ms/iteration "
+          f"(factors={args.factors} cg_steps={args.cg_steps})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/cf"
+        users = [f"user-{u}" for u in range(args.users)]
+        items = [f"product-{i}" for i in range(args.items)]
+        save_model(path, users, items, user_factors, item_factors, train, {})
+        model = CFModel(path)
+        model.load()
+
+        rng = np.random.default_rng(args.seed)
+        latencies = []
+        for u in rng.integers(0, args.users, args.queries).tolist():
+            t = time.perf_counter()
+            model.recommend(users[u], args.k)
+            latencies.append((time.perf_counter() - t) * 1000)
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"query: p50={p50:.3f}ms p99={p99:.3f}ms (k={args.k}, {args.queries} queries, mmap)")
+
+        # Leave-one-out hit rate against global popularity
+        popularity = np.asarray(train.sum(axis=0)).ravel()
+        eval_users = list(held)[:args.eval_users]
+        als_hits = pop_hits = 0
+        for u in eval_users:
+            seen = train.indices[train.indptr[u]:train.indptr[u + 1]]
+            als_top = top_k(item_factors @ user_factors[u], args.k, seen)
+            pop_top = top_k(popularity.astype(np.float64), args.k, seen)
+            als_hits += held[u] in als_top
+            pop_hits += held[u] in pop_top
+        n = max(len(eval_users), 1)
+        print(f"hit_rate@{args.k}: als={als_hits / n:.3f} popularity={pop_hits / n:.3f} "
+              f"({len(eval_users)} users)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark: re-ranking of personalized candidates
+
+Builds a synthetic catalog snapshot (categories, collections) and candidate
+lists shaped like the candidate generator's output: content strategies
+concentrated in the user's few categories, collaborative candidates spread
+wider, trending fill at the end. Reports:
+- Reranker.rerank latency (p50/p95) for 50/200/500 candidates (target: <1ms at 200);
+- list quality of the returned top `--limit` against the previous random
+  shuffle and a relevance-only ordering: fused relevance retained (share of
+  the best achievable), distinct categories and mean pairwise similarity.
+No database is needed.
+
+Usage (from recommendation-service/):
+    python -m benchmarks.bench_reranker --products 20000 --repeats 500
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from app.services.catalog_snapshot import CatalogSnapshot
+from app.services.reranker import Reranker, mmr
+
+SIZES = (50, 200, 500)
+
+
+def build_snapshot(products: int, categories: int, collections: int, seed: int) -> CatalogSnapshot:
+    rng = np.random.default_rng(seed)
+    product_category = rng.integers(0, categories, products)
+    second_category = rng.integers(0, categories, products)
+    product_collection = rng.integers(0, collections, products)
+    snapshot = CatalogSnapshot()
+    for i in range(products):
+        # A fifth of the products sit in a second category
+        category_ids = [f"pcat_{product_category[i]}"]
+        if i % 5 == 0 and second_category[i] != product_category[i]:
+            category_ids.append(f"pcat_{second_category[i]}")
+        snapshot._upsert({
+            'id': f"prod_{i}", 'handle': f"product-{i}", 'title': f"Product {i}",
+            'thumbnail': None, 'description': None,
+            'category_ids': category_ids, 'category_names': category_ids,
+            'collection_id': f"pcol_{product_collection[i]}", 'collection_title': None
+        })
+    return snapshot
+
+
+def candidate_set(snapshot: CatalogSnapshot, size: int, rng: random.Random):
+    """(products, ranked) like CandidateGenerator.generate plus trending fill"""
+    by_category = {}
+    for i, category_ids in enumerate(snapshot.category_ids):
+        by_category.setdefault(category_ids[0], []).append(snapshot.handles[i])
+    favourites = rng.sample(sorted(by_category), 2)
+
+    def pick(pool, n):
+        return rng.sample(pool, min(n, len(pool)))
+
+    quarter = size // 4
+    ranked = [
+        ('cart_wishlist', pick(by_category[favourites[0]], quarter // 2)),
+        ('category_views', pick(by_category[favourites[0]] + by_category[favourites[1]], quarter)),
+        ('collaborative', pick(snapshot.handles, quarter + quarter // 2)),
+        ('recent_similar', pick(by_category[favourites[1]], quarter)),
+    ]
+    seen, products = set(), []
+    for _, handles in ranked:
+        for handle in handles:
+            if handle not in seen:
+                seen.add(handle)
+                products.append(snapshot.product(snapshot.index[handle]))
+    fill = [h for h in pick(snapshot.handles, size) if h not in seen][:size - len(products)]
+    products.extend(snapshot.product(snapshot.index[h]) for h in fill)
+    ranked.append(('fill', fill))
+    return products, ranked
+
+
+def quality(order, relevance, similarity, categories, limit):
+    best = np.sort(relevance)[::-1][:limit].sum()
+    picked = np.asarray(order[:limit])
+    pairs = similarity[np.ix_(picked, picked)]
+    off_diagonal = (pairs.sum() - np.trace(pairs)) / max(1, len(picked) * (len(picked) - 1))
+    return (
+        relevance[picked].sum() / best if best > 0 else 0.0,
+        len({categories[i] for i in picked}),
+        float(off_diagonal)
+    )
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--collections", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=12)
+    parser.add_argument("--repeats", type=int, default=500, help="candidate sets per size")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    snapshot = build_snapshot(args.products, args.categories, args.collections, args.seed)
+    reranker = Reranker(snapshot)
+    print(f"catalog: products={len(snapshot):,} categories={args.categories} "
+          f"collections={args.collections} limit={args.limit}")
+    print()
+
+    for size in SIZES:
+        sets = [candidate_set(snapshot, size, rng) for _ in range(args.repeats)]
+        reranker.rerank(*sets[0], args.limit, seed_key="warm-up")
+
+        timings = []
+        scores = {"shuffle": [], "relevance": [], "rerank": []}
+        for n, (products, ranked) in enumerate(sets):
+            start = time.perf_counter()
+            reranked = reranker.rerank(products, ranked, args.limit, seed_key=f"user_{n}")
+            timings.append((time.perf_counter() - start) * 1000)
+
+            relevance = reranker.fuse(products, ranked)
+            features = reranker.features(products)
+            similarity = features @ features.T
+            categories = [snapshot.category_ids[snapshot.index[p['handle']]][0] for p in products]
+            position = {p['handle']: i for i, p in enumerate(products)}
+            shuffled = list(range(len(products)))
+            rng.shuffle(shuffled)
+            orders = {
+                "shuffle": shuffled,
+                "relevance": mmr(relevance, features, args.limit, 1.0),
+                "rerank": [position[p['handle']] for p in reranked],
+            }
+            for label, order in orders.items():
+                scores[label].append(quality(order, relevance, similarity, categories, args.limit))
+
+        print(f"candidates={size:>4}  rerank p50={statistics.median(timings):.3f}ms  "
+              f"p95={percentile(timings, 0.95):.3f}ms")
+        for label, rows in scores.items():
+            retained, distinct, pairwise = (statistics.mean(column) for column in zip(*rows))
+            print(f"  {label:<10} relevance retained={retained:6.1%}  distinct categories={distinct:5.2f}  "
+                  f"mean pairwise similarity={pairwise:.3f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ SET search_path TO recommendation, public;
 
 -- User interactions table (views, carts, purchases, wishlist)
 CREATE TABLE IF NOT EXISTS recommendation.rec_user_interactions (
-    id VARCHAR(255) PRIMARY KEY,
+    id VARCHAR(255) NOT NULL,
     user_id VARCHAR(255) NOT NULL,
     session_id VARCHAR(255),
     product_id VARCHAR(255),
@@ -17,14 +17,54 @@ CREATE TABLE IF NOT EXISTS recommendation.rec_user_interactions (
     interaction_type VARCHAR(50) NOT NULL, -- view, add_to_cart, purchase, wishlist, search
     timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
     metadata JSONB,
-    created_at TIMESTAMP NOT NULL DEFAULT NOW()
-);
-
-CREATE INDEX IF NOT EXISTS idx_rec_interactions_user_id ON recommendation.rec_user_interactions(user_id);
-CREATE INDEX IF NOT EXISTS idx_rec_interactions_product ON recommendation.rec_user_interactions(product_handle);
-CREATE INDEX IF NOT EXISTS idx_rec_interactions_type ON recommendation.rec_user_interactions(interaction_type);
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Monthly partitions rec_user_interactions_YYYY_MM; later months are created by the
+-- interaction storage job, which also moves rows out of the default partition.
+-- Existing unpartitioned tables are converted with: python -m database.migrate_interactions migrate
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table
+               WHERE partrelid = to_regclass('recommendation.rec_user_interactions')) THEN
+        CREATE TABLE IF NOT EXISTS recommendation.rec_user_interactions_default
+            PARTITION OF recommendation.rec_user_interactions DEFAULT;
+        FOR i IN 0..2 LOOP
+            month := date_trunc('month', NOW())::date + make_interval(months => i);
+            IF to_regclass('recommendation.rec_user_interactions_' || to_char(month, 'YYYY_MM')) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE recommendation.%I PARTITION OF recommendation.rec_user_interactions FOR VALUES FROM (%L) TO (%L)',
+                    'rec_user_interactions_' || to_char(month, 'YYYY_MM'),
+                    month, (month + INTERVAL '1 month')::date
+                );
+            END IF;
+        END LOOP;
+    END IF;
+END $$;
+
+-- Composite indexes covering the engine's access paths: per-user profile, recent and
+-- cart lookups; product -> users joins; per-type time windows (popularity, FBT, CF)
+DROP INDEX IF EXISTS recommendation.idx_rec_interactions_user_id;
+DROP INDEX IF EXISTS recommendation.idx_rec_interactions_product;
+DROP INDEX IF EXISTS recommendation.idx_rec_interactions_type;
+CREATE INDEX IF NOT EXISTS idx_rec_interactions_user_time ON recommendation.rec_user_interactions(user_id, timestamp DESC) INCLUDE (product_handle, interaction_type);
+CREATE INDEX IF NOT EXISTS idx_rec_interactions_product_type ON recommendation.rec_user_interactions(product_handle, interaction_type) INCLUDE (user_id);
+CREATE INDEX IF NOT EXISTS idx_rec_interactions_type_time ON recommendation.rec_user_interactions(interaction_type, timestamp DESC) INCLUDE (product_handle);
 CREATE INDEX IF NOT EXISTS idx_rec_interactions_timestamp ON recommendation.rec_user_interactions(timestamp DESC);
 
+-- Daily aggregates of raw interactions older than the retention window
+CREATE TABLE IF NOT EXISTS recommendation.rec_interaction_daily (
+    day DATE NOT NULL,
+    product_handle VARCHAR(255) NOT NULL, -- '' for events without a product (search)
+    interaction_type VARCHAR(50) NOT NULL,
+    events BIGINT NOT NULL,
+    users BIGINT NOT NULL,
+    PRIMARY KEY (day, product_handle, interaction_type)
+);
+
 -- User preferences (learned from behavior)
 CREATE TABLE IF NOT EXISTS recommendation.rec_user_preferences (
     user_id VARCHAR(255) PRIMARY KEY,
@@ -32,6 +72,7 @@ CREATE TABLE IF NOT EXISTS recommendation.rec_user_preferences (
     price_min NUMERIC,
     price_max NUMERIC,
     preferred_brands JSONB,
+    state JSONB, -- decayed category weights and price sketch (incremental model)
     last_updated TIMESTAMP NOT NULL DEFAULT NOW(),
     created_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
@@ -54,12 +95,53 @@ CREATE TABLE IF NOT EXISTS recommendation.rec_frequently_together (
     product_id_2 VARCHAR(255) NOT NULL,
     co_occurrence_count INT NOT NULL DEFAULT 1,
     confidence_score FLOAT,
+    support FLOAT,
+    lift FLOAT,
     updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
     PRIMARY KEY (product_id_1, product_id_2)
 );
 
+-- Columns added by the frequently-together miner (for databases created before it)
+ALTER TABLE recommendation.rec_frequently_together ADD COLUMN IF NOT EXISTS support FLOAT;
+ALTER TABLE recommendation.rec_frequently_together ADD COLUMN IF NOT EXISTS lift FLOAT;
+
+-- Incremental preference state (for databases created before it)
+ALTER TABLE recommendation.rec_user_preferences ADD COLUMN IF NOT EXISTS state JSONB;
+
 CREATE INDEX IF NOT EXISTS idx_rec_together_product1 ON recommendation.rec_frequently_together(product_id_1, confidence_score DESC);
 
+-- Popularity counters (rolled up from rec_user_interactions)
+CREATE TABLE IF NOT EXISTS recommendation.rec_product_stats (
+    product_handle VARCHAR(255) NOT NULL,
+    interaction_type VARCHAR(50) NOT NULL,
+    time_window VARCHAR(8) NOT NULL, -- 1h, 24h, 7d, all
+    count BIGINT NOT NULL DEFAULT 0,
+    rolled_up_to TIMESTAMP, -- created_at watermark of the all-time counters
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (product_handle, interaction_type, time_window)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rec_product_stats_top ON recommendation.rec_product_stats(time_window, interaction_type, count DESC);
+CREATE INDEX IF NOT EXISTS idx_rec_interactions_created_at ON recommendation.rec_user_interactions(created_at);
+
+-- Materialized homepage recommendations (one row per active user)
+CREATE TABLE IF NOT EXISTS recommendation.rec_user_recommendations (
+    user_id VARCHAR(255) PRIMARY KEY,
+    handles TEXT[] NOT NULL, -- ranked product handles
+    algorithm VARCHAR(100),
+    interactions_at TIMESTAMP, -- newest interaction (created_at) the list was computed from
+    computed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_rec_user_recommendations_interactions ON recommendation.rec_user_recommendations(interactions_at);
+
+-- Progress of incremental batch jobs (only ever moves forward)
+CREATE TABLE IF NOT EXISTS recommendation.rec_job_watermarks (
+    job VARCHAR(100) PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
 -- Recommendation cache (for performance)
 CREATE TABLE IF NOT EXISTS recommendation.rec_recommendations_cache (
     cache_key VARCHAR(255) PRIMARY KEY,
@@ -100,8 +182,12 @@ GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA recommendation TO postgres;
 GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA recommendation TO postgres;
 
 COMMENT ON TABLE recommendation.rec_user_interactions IS 'Stores all user interactions with products';
+COMMENT ON TABLE recommendation.rec_interaction_daily IS 'Daily interaction counts compacted from expired raw events';
 COMMENT ON TABLE recommendation.rec_user_preferences IS 'Learned user preferences from behavior';
 COMMENT ON TABLE recommendation.rec_product_similarities IS 'Pre-computed product similarities';
 COMMENT ON TABLE recommendation.rec_frequently_together IS 'Products frequently bought together';
+COMMENT ON TABLE recommendation.rec_product_stats IS 'Per-product interaction counters by time window';
+COMMENT ON TABLE recommendation.rec_user_recommendations IS 'Precomputed homepage recommendations per user';
+COMMENT ON TABLE recommendation.rec_job_watermarks IS 'Watermarks of incremental batch jobs';
 COMMENT ON TABLE recommendation.rec_recommendations_cache IS 'Cached recommendations for performance';
 COMMENT ON TABLE recommendation.rec_analytics IS 'Analytics for recommendation performance tracking';
@@ -0,0 +1,53 @@
+"""
+Convert rec_user_interactions to monthly range partitions
+
+Copies an existing unpartitioned table month by month into a partitioned
+one while the service keeps writing, then swaps the tables under a short
+write lock (see InteractionStorage.migrate). The old table is kept as
+rec_user_interactions_legacy unless --drop-legacy is given.
+
+Usage (from recommendation-service/):
+    python -m database.migrate_interactions migrate [--drop-legacy]
+    python -m database.migrate_interactions partitions [--since 2024-01-01]
+    python -m database.migrate_interactions compact
+"""
+import argparse
+import asyncio
+import json
+from datetime import date
+
+import asyncpg
+
+from app.config import get_settings
+from app.services.interaction_storage import InteractionStorage
+
+settings = get_settings()
+
+
+async def main(args):
+    pool = await asyncpg.create_pool(
+        args.database_url, min_size=1, max_size=2,
+        server_settings={'search_path': f'{args.schema}, public'}
+    )
+    try:
+        storage = InteractionStorage(pool)
+        if args.command == "migrate":
+            result = await storage.migrate(drop_legacy=args.drop_legacy)
+        elif args.command == "partitions":
+            since = date.fromisoformat(args.since) if args.since else None
+            result = {"created": await storage.ensure_partitions(since)}
+        else:
+            result = await storage.compact()
+        print(json.dumps(result, indent=2, default=str))
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "partitions", "compact"])
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--schema", default=settings.db_schema)
+    parser.add_argument("--drop-legacy", action="store_true", help="drop the old table after the swap")
+    parser.add_argument("--since", help="first month to create partitions for (YYYY-MM-DD)")
+    asyncio.run(main(parser.parse_args()))
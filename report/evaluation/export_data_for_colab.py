@@ -1,7 +1,32 @@
+"""
+Export products, interactions and user preferences for the evaluation notebooks.
+
+Every dataset is streamed from PostgreSQL in bounded memory and the datasets
+are exported in parallel (one connection each):
+- CSV: COPY ... TO STDOUT written straight to the file (no rows in Python);
+- Parquet: server-side cursor read in --chunk-size batches, each written as
+  a zstd-compressed row group (needs pyarrow).
+
+--incremental exports only rows added/changed since the watermark stored in
+export_state.json (or --since) into <dataset>_<watermark>.<format> files.
+The upper bound of every export is NOW() - --lag-seconds, so rows of
+transactions still in flight are picked up by the next export instead of
+being skipped.
+
+Usage:
+    python export_data_for_colab.py                      # products.csv, interactions.csv, preferences.csv
+    python export_data_for_colab.py --format parquet --out data
+    python export_data_for_colab.py --format parquet --out data --incremental
+    pip install asyncpg pyarrow
+"""
+import argparse
 import asyncio
-import asyncpg
-import pandas as pd
+import json
 import os
+import time
+from datetime import datetime
+
+import asyncpg
 
 # Database Configuration
 DB_CONFIG = {
@@ -12,76 +37,223 @@ DB_CONFIG = {
     "port": 5432
 }
 
-async def export_data():
-    print(f"Connecting to database {DB_CONFIG['database']} at {DB_CONFIG['host']}...")
+STATE_FILE = "export_state.json"
+
+# Note: Medusa products can have multiple categories, we take the first one (by name)
+# for simplicity in this evaluation
+PRODUCTS_QUERY = """
+    SELECT DISTINCT ON (p.handle)
+        p.id,
+        p.handle,
+        p.title,
+        p.status,
+        pc.name as category,
+        pcol.title as collection
+    FROM product p
+    LEFT JOIN product_category_product pcp ON p.id = pcp.product_id
+    LEFT JOIN product_category pc ON pcp.product_category_id = pc.id
+    LEFT JOIN product_collection pcol ON p.collection_id = pcol.id
+    WHERE p.status = 'published' AND p.deleted_at IS NULL
+    AND p.updated_at > $1::timestamp AND p.updated_at <= $2::timestamp
+    ORDER BY p.handle, pc.name
+"""
+
+INTERACTIONS_QUERY = """
+    SELECT
+        user_id,
+        session_id,
+        product_handle,
+        interaction_type,
+        timestamp
+    FROM {schema}.rec_user_interactions
+    WHERE created_at > $1::timestamp AND created_at <= $2::timestamp
+"""
+
+PREFERENCES_QUERY = """
+    SELECT
+        user_id,
+        category_scores::text as category_scores,
+        price_min::float8 as price_min,
+        price_max::float8 as price_max,
+        preferred_brands::text as preferred_brands,
+        last_updated
+    FROM {schema}.rec_user_preferences
+    WHERE last_updated > $1::timestamp AND last_updated <= $2::timestamp
+"""
+
+# name -> (query, columns with their Parquet types)
+DATASETS = {
+    "products": (PRODUCTS_QUERY, [
+        ("id", "string"), ("handle", "string"), ("title", "string"),
+        ("status", "string"), ("category", "string"), ("collection", "string"),
+    ]),
+    "interactions": (INTERACTIONS_QUERY, [
+        ("user_id", "string"), ("session_id", "string"), ("product_handle", "string"),
+        ("interaction_type", "string"), ("timestamp", "timestamp"),
+    ]),
+    "preferences": (PREFERENCES_QUERY, [
+        ("user_id", "string"), ("category_scores", "string"), ("price_min", "float64"),
+        ("price_max", "float64"), ("preferred_brands", "string"), ("last_updated", "timestamp"),
+    ]),
+}
+
+
+def load_state(out_dir: str) -> dict:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {name: datetime.fromisoformat(value) for name, value in json.load(f).items()}
+
+
+def save_state(out_dir: str, state: dict):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + ".part", "w") as f:
+        json.dump({name: value.isoformat() for name, value in state.items()}, f, indent=2)
+    os.replace(path + ".part", path)
+
+
+def output_path(out_dir: str, name: str, fmt: str, since: datetime, until: datetime) -> str:
+    if since == datetime.min:
+        return os.path.join(out_dir, f"{name}.{fmt}")
+    return os.path.join(out_dir, f"{name}_{until:%Y%m%dT%H%M%S}.{fmt}")
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+    types = {"string": pa.string(), "float64": pa.float64(), "timestamp": pa.timestamp("us")}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+async def export_csv(conn, query: str, args: tuple, path: str) -> int:
+    """COPY the query result straight into the file"""
+    status = await conn.copy_from_query(query, *args, output=path, format="csv", header=True)
+    return int(status.split()[-1])
+
+
+async def export_parquet(conn, query: str, args: tuple, path: str, columns, chunk_size: int) -> int:
+    """Server-side cursor, one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(columns)
+    rows_written = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor(query, *args, prefetch=chunk_size)
+            while True:
+                rows = await cursor.fetch(chunk_size)
+                if not rows:
+                    break
+                arrays = [pa.array([row[i] for row in rows], type=field.type)
+                          for i, field in enumerate(schema)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                rows_written += len(rows)
+    return rows_written
+
+
+def write_empty(path: str, fmt: str, columns):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(arrow_schema(columns).empty_table(), path)
+    else:
+        with open(path, "w") as f:
+            f.write(",".join(name for name, _ in columns) + "\n")
+
+
+async def export_dataset(connect, name: str, args, since: datetime, until: datetime) -> int:
+    query, columns = DATASETS[name]
+    query = query.format(schema=args.schema)
+    path = output_path(args.out, name, args.format, since, until)
+    part = path + ".part"
+    start = time.perf_counter()
+
+    conn = await connect()
+    try:
+        if args.format == "parquet":
+            rows = await export_parquet(conn, query, (since, until), part, columns, args.chunk_size)
+        else:
+            rows = await export_csv(conn, query, (since, until), part)
+    except asyncpg.UndefinedTableError as e:
+        print(f"Warning: {name}: {e}. Writing an empty file.")
+        write_empty(part, args.format, columns)
+        rows = 0
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    finally:
+        await conn.close()
+
+    os.replace(part, path)
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {rows:,} rows -> {path} ({os.path.getsize(path) / 1e6:.1f} MB, {elapsed:.1f}s)")
+    return rows
+
+
+async def export_data(args):
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("Parquet export needs pyarrow: pip install pyarrow")
+            return
+
+    def connect():
+        if args.database_url:
+            return asyncpg.connect(args.database_url)
+        return asyncpg.connect(**DB_CONFIG)
+
+    print("Connecting to database...")
     try:
-        conn = await asyncpg.connect(**DB_CONFIG)
+        conn = await connect()
     except Exception as e:
         print(f"Error connecting to database: {e}")
         print("Please ensure your database is running and accessible.")
         return
-
+    try:
+        # Inclusive upper bound (<= $2) shared by all datasets; transactions still
+        # open now commit within the lag and land in the next incremental export
+        until = await conn.fetchval("SELECT (NOW() - make_interval(secs => $1))::timestamp", args.lag_seconds)
+    finally:
+        await conn.close()
     print("Connection successful.")
 
-    # 1. Export Products with Categories and Collections
-    print("Fetching products...")
-    # Note: Medusa products can have multiple categories, we'll take the first one for simplicity in this evaluation
-    products_query = """
-        SELECT 
-            p.id,
-            p.handle,
-            p.title,
-            p.status,
-            pc.name as category,
-            pcol.title as collection
-        FROM product p
-        LEFT JOIN product_category_product pcp ON p.id = pcp.product_id
-        LEFT JOIN product_category pc ON pcp.product_category_id = pc.id
-        LEFT JOIN product_collection pcol ON p.collection_id = pcol.id
-        WHERE p.status = 'published' AND p.deleted_at IS NULL
-    """
-    
-    products_rows = await conn.fetch(products_query)
-    products_data = [dict(row) for row in products_rows]
-    products_df = pd.DataFrame(products_data)
-    
-    # Deduplicate by handle (in case of multiple categories, just take one)
-    products_df = products_df.drop_duplicates(subset=['handle'])
-    
-    print(f"Found {len(products_df)} products.")
-    products_df.to_csv('products.csv', index=False)
-    print("Saved to products.csv")
-
-    # 2. Export Interactions
-    print("Fetching interactions...")
-    try:
-        interactions_query = """
-            SELECT 
-                user_id,
-                session_id,
-                product_handle,
-                interaction_type,
-                timestamp
-            FROM recommendation.rec_user_interactions
-            ORDER BY timestamp DESC
-        """
-        interactions_rows = await conn.fetch(interactions_query)
-        interactions_data = [dict(row) for row in interactions_rows]
-        interactions_df = pd.DataFrame(interactions_data)
-        
-        print(f"Found {len(interactions_df)} interactions.")
-        interactions_df.to_csv('interactions.csv', index=False)
-        print("Saved to interactions.csv")
-        
-    except asyncpg.UndefinedTableError:
-        print("Warning: Table 'recommendation.rec_user_interactions' not found.")
-        print("Creating empty interactions.csv")
-        pd.DataFrame(columns=['user_id', 'session_id', 'product_handle', 'interaction_type', 'timestamp']).to_csv('interactions.csv', index=False)
-
-    await conn.close()
-    print("Done.")
+    os.makedirs(args.out, exist_ok=True)
+    # Loaded for every run: only the datasets exported now get a new watermark
+    state = load_state(args.out)
+    fixed_since = datetime.fromisoformat(args.since) if args.since else None
+    windows = {name: fixed_since or (state.get(name, datetime.min) if args.incremental else datetime.min)
+               for name in args.datasets}
+    for name, since in windows.items():
+        print(f"Exporting {name} ({'full' if since == datetime.min else f'since {since}'}) ...")
+
+    results = await asyncio.gather(*(
+        export_dataset(connect, name, args, since, until) for name, since in windows.items()
+    ), return_exceptions=True)
+
+    for name, result in zip(windows, results):
+        # BaseException: a cancelled export (CancelledError) must not advance the watermark either
+        if isinstance(result, BaseException):
+            print(f"Error: {name} export failed: {result!r}")
+        else:
+            state[name] = until
+    save_state(args.out, state)
+    print(f"Done. Watermark: {until}")
+
 
 if __name__ == "__main__":
-    # Install dependencies if needed: pip install asyncpg pandas
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(export_data())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="defaults to DB_CONFIG")
+    parser.add_argument("--schema", default=os.getenv("DB_SCHEMA", "recommendation"),
+                        help="schema of the recommendation tables")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--out", default=".", help="output directory")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"export rows since the watermark in {STATE_FILE}")
+    parser.add_argument("--since", help="ISO timestamp; overrides the stored watermark")
+    parser.add_argument("--lag-seconds", type=float, default=10.0)
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="rows per Parquet row group")
+    asyncio.run(export_data(parser.parse_args()))